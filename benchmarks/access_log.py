@@ -0,0 +1,144 @@
+"""
+Throughput of small HTTP/1.1 responses with the access log disabled, enabled in each
+format and sampled.
+
+The server runs in a separate process for each configuration and writes the access log
+to a temporary file, and the clients send their requests sequentially on keep-alive
+connections. The lines written are counted to check the sample rate.
+
+    python benchmarks/access_log.py --requests 20000 --sample-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import time
+
+from aiobufpro.accesslog import AccessLogFormat
+from aiobufpro.server import Server
+
+
+class App:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+REQUEST = (
+    b"GET /access?page=1 HTTP/1.1\r\nHost: localhost\r\n"
+    b"User-Agent: access-log-benchmark\r\nReferer: http://localhost/\r\n\r\n"
+)
+
+
+def run_server(port, access_log, log_format, sample_rate, path):
+    server = Server(
+        access_log=access_log,
+        access_log_format=log_format,
+        access_log_sample_rate=sample_rate,
+        access_log_file=path,
+    )
+    try:
+        server.run(App, host="127.0.0.1", port=port, debug=False)
+    except KeyboardInterrupt:
+        pass
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+async def run_client(port, requests):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for _ in range(requests):
+        writer.write(REQUEST)
+        head = await reader.readuntil(b"\r\n\r\n")
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                await reader.readexactly(int(line.split(b":")[1]))
+    writer.close()
+
+
+async def measure(port, requests, connections):
+    per_connection = requests // connections
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[run_client(port, per_connection) for _ in range(connections)]
+    )
+    elapsed = time.perf_counter() - start
+    return round(per_connection * connections / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    parser.add_argument("--port", type=int, default=8769)
+    args = parser.parse_args()
+
+    configurations = {
+        "off": (False, AccessLogFormat.COMBINED, 1.0),
+        "combined": (True, AccessLogFormat.COMBINED, 1.0),
+        "json": (True, AccessLogFormat.JSON, 1.0),
+        f"combined sampled {args.sample_rate}": (
+            True,
+            AccessLogFormat.COMBINED,
+            args.sample_rate,
+        ),
+    }
+
+    context = multiprocessing.get_context("fork")
+    results = {}
+    with tempfile.TemporaryDirectory() as log_dir:
+        for name, (access_log, log_format, sample_rate) in configurations.items():
+            path = os.path.join(log_dir, f"{len(results)}.log")
+            process = context.Process(
+                target=run_server,
+                args=(args.port, access_log, log_format, sample_rate, path),
+            )
+            process.start()
+            try:
+                wait_for_port(args.port)
+                requests_per_second = asyncio.run(
+                    measure(args.port, args.requests, args.connections)
+                )
+            finally:
+                # The server writes the queued lines when it is interrupted.
+                os.kill(process.pid, signal.SIGINT)
+                process.join()
+
+            lines = 0
+            if os.path.exists(path):
+                with open(path) as log_file:
+                    lines = sum(1 for _ in log_file)
+            results[name] = {
+                "requests_per_second": requests_per_second,
+                "lines": lines,
+            }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Fan-out latency of the broadcast hub across worker processes connected by the Unix
+socket bus.
+
+Each worker holds an equal share of the subscribed sockets as in-memory protocols, so
+the benchmark measures framing, bus forwarding and the per-member writes without the
+kernel socket cost. Worker 0 publishes a timestamped message and every worker records
+the time its last local member was written to.
+
+    python benchmarks/bus_fanout.py --workers 8 --sockets 100000
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import shutil
+import statistics
+import tempfile
+import time
+
+from aiobufpro.broadcast import BroadcastHub
+from aiobufpro.bus import UnixBus
+from aiobufpro.outbound import OutboundQueue
+
+
+class NullTransport:
+    __slots__ = ("writes",)
+
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+
+
+class MemberProtocol:
+    __slots__ = ("transport", "groups", "outbound", "write_paused", "client")
+
+    def __init__(self):
+        self.transport = NullTransport()
+        self.groups = set()
+        self.outbound = OutboundQueue(self)
+        self.write_paused = False
+        self.client = None
+
+
+class TimedHub(BroadcastHub):
+    """Records the time each delivery to the local members completed."""
+
+    def __init__(self):
+        super().__init__()
+        self.deliveries = []
+
+    def deliver(self, members, frame):
+        delivered = super().deliver(members, frame)
+        self.deliveries.append((frame, time.perf_counter()))
+        return delivered
+
+
+async def run_worker(worker_id, args, bus_dir, ready, start, results):
+    hub = TimedHub()
+    bus = UnixBus(hub, worker_id, args.workers, bus_dir)
+    for _ in range(args.sockets // args.workers):
+        hub.join("bench", MemberProtocol())
+    await bus.start()
+
+    # Wait until every peer has announced its subscription before publishing.
+    peers = {peer for peer in range(args.workers) if peer != worker_id}
+    while bus.remote_groups.get("bench", set()) != peers:
+        await asyncio.sleep(0.01)
+    ready.wait()
+
+    if worker_id == 0:
+        start.set()
+        for _ in range(args.messages):
+            hub.publish("bench", b"%.9f" % time.perf_counter())
+            await asyncio.sleep(args.interval)
+    else:
+        start.wait()
+
+    while len(hub.deliveries) < args.messages:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+    bus.close()
+
+    results.put(
+        [(timestamp - float(frame[2:])) * 1e6 for frame, timestamp in hub.deliveries]
+    )
+
+
+def worker_main(worker_id, args, bus_dir, ready, start, results):
+    asyncio.run(run_worker(worker_id, args, bus_dir, ready, start, results))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--sockets", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    bus_dir = tempfile.mkdtemp(prefix="aiobufpro-bench-")
+    context = multiprocessing.get_context("fork")
+    ready = context.Barrier(args.workers)
+    start = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=worker_main, args=(worker_id, args, bus_dir, ready, start, results)
+        )
+        for worker_id in range(args.workers)
+    ]
+
+    try:
+        for process in processes:
+            process.start()
+        latencies = []
+        for _ in processes:
+            latencies.extend(results.get())
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(bus_dir, ignore_errors=True)
+
+    # Each sample is the time from publish until one worker finished writing the frame
+    # to all of its local members.
+    latencies.sort()
+    print(
+        json.dumps(
+            {
+                "workers": args.workers,
+                "sockets": args.sockets,
+                "messages": args.messages,
+                "p50_us": round(statistics.median(latencies), 1),
+                "p99_us": round(latencies[int(len(latencies) * 0.99) - 1], 1),
+                "max_us": round(latencies[-1], 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Throughput of small HTTP responses multiplexed over HTTP/2 connections compared with
+HTTP/1.1 keep-alive connections.
+
+The server runs in a separate process. Each HTTP/1.1 client sends its requests
+sequentially on its connection, while each HTTP/2 client keeps up to `--streams`
+requests in flight on a single connection.
+
+    python benchmarks/h2_throughput.py --requests 20000 --connections 4 --streams 32
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import time
+
+from aiobufpro.parsers.hpack import HPACKEncoder
+from aiobufpro.parsers.http2 import (
+    FRAME_HEADER,
+    H2_PREFACE,
+    FrameFlag,
+    FrameType,
+    build_frame,
+)
+from aiobufpro.server import Server
+
+
+class App:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+REQUEST = b"GET /throughput HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def run_server(port):
+    Server().run(App, host="127.0.0.1", port=port, debug=False)
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+async def run_http1_client(port, requests):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for _ in range(requests):
+        writer.write(REQUEST)
+        head = await reader.readuntil(b"\r\n\r\n")
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                await reader.readexactly(int(line.split(b":")[1]))
+    writer.close()
+
+
+async def run_http2_client(port, requests, streams):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    header_block = HPACKEncoder().encode(
+        [
+            (b":method", b"GET"),
+            (b":scheme", b"http"),
+            (b":path", b"/throughput"),
+            (b":authority", b"localhost"),
+        ]
+    )
+    flags = FrameFlag.END_HEADERS | FrameFlag.END_STREAM
+    writer.write(H2_PREFACE + build_frame(FrameType.SETTINGS, 0, 0))
+
+    next_stream_id = 1
+    sent = completed = 0
+
+    def send_requests(count):
+        nonlocal next_stream_id, sent
+        frames = []
+        for _ in range(count):
+            frames.append(
+                build_frame(FrameType.HEADERS, flags, next_stream_id, header_block)
+            )
+            next_stream_id += 2
+        sent += count
+        writer.write(b"".join(frames))
+
+    send_requests(min(streams, requests))
+    while completed < requests:
+        header = await reader.readexactly(9)
+        length_high, length_low, frame_type, frame_flags, stream_id = (
+            FRAME_HEADER.unpack(header)
+        )
+        payload = await reader.readexactly((length_high << 16) | length_low)
+        if frame_type == FrameType.SETTINGS and not frame_flags & FrameFlag.ACK:
+            writer.write(build_frame(FrameType.SETTINGS, FrameFlag.ACK, 0))
+        elif frame_type == FrameType.DATA and frame_flags & FrameFlag.END_STREAM:
+            completed += 1
+            if sent < requests:
+                send_requests(1)
+        elif frame_type == FrameType.GOAWAY:
+            raise RuntimeError(f"GOAWAY received: {payload!r}")
+    writer.close()
+
+
+async def measure(port, requests, connections, streams):
+    per_connection = requests // connections
+    results = {}
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[run_http1_client(port, per_connection) for _ in range(connections)]
+    )
+    elapsed = time.perf_counter() - start
+    results["http/1.1"] = round(per_connection * connections / elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[run_http2_client(port, per_connection, streams) for _ in range(connections)]
+    )
+    elapsed = time.perf_counter() - start
+    results["http/2"] = round(per_connection * connections / elapsed)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--streams", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("fork")
+    process = context.Process(target=run_server, args=(args.port,))
+    process.start()
+    try:
+        wait_for_port(args.port)
+        results = asyncio.run(
+            measure(args.port, args.requests, args.connections, args.streams)
+        )
+    finally:
+        process.terminate()
+        process.join()
+
+    print(json.dumps({"requests_per_second": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
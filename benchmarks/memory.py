@@ -0,0 +1,108 @@
+"""
+Per-connection and per-request memory of the protocol, measured with tracemalloc.
+
+* Per connection - the memory retained by an idle protocol after `connection_made`.
+
+* Per request - the peak memory allocated while handling one keep-alive request, and
+  the memory still retained once the request has completed.
+
+    python benchmarks/memory.py --connections 10000 --requests 2000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import tracemalloc
+
+from aiobufpro.protocol import HTTPWSProtocol
+
+
+class MockTransport:
+    def get_extra_info(self, name):
+        return ("127.0.0.1", 8000)
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class App:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+REQUEST = b"GET /memory?q=1 HTTP/1.1\r\nHost: localhost\r\nAccept: */*\r\n\r\n"
+
+
+def feed(protocol, data):
+    buf = protocol.get_buffer(len(data))
+    buf[: len(data)] = data
+    protocol.buffer_updated(len(data))
+
+
+async def measure_connections(count):
+    gc.collect()
+    start = tracemalloc.get_traced_memory()[0]
+    protocols = []
+    for _ in range(count):
+        protocol = HTTPWSProtocol(App)
+        protocol.connection_made(MockTransport())
+        protocols.append(protocol)
+    gc.collect()
+    return (tracemalloc.get_traced_memory()[0] - start) / count
+
+
+async def measure_requests(count):
+    protocol = HTTPWSProtocol(App)
+    protocol.connection_made(MockTransport())
+
+    # Warm up so the reused parser and connection objects exist before measuring.
+    for _ in range(10):
+        feed(protocol, REQUEST)
+        await asyncio.sleep(0)
+
+    gc.collect()
+    start = tracemalloc.get_traced_memory()[0]
+    peaks = 0
+    for _ in range(count):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        feed(protocol, REQUEST)
+        await asyncio.sleep(0)
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - start
+    return peaks / count, retained / count
+
+
+async def run(args):
+    per_connection = await measure_connections(args.connections)
+    peak_per_request, retained_per_request = await measure_requests(args.requests)
+    return {
+        "bytes_per_connection": round(per_connection),
+        "peak_bytes_per_request": round(peak_per_request),
+        "retained_bytes_per_request": round(retained_per_request, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    results = asyncio.run(run(args))
+    tracemalloc.stop()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
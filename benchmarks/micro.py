@@ -0,0 +1,385 @@
+"""
+Microbenchmarks of the parsers, serializers and the protocol, run in-process against a
+fake transport without any sockets.
+
+Each case is timed in batches long enough to be measured reliably and reports the
+operations per second of the fastest batch. Allocations are measured separately with
+tracemalloc, as the peak bytes allocated by one operation and the memory blocks it
+leaves allocated.
+
+The results can be saved as a baseline, and a later run compared with it fails when a
+case is slower or allocates more than the tolerance allows.
+
+    python benchmarks/micro.py
+    python benchmarks/micro.py --save baseline.json
+    python benchmarks/micro.py --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import os
+import platform
+import struct
+import sys
+import time
+import tracemalloc
+
+from aiobufpro.parsers.http import HTTPParser
+from aiobufpro.parsers.websocket import WebSocketOpcode, WebSocketParser, xor
+from aiobufpro.protocol import HTTPWSProtocol, HTTPWSProtocolState
+from aiobufpro.utils import get_server_headers, get_websocket_accept_key
+
+
+SMALL_GET = b"GET /items?page=2 HTTP/1.1\r\nHost: localhost:8000\r\nAccept: */*\r\n\r\n"
+
+COOKIE_GET = b"".join(
+    [
+        b"GET /account HTTP/1.1\r\nHost: localhost:8000\r\n",
+        b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:120.0) Gecko/20100101\r\n",
+        b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n",
+        b"Accept-Language: en-US,en;q=0.5\r\n",
+        b"Accept-Encoding: gzip, deflate, br\r\n",
+        b"Cookie: ",
+        b"; ".join(b"cookie_%d=%s" % (i, b"v" * 48) for i in range(20)),
+        b"\r\n",
+        b"Referer: https://localhost:8000/\r\nConnection: keep-alive\r\n\r\n",
+    ]
+)
+
+UPGRADE_REQUEST = (
+    b"GET /ws HTTP/1.1\r\nHost: localhost:8000\r\nConnection: Upgrade\r\n"
+    b"Upgrade: websocket\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    b"Sec-WebSocket-Version: 13\r\n\r\n"
+)
+
+MASKING_KEY = b"\x37\xfa\x21\x3d"
+
+
+def build_client_frame(payload: bytes, opcode: WebSocketOpcode) -> bytes:
+    """A masked frame, as sent by a client."""
+    length = len(payload)
+    if length <= 125:
+        head = struct.pack("!BB", 0x80 | opcode.value, 0x80 | length)
+    elif length <= 0xFFFF:
+        head = struct.pack("!BBH", 0x80 | opcode.value, 0x80 | 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode.value, 0x80 | 127, length)
+    masked = bytes(byte ^ MASKING_KEY[i % 4] for i, byte in enumerate(payload))
+    return b"".join([head, MASKING_KEY, masked])
+
+
+SMALL_FRAME = build_client_frame(b"x" * 32, WebSocketOpcode.TEXT)
+
+LARGE_FRAME = build_client_frame(os.urandom(65535), WebSocketOpcode.BINARY)
+
+
+class MockTransport:
+    def get_extra_info(self, name):
+        if name in ("peername", "sockname"):
+            return ("127.0.0.1", 8000)
+        return None
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+    def is_closing(self):
+        return False
+
+
+class App:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        if self.scope["type"] == "websocket":
+            await receive()
+            await send({"type": "websocket.accept"})
+            while (await receive())["type"] == "websocket.receive":
+                pass
+            return
+        await receive()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+class Messages:
+    """Records the messages put by the WebSocket parser."""
+
+    def __init__(self):
+        self.count = 0
+
+    def put_message(self, message):
+        self.count += 1
+
+
+class ParserProtocol:
+    def __init__(self):
+        self.asgi_connection = Messages()
+
+
+def feed(protocol, data):
+    buf = protocol.get_buffer(len(data))
+    buf[: len(data)] = data
+    protocol.buffer_updated(len(data))
+
+
+def run_coroutine(coro):
+    """Run a coroutine that does not suspend, without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as exc:
+        return exc.value
+    raise RuntimeError("The coroutine suspended")
+
+
+def parse_headers_case(request, chunk_size=None):
+    chunks = [request]
+    if chunk_size is not None:
+        chunks = [request[i : i + chunk_size] for i in range(len(request))]
+    parser = HTTPParser()
+
+    def op():
+        parser.reset()
+        for chunk in chunks:
+            parser.parse_headers(chunk)
+
+    return op
+
+
+def parse_frame_case(frame):
+    parser = WebSocketParser(ParserProtocol())
+
+    def op():
+        # The parser consumes the frame from the buffer it is given.
+        run_coroutine(parser.parse_frame(bytearray(frame)))
+
+    return op
+
+
+def frame_content_case(size):
+    parser = WebSocketParser(ParserProtocol())
+    payload = b"x" * size
+
+    def op():
+        run_coroutine(parser.get_frame_content(payload, opcode=WebSocketOpcode.BINARY))
+
+    return op
+
+
+def protocol_http_case(request, chunk_size=None):
+    chunks = [request]
+    if chunk_size is not None:
+        chunks = [request[i : i + chunk_size] for i in range(len(request))]
+    protocol = HTTPWSProtocol(App)
+    protocol.connection_made(MockTransport())
+
+    async def op():
+        for chunk in chunks:
+            feed(protocol, chunk)
+        while protocol.state is not HTTPWSProtocolState.REQUEST:
+            await asyncio.sleep(0)
+
+    return op
+
+
+def protocol_websocket_case(frame):
+    protocol = HTTPWSProtocol(App)
+    protocol.connection_made(MockTransport())
+    feed(protocol, UPGRADE_REQUEST)
+
+    async def op():
+        # The first operation waits for the application to accept the connection.
+        while not protocol.accepted:
+            await asyncio.sleep(0)
+        feed(protocol, frame)
+        # The frame is parsed and received by the application in later iterations.
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    return op
+
+
+CASES = {
+    "http_parse_small_get": lambda: parse_headers_case(SMALL_GET),
+    "http_parse_cookie_headers": lambda: parse_headers_case(COOKIE_GET),
+    "http_parse_byte_by_byte": lambda: parse_headers_case(SMALL_GET, chunk_size=1),
+    "server_headers": lambda: (lambda: get_server_headers(200)),
+    "websocket_accept_key": lambda: (
+        lambda: get_websocket_accept_key(b"dGhlIHNhbXBsZSBub25jZQ==")
+    ),
+    "websocket_xor": lambda: (lambda: xor(0xA5, 0x3C)),
+    "websocket_parse_small_frame": lambda: parse_frame_case(SMALL_FRAME),
+    "websocket_parse_large_frame": lambda: parse_frame_case(LARGE_FRAME),
+    "websocket_frame_content_small": lambda: frame_content_case(32),
+    "websocket_frame_content_large": lambda: frame_content_case(65535),
+    "protocol_small_get": lambda: protocol_http_case(SMALL_GET),
+    "protocol_cookie_get": lambda: protocol_http_case(COOKIE_GET),
+    "protocol_byte_by_byte": lambda: protocol_http_case(SMALL_GET, chunk_size=1),
+    "protocol_websocket_small_frame": lambda: protocol_websocket_case(SMALL_FRAME),
+}
+
+
+async def run_batch(op, number):
+    if inspect.iscoroutinefunction(op):
+        start = time.perf_counter()
+        for _ in range(number):
+            await op()
+        return time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(number):
+        op()
+    return time.perf_counter() - start
+
+
+async def measure_speed(op, min_time, repeat):
+    # Scale the batch size until a batch takes long enough to time.
+    number = 1
+    while True:
+        elapsed = await run_batch(op, number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        best = min(best, await run_batch(op, number))
+    return number / best, number
+
+
+async def measure_allocations(op, count):
+    is_coroutine = inspect.iscoroutinefunction(op)
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        blocks = sys.getallocatedblocks()
+        peaks = 0
+        for _ in range(count):
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            if is_coroutine:
+                await op()
+            else:
+                op()
+            peaks += tracemalloc.get_traced_memory()[1] - current
+        retained_blocks = sys.getallocatedblocks() - blocks
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    return peaks / count, retained_blocks / count
+
+
+async def run_case(name, args):
+    op = CASES[name]()
+    # Warm up the caches and reused objects of the case.
+    await run_batch(op, 10)
+    ops_per_second, number = await measure_speed(op, args.min_time, args.repeat)
+    # Tracing is slow, so slow cases trace no more operations than a timed batch.
+    peak_bytes, retained_blocks = await measure_allocations(
+        op, min(args.allocation_ops, number)
+    )
+    return {
+        "ops_per_second": round(ops_per_second, 1),
+        "peak_bytes_per_op": round(peak_bytes),
+        "retained_blocks_per_op": round(retained_blocks, 2),
+    }
+
+
+async def run(args):
+    results = {}
+    for name in CASES:
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = await run_case(name, args)
+        print(f"{name}: {results[name]}", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """The regressions of the results compared with the baseline."""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline["cases"].get(name)
+        if expected is None:
+            continue
+        minimum = expected["ops_per_second"] * (1 - tolerance)
+        if result["ops_per_second"] < minimum:
+            regressions.append(
+                f"{name}: {result['ops_per_second']} ops/s, "
+                f"baseline {expected['ops_per_second']} ops/s"
+            )
+        # Small allocations vary with the state of the allocator.
+        maximum = expected["peak_bytes_per_op"] * (1 + tolerance) + 256
+        if result["peak_bytes_per_op"] > maximum:
+            regressions.append(
+                f"{name}: {result['peak_bytes_per_op']} peak bytes per op, "
+                f"baseline {expected['peak_bytes_per_op']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default=None, help="Only run matching cases")
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="Minimum seconds of each batch"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Batches of each case")
+    parser.add_argument(
+        "--allocation-ops",
+        type=int,
+        default=100,
+        help="Operations traced to measure allocations",
+    )
+    parser.add_argument("--save", default=None, help="Write the results as a baseline")
+    parser.add_argument(
+        "--compare", default=None, help="Fail on regressions from a saved baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Fraction a case may be slower or allocate more than the baseline",
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "cases": results,
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.save is not None:
+        with open(args.save, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["python"] != report["python"]:
+            print(
+                f"The baseline was run with Python {baseline['python']}",
+                file=sys.stderr,
+            )
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions from the baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
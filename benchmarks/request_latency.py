@@ -0,0 +1,107 @@
+"""
+Latency of small HTTP responses on a keep-alive connection for each task mode.
+
+The server runs in a separate process and a single client sends sequential requests, so
+each sample includes the scheduling hops between receiving a request and the
+application starting.
+
+    python benchmarks/request_latency.py --requests 20000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import statistics
+import time
+
+from aiobufpro.protocol import TaskMode
+from aiobufpro.server import Server
+
+
+class App:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+REQUEST = b"GET /latency HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def run_server(port, task_mode):
+    Server(task_mode=task_mode).run(App, host="127.0.0.1", port=port, debug=False)
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            await reader.readexactly(int(line.split(b":")[1]))
+            return
+
+
+async def measure(port, requests, warmup):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    samples = []
+    for i in range(warmup + requests):
+        start = time.perf_counter()
+        writer.write(REQUEST)
+        await read_response(reader)
+        if i >= warmup:
+            samples.append((time.perf_counter() - start) * 1e6)
+    writer.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("fork")
+    results = {}
+    for task_mode in TaskMode:
+        process = context.Process(target=run_server, args=(args.port, task_mode))
+        process.start()
+        try:
+            wait_for_port(args.port)
+            samples = asyncio.run(measure(args.port, args.requests, args.warmup))
+        finally:
+            process.terminate()
+            process.join()
+
+        samples.sort()
+        results[task_mode.value] = {
+            "p50_us": round(statistics.median(samples), 1),
+            "p99_us": round(samples[int(len(samples) * 0.99) - 1], 1),
+            "mean_us": round(statistics.mean(samples), 1),
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
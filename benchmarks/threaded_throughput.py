@@ -0,0 +1,112 @@
+"""
+Throughput of small HTTP/1.1 responses served by a single event loop compared with
+several event loops running in threads of one process.
+
+The server runs in a separate process for each `--threads` value, and the clients send
+their requests sequentially on keep-alive connections. With `--blocking-ms` the
+application blocks its event loop for that long on each request, such as a call to a
+blocking client library that releases the GIL, which is where additional loops help the
+most on a Python build with the GIL.
+
+    python benchmarks/threaded_throughput.py --threads 1 4 --blocking-ms 1
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import time
+
+from aiobufpro.server import Server
+
+
+class App:
+    blocking: float = 0.0
+
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        if self.blocking:
+            time.sleep(self.blocking)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+REQUEST = b"GET /threaded HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def run_server(port, threads, blocking_ms):
+    App.blocking = blocking_ms / 1000
+    Server(threads=threads).run(App, host="127.0.0.1", port=port, debug=False)
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+async def run_client(port, requests):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for _ in range(requests):
+        writer.write(REQUEST)
+        head = await reader.readuntil(b"\r\n\r\n")
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                await reader.readexactly(int(line.split(b":")[1]))
+    writer.close()
+
+
+async def measure(port, requests, connections):
+    per_connection = requests // connections
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[run_client(port, per_connection) for _ in range(connections)]
+    )
+    elapsed = time.perf_counter() - start
+    return round(per_connection * connections / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--blocking-ms", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("fork")
+    results = {}
+    for threads in args.threads:
+        process = context.Process(
+            target=run_server, args=(args.port, threads, args.blocking_ms)
+        )
+        process.start()
+        try:
+            wait_for_port(args.port)
+            results[f"threads={threads}"] = asyncio.run(
+                measure(args.port, args.requests, args.connections)
+            )
+        finally:
+            process.terminate()
+            process.join()
+
+    print(json.dumps({"requests_per_second": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Rate of full and resumed TLS handshakes with a local self-signed certificate.
+
+The certificate is generated with the `openssl` command. Each sample opens a new
+connection, completes the handshake and one HTTP/1.1 request, then closes the
+connection. Resumed connections offer the session of the previous connection, and the
+benchmark reports how many of them the server resumed.
+
+    python benchmarks/tls_handshake.py --connections 2000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import ssl
+import subprocess
+import tempfile
+import time
+
+from aiobufpro.server import Server
+
+
+class App:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+REQUEST = b"GET /tls HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def create_certificate(directory):
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl",
+            "req",
+            "-x509",
+            "-newkey",
+            "ec",
+            "-pkeyopt",
+            "ec_paramgen_curve:prime256v1",
+            "-nodes",
+            "-keyout",
+            keyfile,
+            "-out",
+            certfile,
+            "-days",
+            "1",
+            "-subj",
+            "/CN=localhost",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def run_server(port, certfile, keyfile, session_tickets):
+    server = Server(
+        ssl_certfile=certfile,
+        ssl_keyfile=keyfile,
+        ssl_session_tickets=session_tickets,
+    )
+    server.run(App, host="127.0.0.1", port=port, debug=False)
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def measure(port, context, connections, resume):
+    session = None
+    resumed = 0
+    start = time.perf_counter()
+    for _ in range(connections):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        tls_sock = context.wrap_socket(
+            sock, server_hostname="localhost", session=session if resume else None
+        )
+        tls_sock.sendall(REQUEST)
+        response = b""
+        while not response.endswith(b"\r\n\r\nok"):
+            response += tls_sock.recv(4096)
+        resumed += tls_sock.session_reused
+        # TLS 1.3 session tickets are received after the handshake.
+        session = tls_sock.session
+        tls_sock.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "handshakes_per_second": round(connections / elapsed),
+        "resumed": resumed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument(
+        "--tls-version", default="1.3", choices=["1.2", "1.3"], help="Client version"
+    )
+    args = parser.parse_args()
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    version = (
+        ssl.TLSVersion.TLSv1_3 if args.tls_version == "1.3" else ssl.TLSVersion.TLSv1_2
+    )
+    context.minimum_version = context.maximum_version = version
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = create_certificate(directory)
+        process_context = multiprocessing.get_context("fork")
+        for session_tickets in (2, 0):
+            process = process_context.Process(
+                target=run_server, args=(args.port, certfile, keyfile, session_tickets)
+            )
+            process.start()
+            try:
+                wait_for_port(args.port)
+                name = f"session_tickets={session_tickets}"
+                results[name] = {
+                    "full": measure(args.port, context, args.connections, False),
+                    "resumed": measure(args.port, context, args.connections, True),
+                }
+            finally:
+                process.terminate()
+                process.join()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
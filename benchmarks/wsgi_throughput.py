@@ -0,0 +1,182 @@
+"""
+Throughput of small HTTP/1.1 responses from a WSGI application served by the WSGI
+adapter, compared with standalone threaded WSGI servers.
+
+The server runs in a separate process for each configuration, with the same number of
+application threads, and the clients send their requests sequentially on keep-alive
+connections, reconnecting when a server closes the connection after each response as
+`wsgiref` does. With `--blocking-ms` the application blocks its thread for that long
+on each request, such as a call to a blocking database client. `waitress` is included
+when it is installed.
+
+    python benchmarks/wsgi_throughput.py --threads 8 --blocking-ms 1
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import socketserver
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from aiobufpro.server import Server
+from aiobufpro.wsgi import AppInterface
+
+BLOCKING = 0.0
+
+
+def app(environ, start_response):
+    # Standalone servers may block on an unbounded read until the client disconnects.
+    environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+    if BLOCKING:
+        time.sleep(BLOCKING)
+    start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+    return [b"ok"]
+
+
+REQUEST = b"GET /wsgi HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def run_aiobufpro(port, threads):
+    server = Server(
+        interface=AppInterface.WSGI, wsgi_threads=threads, wsgi_queue_depth=1024
+    )
+    server.run(app, host="127.0.0.1", port=port, debug=False)
+
+
+def run_wsgiref(port, threads):
+    server = make_server(
+        "127.0.0.1",
+        port,
+        app,
+        server_class=ThreadingWSGIServer,
+        handler_class=QuietHandler,
+    )
+    server.serve_forever()
+
+
+def run_waitress(port, threads):
+    import waitress
+
+    waitress.serve(app, host="127.0.0.1", port=port, threads=threads, _quiet=True)
+
+
+SERVERS = {
+    "aiobufpro": run_aiobufpro,
+    "wsgiref": run_wsgiref,
+    "waitress": run_waitress,
+}
+
+
+def run_server(name, port, threads, blocking_ms):
+    global BLOCKING
+    BLOCKING = blocking_ms / 1000
+    SERVERS[name](port, threads)
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+async def run_client(port, requests):
+    writer = None
+    reconnects = 0
+    for _ in range(requests):
+        if writer is None:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(REQUEST)
+        head = await reader.readuntil(b"\r\n\r\n")
+        keep_alive = head.startswith(b"HTTP/1.1")
+        for line in head.lower().split(b"\r\n"):
+            if line.startswith(b"content-length:"):
+                await reader.readexactly(int(line.split(b":")[1]))
+            elif line == b"connection: close":
+                keep_alive = False
+        if not keep_alive:
+            writer.close()
+            writer = None
+            reconnects += 1
+    if writer is not None:
+        writer.close()
+    return reconnects
+
+
+async def measure(port, requests, connections):
+    per_connection = requests // connections
+    start = time.perf_counter()
+    reconnects = await asyncio.gather(
+        *[run_client(port, per_connection) for _ in range(connections)]
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "requests_per_second": round(per_connection * connections / elapsed),
+        "connections": connections + sum(reconnects),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--blocking-ms", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=8770)
+    args = parser.parse_args()
+
+    names = ["aiobufpro", "wsgiref"]
+    try:
+        import waitress  # noqa: F401
+
+        names.append("waitress")
+    except ImportError:
+        pass
+
+    context = multiprocessing.get_context("fork")
+    results = {}
+    for name in names:
+        process = context.Process(
+            target=run_server,
+            args=(name, args.port, args.threads, args.blocking_ms),
+        )
+        process.start()
+        try:
+            wait_for_port(args.port)
+            results[name] = asyncio.run(
+                measure(args.port, args.requests, args.connections)
+            )
+        finally:
+            process.terminate()
+            process.join()
+
+    print(
+        json.dumps(
+            {
+                "threads": args.threads,
+                "blocking_ms": args.blocking_ms,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
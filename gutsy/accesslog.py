@@ -0,0 +1,191 @@
+import enum
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from typing import List, Tuple
+
+from starlette.types import Scope
+
+
+class AccessLogFormat(enum.Enum):
+    """
+    The format of the access log lines.
+
+    * `COMBINED` - The Apache combined log format.
+
+    * `JSON` - A JSON object per line, including the duration of the request.
+    """
+
+    COMBINED = "combined"
+    JSON = "json"
+
+
+def get_header(headers: List[Tuple[bytes, bytes]], name: bytes) -> str:
+    for header_name, header_value in headers:
+        if header_name == name:
+            return header_value.decode("latin-1")
+    return None
+
+
+class AccessLogFormatter(logging.Formatter):
+    """
+    Formats the access log records in the listener thread. The arguments of a record
+    are the values it was built with on the event loop, the line is only formatted here.
+    """
+
+    def __init__(self, log_format: AccessLogFormat) -> None:
+        super().__init__()
+        self.log_format: AccessLogFormat = log_format
+
+    def format(self, record: logging.LogRecord) -> str:
+        (
+            client,
+            method,
+            path,
+            query_string,
+            http_version,
+            headers,
+            status,
+            size,
+            duration,
+        ) = record.args
+        target = path
+        if query_string:
+            target = f"{path}?{query_string}"
+        referer = get_header(headers, b"referer")
+        user_agent = get_header(headers, b"user-agent")
+
+        if self.log_format is AccessLogFormat.JSON:
+            return json.dumps(
+                {
+                    "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+                    "client": f"{client[0]}:{client[1]}" if client else None,
+                    "method": method,
+                    "target": target,
+                    "http_version": http_version,
+                    "status": status,
+                    "size": size,
+                    "duration_ms": round(duration / 1000000, 3),
+                    "referer": referer,
+                    "user_agent": user_agent,
+                }
+            )
+
+        return (
+            f"{client[0] if client else '-'} - - "
+            f"[{self.formatTime(record, '%d/%b/%Y:%H:%M:%S %z')}] "
+            f'"{method} {target} HTTP/{http_version}" {status or "-"} {size} '
+            f'"{referer or "-"}" "{user_agent or "-"}"'
+        )
+
+
+class AccessQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues the access log records without formatting them, which the default handler
+    does before queueing a record.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class AccessLog:
+    """
+    A log of the HTTP requests, written by a background thread. Each request is logged
+    once its application has completed, as a record of the request values that is
+    queued for the listener thread to format and write, so neither the formatting nor
+    the I/O of the log runs on the event loop.
+
+    Responses answered without the application, by the response cache or a fast-path
+    route, are not logged.
+
+    * `log_format` -
+        (*AccessLogFormat*): The format of the log lines.
+
+    * `sample_rate` -
+        (*float*): The fraction of the requests that are logged.
+
+    * `path` -
+        (*str*): The file the log is appended to, standard output by default.
+
+    * `logger` -
+        (*logging.Logger*): The `aiobufpro.access` logger the records are handled by,
+        which does not propagate to the root logger.
+
+    * `logged` -
+        (*int*): The requests logged.
+    """
+
+    def __init__(
+        self,
+        log_format: AccessLogFormat = AccessLogFormat.COMBINED,
+        sample_rate: float = 1.0,
+        path: str = None,
+    ) -> None:
+        self.log_format: AccessLogFormat = log_format
+        self.sample_rate: float = sample_rate
+        self.path: str = path
+        self.logged: int = 0
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.logger: logging.Logger = logging.getLogger("aiobufpro.access")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.queue_handler: AccessQueueHandler = AccessQueueHandler(self.queue)
+        self.handler: logging.Handler = None
+        self.listener: logging.handlers.QueueListener = None
+
+    def start(self) -> None:
+        """
+        Start the listener thread. Worker processes start their own listener once they
+        have been forked.
+        """
+        if self.path is not None:
+            self.handler = logging.FileHandler(self.path)
+        else:
+            self.handler = logging.StreamHandler(sys.stdout)
+        self.handler.setFormatter(AccessLogFormatter(self.log_format))
+        self.listener = logging.handlers.QueueListener(self.queue, self.handler)
+        self.logger.addHandler(self.queue_handler)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Write the queued records and stop the listener thread."""
+        if self.listener is None:
+            return
+        self.logger.removeHandler(self.queue_handler)
+        self.listener.stop()
+        self.handler.close()
+        self.listener = None
+
+    def log(self, scope: Scope, status: int, size: int, duration: int) -> None:
+        """
+        Log a completed request, with the response status, the size of the body sent by
+        the application and the time taken by the application in nanoseconds.
+        """
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self.logged += 1
+        # The record is built directly, which skips looking up the caller's frame.
+        record = logging.LogRecord(
+            "aiobufpro.access",
+            logging.INFO,
+            "",
+            0,
+            "access",
+            (
+                scope["client"],
+                scope["method"],
+                scope["path"],
+                scope["query_string"],
+                scope["http_version"],
+                scope["headers"],
+                status,
+                size,
+                duration,
+            ),
+            None,
+        )
+        self.logger.handle(record)
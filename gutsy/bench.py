@@ -0,0 +1,506 @@
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import random
+import socket
+import struct
+import sys
+import time
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs
+
+from starlette.types import ASGIApp
+
+from aiobufpro.parsers.websocket import WebSocketOpcode
+from aiobufpro.protocol import TaskMode
+from aiobufpro.server import Server, import_app
+
+# The methods whose requests are sent with a body.
+BODY_METHODS = frozenset(("POST", "PUT", "PATCH"))
+
+WEBSOCKET_HANDSHAKE = (
+    b"GET /ws HTTP/1.1\r\nHost: localhost\r\nConnection: Upgrade\r\n"
+    b"Upgrade: websocket\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+    b"Sec-WebSocket-Version: 13\r\n\r\n"
+)
+
+
+class BenchApp:
+    """
+    The application run by default. HTTP requests are answered once their body has been
+    received, with a body of the size given by the `size` query parameter, and
+    WebSocket messages are echoed.
+    """
+
+    def __init__(self, scope) -> None:
+        self.scope = scope
+
+    async def __call__(self, receive, send) -> None:
+        if self.scope["type"] == "websocket":
+            await receive()
+            await send({"type": "websocket.accept"})
+            while True:
+                message = await receive()
+                if message["type"] != "websocket.receive":
+                    return
+                reply = {"type": "websocket.send"}
+                if message.get("bytes") is not None:
+                    reply["bytes"] = message["bytes"]
+                else:
+                    reply["text"] = message["text"]
+                await send(reply)
+
+        more_body = True
+        while more_body:
+            message = await receive()
+            more_body = message.get("more_body", False)
+        size = int(parse_qs(self.scope["query_string"]).get("size", ["13"])[0])
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b"x" * size})
+
+
+class BenchRequest:
+    """
+    A request of the request mix, serialized once.
+
+    * `method` -
+        (*str*): The request method.
+
+    * `weight` -
+        (*float*): The relative frequency of the request in the mix.
+
+    * `data` -
+        (*bytes*): The serialized request.
+    """
+
+    __slots__ = ("method", "weight", "data")
+
+    def __init__(
+        self, method: str, path: str, weight: float, body_size: int, keep_alive: bool
+    ) -> None:
+        self.method: str = method
+        self.weight: float = weight
+        lines = [f"{method} {path} HTTP/1.1", "Host: localhost"]
+        if not keep_alive:
+            lines.append("Connection: close")
+        body = b""
+        if method in BODY_METHODS:
+            body = b"x" * body_size
+            lines.append(f"Content-Length: {body_size}")
+        self.data: bytes = "\r\n".join(lines + ["", ""]).encode() + body
+
+
+def parse_request_mix(
+    values: List[str], body_size: int, keep_alive: bool
+) -> List[BenchRequest]:
+    """Parse the `METHOD PATH [WEIGHT]` values of the request mix."""
+    requests = []
+    for value in values:
+        parts = value.split()
+        if len(parts) not in (2, 3):
+            raise ValueError(
+                f"Invalid request {value!r}, expected METHOD PATH [WEIGHT]"
+            )
+        weight = float(parts[2]) if len(parts) == 3 else 1.0
+        requests.append(
+            BenchRequest(parts[0].upper(), parts[1], weight, body_size, keep_alive)
+        )
+    return requests
+
+
+def get_percentile(latencies: List[float], percentile: float) -> float:
+    """The latency at the percentile of the sorted latencies, in milliseconds."""
+    index = min(int(len(latencies) * percentile), len(latencies) - 1)
+    return round(latencies[index] * 1000, 3)
+
+
+class LatencyRecorder:
+    """
+    Records the latencies of the operations that both started and completed within
+    the measured period, after the warm-up.
+
+    * `latencies` -
+        (*List[float]*): The latencies in seconds.
+
+    * `errors` -
+        (*int*): The operations that failed or timed out.
+
+    * `statuses` -
+        (*Dict[int, int]*): The number of responses of each status.
+    """
+
+    def __init__(self, start: float, end: float) -> None:
+        self.start: float = start
+        self.end: float = end
+        self.latencies: List[float] = []
+        self.errors: int = 0
+        self.statuses: Dict[int, int] = collections.Counter()
+
+    def record(self, started: float, completed: float, status: int = None) -> None:
+        if started >= self.start and completed <= self.end:
+            self.latencies.append(completed - started)
+            if status is not None:
+                self.statuses[status] += 1
+
+    def get_report(self, unit: str) -> dict:
+        duration = self.end - self.start
+        latencies = sorted(self.latencies)
+        report = {
+            unit: len(latencies),
+            f"{unit}_per_second": round(len(latencies) / duration, 1),
+            "errors": self.errors,
+        }
+        if self.statuses:
+            report["statuses"] = {
+                str(status): count for status, count in sorted(self.statuses.items())
+            }
+        if latencies:
+            report["latency_ms"] = {
+                "p50": get_percentile(latencies, 0.5),
+                "p99": get_percentile(latencies, 0.99),
+                "p999": get_percentile(latencies, 0.999),
+                "max": round(latencies[-1] * 1000, 3),
+            }
+        return report
+
+
+async def read_response(reader: asyncio.StreamReader, method: str) -> int:
+    """Read a complete response, returning its status."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    status = int(lines[0].split(b" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower()] = value.strip()
+
+    if method == "HEAD" or status in (204, 304) or status < 200:
+        return status
+    if b"content-length" in headers:
+        await reader.readexactly(int(headers[b"content-length"]))
+    elif headers.get(b"transfer-encoding", b"").lower().endswith(b"chunked"):
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            # Each chunk is followed by a CRLF, as is the last chunk without trailers.
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+    return status
+
+
+def build_client_frame(payload: bytes, opcode: WebSocketOpcode) -> bytes:
+    """A masked frame, as clients are required to send."""
+    header = 0x80 | opcode.value
+    length = len(payload)
+    if length <= 125:
+        head = struct.pack("!BB", header, 0x80 | length)
+    elif length <= 0xFFFF:
+        head = struct.pack("!BBH", header, 0x80 | 126, length)
+    else:
+        head = struct.pack("!BBQ", header, 0x80 | 127, length)
+    mask = os.urandom(4)
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return b"".join([head, mask, masked])
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read an unmasked server frame, returning its opcode and payload."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    return first & 0x0F, await reader.readexactly(length)
+
+
+class LoadGenerator:
+    """
+    Drives a server with HTTP and WebSocket clients on a single event loop.
+
+    Each HTTP connection sends a batch of `pipeline` requests chosen from the request
+    mix, then reads their responses, and the latency of each request is measured from
+    when the batch was sent. Each WebSocket connection sends a message and waits for
+    its echo, at most `ws_rate` times per second.
+    """
+
+    def __init__(self, options: argparse.Namespace) -> None:
+        self.options = options
+        self.requests: List[BenchRequest] = parse_request_mix(
+            options.request or ["GET /"], options.body_size, options.keep_alive
+        )
+        self.weights: List[float] = [request.weight for request in self.requests]
+        self.random = random.Random(options.seed)
+        self.deadline: float = None
+        self.http: LatencyRecorder = None
+        self.websocket: LatencyRecorder = None
+
+    async def run(self) -> dict:
+        options = self.options
+        start = time.perf_counter() + options.warmup
+        self.deadline = start + options.duration
+        self.http = LatencyRecorder(start, self.deadline)
+        self.websocket = LatencyRecorder(start, self.deadline)
+        clients = [self.run_http_client() for _ in range(options.connections)]
+        clients.extend(
+            self.run_websocket_client() for _ in range(options.ws_connections)
+        )
+        await asyncio.gather(*clients)
+
+        report = {}
+        if options.connections:
+            report["http"] = self.http.get_report("requests")
+        if options.ws_connections:
+            report["websocket"] = self.websocket.get_report("messages")
+        return report
+
+    async def send_batch(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        batch: List[BenchRequest],
+    ) -> None:
+        started = time.perf_counter()
+        writer.write(b"".join([request.data for request in batch]))
+        for request in batch:
+            status = await read_response(reader, request.method)
+            self.http.record(started, time.perf_counter(), status)
+
+    async def run_http_client(self) -> None:
+        options = self.options
+        # Requests are not pipelined on connections closed after each response.
+        depth = options.pipeline if options.keep_alive else 1
+        writer: asyncio.StreamWriter = None
+        while time.perf_counter() < self.deadline:
+            batch = self.random.choices(self.requests, self.weights, k=depth)
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(
+                        options.host, options.port
+                    )
+                await asyncio.wait_for(
+                    self.send_batch(reader, writer, batch), options.timeout
+                )
+            except (
+                OSError,
+                ValueError,
+                asyncio.IncompleteReadError,
+                asyncio.TimeoutError,
+            ):
+                self.http.errors += 1
+            else:
+                if options.keep_alive:
+                    continue
+            if writer is not None:
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    async def exchange_message(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, frame: bytes
+    ) -> None:
+        started = time.perf_counter()
+        writer.write(frame)
+        while True:
+            opcode, _ = await read_frame(reader)
+            if opcode == WebSocketOpcode.CLOSE.value:
+                raise ConnectionError("The server closed the WebSocket connection")
+            if opcode in (WebSocketOpcode.TEXT.value, WebSocketOpcode.BINARY.value):
+                break
+        self.websocket.record(started, time.perf_counter())
+
+    async def run_websocket_client(self) -> None:
+        options = self.options
+        frame = build_client_frame(
+            os.urandom(options.ws_message_size), WebSocketOpcode.BINARY
+        )
+        interval = 1 / options.ws_rate if options.ws_rate else 0.0
+        writer: asyncio.StreamWriter = None
+        while time.perf_counter() < self.deadline:
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(
+                        options.host, options.port
+                    )
+                    writer.write(WEBSOCKET_HANDSHAKE)
+                    head = await reader.readuntil(b"\r\n\r\n")
+                    if not head.startswith(b"HTTP/1.1 101 "):
+                        raise ConnectionError("The WebSocket handshake was rejected")
+                    next_send = time.perf_counter()
+                await asyncio.wait_for(
+                    self.exchange_message(reader, writer, frame), options.timeout
+                )
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                self.websocket.errors += 1
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                continue
+
+            if interval:
+                next_send += interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    # Messages are not sent in a burst to catch up.
+                    next_send = time.perf_counter()
+
+        if writer is not None:
+            writer.write(build_client_frame(b"\x03\xe8", WebSocketOpcode.CLOSE))
+            writer.close()
+
+
+def run_server(app: ASGIApp, options: argparse.Namespace) -> None:
+    server = Server(
+        workers=options.workers,
+        threads=options.threads,
+        task_mode=TaskMode(options.task_mode),
+    )
+    server.run(app, host=options.host, port=options.port, debug=False)
+
+
+def wait_for_port(host: str, port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Server did not start on port {port}")
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="aiobufpro bench",
+        description="Run the server with an application and drive it with HTTP and "
+        "WebSocket clients, reporting the throughput and latency as JSON.",
+    )
+    parser.add_argument(
+        "app", nargs="?", default=None, help="ASGI application, a built-in by default"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host")
+    parser.add_argument("--port", default=8765, type=int, help="Port")
+    parser.add_argument(
+        "--no-server",
+        action="store_true",
+        help="Drive a server that is already running on the host and port",
+    )
+    parser.add_argument("--workers", default=1, type=int, help="Server processes")
+    parser.add_argument("--threads", default=1, type=int, help="Server event loops")
+    parser.add_argument(
+        "--task-mode",
+        default="task",
+        choices=[mode.value for mode in TaskMode],
+        help="How the server runs the application for each request",
+    )
+    parser.add_argument("--duration", default=10.0, type=float, help="Seconds measured")
+    parser.add_argument(
+        "--warmup",
+        default=1.0,
+        type=float,
+        help="Seconds of load before the measurement starts",
+    )
+    parser.add_argument("--connections", default=10, type=int, help="HTTP connections")
+    parser.add_argument(
+        "--no-keep-alive",
+        dest="keep_alive",
+        action="store_false",
+        help="Open a new HTTP connection for each request",
+    )
+    parser.add_argument(
+        "--pipeline",
+        default=1,
+        type=int,
+        help="HTTP requests sent on a connection before reading their responses",
+    )
+    parser.add_argument(
+        "--request",
+        action="append",
+        help="A request of the mix as 'METHOD PATH [WEIGHT]', may be repeated, "
+        "'GET /' by default",
+    )
+    parser.add_argument(
+        "--body-size",
+        default=1024,
+        type=int,
+        help="Body size of POST, PUT and PATCH requests",
+    )
+    parser.add_argument(
+        "--ws-connections", default=0, type=int, help="WebSocket connections"
+    )
+    parser.add_argument(
+        "--ws-message-size", default=32, type=int, help="WebSocket message size"
+    )
+    parser.add_argument(
+        "--ws-rate",
+        default=0.0,
+        type=float,
+        help="Messages per second of each WebSocket connection, unlimited by default",
+    )
+    parser.add_argument(
+        "--timeout",
+        default=10.0,
+        type=float,
+        help="Seconds to wait for a response before counting an error",
+    )
+    parser.add_argument("--seed", default=0, type=int, help="Seed of the request mix")
+    parser.add_argument("--output", default=None, help="Also write the report here")
+    options = parser.parse_args(args)
+
+    if options.app is not None:
+        app = import_app(options.app)
+    else:
+        app = BenchApp
+
+    process = None
+    if not options.no_server:
+        process = multiprocessing.get_context("fork").Process(
+            target=run_server, args=(app, options), daemon=True
+        )
+        process.start()
+    try:
+        wait_for_port(options.host, options.port)
+        results = asyncio.run(LoadGenerator(options).run())
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    report = {
+        "config": {
+            "app": options.app or "builtin",
+            "workers": options.workers,
+            "threads": options.threads,
+            "task_mode": options.task_mode,
+            "duration": options.duration,
+            "connections": options.connections,
+            "keep_alive": options.keep_alive,
+            "pipeline": options.pipeline,
+            "requests": options.request or ["GET /"],
+            "body_size": options.body_size,
+            "ws_connections": options.ws_connections,
+            "ws_message_size": options.ws_message_size,
+            "ws_rate": options.ws_rate,
+            "python": sys.version.split()[0],
+        },
+        **results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if options.output is not None:
+        with open(options.output, "w") as output_file:
+            output_file.write(output)
@@ -0,0 +1,289 @@
+import asyncio
+import tempfile
+import threading
+from typing import BinaryIO, Dict, List
+
+from starlette.types import Message
+
+# Queued for the application once a spooled body is complete, the body is then read from
+# the spool as the application receives it.
+SPOOLED_BODY = {"type": "http.request"}
+
+# The longest chunk size line, including any chunk extensions, and the largest total size
+# of the trailer fields of a chunked body. Both are buffered until they are complete.
+MAX_CHUNK_SIZE_LINE = 4096
+MAX_TRAILERS_SIZE = 65536
+
+
+class RequestBodyError(Exception):
+    """Raised when the framing of a request body is invalid."""
+
+
+class RequestBodyDecoder:
+    """
+    Decode the request body from the data received after the request headers, using
+    either the content-length or the chunked transfer coding of the request.
+
+    * `remaining` -
+        (*int*): The number of body bytes still expected by a content-length body.
+
+    * `chunked` -
+        (*bool*): Set if the body uses the chunked transfer coding.
+
+    * `chunk_remaining` -
+        (*int*): The number of bytes of the current chunk still expected, `None` while
+        the chunk size line is being read.
+
+    * `complete` -
+        (*bool*): Set once the entire body has been received.
+
+    * `excess` -
+        (*bytes*): The data received after the end of the body, the start of the next
+        pipelined request.
+    """
+
+    __slots__ = (
+        "remaining",
+        "chunked",
+        "chunk_remaining",
+        "trailers",
+        "trailers_size",
+        "buffer",
+        "complete",
+        "excess",
+    )
+
+    def __init__(self, content_length: int = 0, chunked: bool = False) -> None:
+        self.remaining: int = content_length
+        self.chunked: bool = chunked
+        self.chunk_remaining: int = None
+        self.trailers: bool = False
+        self.trailers_size: int = 0
+        self.buffer: bytearray = bytearray()
+        self.complete: bool = not chunked and content_length == 0
+        self.excess: bytes = b""
+
+    def feed(self, data: bytes) -> bytes:
+        """Return the body bytes contained in the received data."""
+        if not self.chunked:
+            body = data[: self.remaining]
+            self.remaining -= len(body)
+            self.complete = self.remaining == 0
+            if self.complete and len(data) > len(body):
+                self.excess = bytes(data[len(body) :])
+            return body
+
+        buffer = self.buffer
+        buffer += data
+        body: List[bytes] = []
+
+        while not self.complete:
+            if self.trailers:
+                # Any trailer fields are discarded, an empty line ends the body.
+                end = buffer.find(b"\r\n")
+                size = len(buffer) if end == -1 else end + 2
+                if self.trailers_size + size > MAX_TRAILERS_SIZE:
+                    raise RequestBodyError("Trailer fields too large")
+                if end == -1:
+                    break
+                self.trailers_size += size
+                self.complete = end == 0
+                del buffer[:size]
+
+            elif self.chunk_remaining is None:
+                end = buffer.find(b"\r\n")
+                if (len(buffer) if end == -1 else end) > MAX_CHUNK_SIZE_LINE:
+                    raise RequestBodyError("Chunk size line too long")
+                if end == -1:
+                    break
+                try:
+                    size = int(buffer[:end].split(b";", 1)[0].strip(), 16)
+                except ValueError:
+                    raise RequestBodyError("Invalid chunk size")
+                del buffer[: end + 2]
+                if size == 0:
+                    self.trailers = True
+                else:
+                    self.chunk_remaining = size
+
+            elif self.chunk_remaining:
+                chunk = bytes(buffer[: self.chunk_remaining])
+                del buffer[: len(chunk)]
+                self.chunk_remaining -= len(chunk)
+                body.append(chunk)
+                if self.chunk_remaining:
+                    break
+
+            else:
+                # The chunk data is followed by a line break.
+                if len(buffer) < 2:
+                    break
+                if buffer[:2] != b"\r\n":
+                    raise RequestBodyError("Invalid chunk terminator")
+                del buffer[:2]
+                self.chunk_remaining = None
+
+        if self.complete and buffer:
+            self.excess = bytes(buffer)
+            buffer.clear()
+        return b"".join(body)
+
+
+class RequestBodySpooler:
+    """
+    Buffers complete request bodies before they are received by the application, rather
+    than queueing each part of the body as it is received.
+
+    Bodies are held in memory until they exceed `threshold` bytes and are then written
+    to a temporary file. Bodies are also moved to disk when the memory of all the bodies
+    being received by the worker would exceed `memory_budget` bytes.
+
+    * `threshold` -
+        (*int*): The maximum size of a body held in memory.
+
+    * `memory_budget` -
+        (*int*): The maximum total size of the bodies held in memory.
+
+    * `chunk_size` -
+        (*int*): The size of the `http.request` body parts read from a spooled body.
+
+    * `memory_used` -
+        (*int*): The total size of the bodies currently held in memory.
+
+    * `spooled`, `rolled_over` -
+        (*int*): The number of spooled bodies, and the number written to disk.
+    """
+
+    def __init__(
+        self,
+        threshold: int = 1048576,
+        memory_budget: int = 67108864,
+        chunk_size: int = 1048576,
+    ) -> None:
+        self.threshold: int = threshold
+        self.memory_budget: int = memory_budget
+        self.chunk_size: int = chunk_size
+        # The memory budget may be shared by event loops running in different threads.
+        self.lock: threading.Lock = threading.Lock()
+        self.memory_used: int = 0
+        self.spooled: int = 0
+        self.rolled_over: int = 0
+
+    def create_spool(self) -> "RequestBodySpool":
+        with self.lock:
+            self.spooled += 1
+        return RequestBodySpool(self)
+
+    def reserve(self, size: int) -> bool:
+        """Count the size against the memory budget, if it fits within the budget."""
+        with self.lock:
+            if self.memory_used + size > self.memory_budget:
+                return False
+            self.memory_used += size
+            return True
+
+    def release(self, size: int, rolled_over: bool = False) -> None:
+        with self.lock:
+            self.memory_used -= size
+            self.rolled_over += rolled_over
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_used": self.memory_used,
+            "spooled": self.spooled,
+            "rolled_over": self.rolled_over,
+        }
+
+
+class RequestBodySpool:
+    """
+    The buffered body of a single request.
+
+    * `file` -
+        (*SpooledTemporaryFile*): The body data, in memory or on disk.
+
+    * `size` -
+        (*int*): The size of the body received so far.
+
+    * `in_memory` -
+        (*int*): The number of bytes counted against the memory budget, 0 once the body
+        has been written to disk.
+
+    * `complete` -
+        (*asyncio.Event*): Set once the entire body has been received.
+
+    * `reading` -
+        (*bool*): Set while the application is receiving the body from the spool.
+    """
+
+    __slots__ = (
+        "spooler",
+        "file",
+        "size",
+        "in_memory",
+        "rolled",
+        "complete",
+        "reading",
+        "taken",
+    )
+
+    def __init__(self, spooler: RequestBodySpooler) -> None:
+        self.spooler: RequestBodySpooler = spooler
+        self.file: BinaryIO = tempfile.SpooledTemporaryFile(max_size=spooler.threshold)
+        self.size: int = 0
+        self.in_memory: int = 0
+        self.rolled: bool = False
+        self.complete: asyncio.Event = asyncio.Event()
+        self.reading: bool = False
+        self.taken: bool = False
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        spooler = self.spooler
+
+        if not self.rolled:
+            if self.size > spooler.threshold:
+                # The file has been moved to disk by the write.
+                self.release()
+            elif not spooler.reserve(len(data)):
+                self.file.rollover()
+                self.release()
+            else:
+                self.in_memory += len(data)
+
+        self.file.write(data)
+
+    def release(self) -> None:
+        rolled_over = not self.rolled
+        self.rolled = True
+        self.spooler.release(self.in_memory, rolled_over)
+        self.in_memory = 0
+
+    def finish(self) -> None:
+        """Called once the entire body has been received."""
+        self.file.seek(0)
+        self.complete.set()
+
+    def read_message(self) -> Message:
+        """Read the next `http.request` message of a complete body."""
+        if self.taken:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        body = self.file.read(self.spooler.chunk_size)
+        more_body = self.file.tell() < self.size
+        self.reading = more_body
+        return {"type": "http.request", "body": body, "more_body": more_body}
+
+    async def get_file(self) -> BinaryIO:
+        """
+        Wait for the entire body and return the file, the body is then not received as
+        `http.request` messages. The file is closed once the application completes.
+        """
+        await self.complete.wait()
+        self.taken = True
+        return self.file
+
+    def close(self) -> None:
+        """Called once the application has completed, removing the temporary file."""
+        self.spooler.release(self.in_memory)
+        self.in_memory = 0
+        self.file.close()
@@ -0,0 +1,156 @@
+import enum
+import logging
+from typing import Dict, Optional, Set, Union
+
+from aiobufpro.parsers.websocket import (
+    ABNORMAL_CLOSURE_CODE,
+    WebSocketOpcode,
+    build_frame,
+)
+
+logger = logging.getLogger()
+
+
+class BroadcastPolicy(enum.Enum):
+    """
+    Determines how a published frame is handled for a group member whose transport
+    has paused writing.
+
+    * `SKIP` - The frame is not delivered to the paused member.
+
+    * `QUEUE` - The frame is added to the member's outbound queue and written once the
+        transport resumes writing, subject to the queue's limit and policy.
+
+    * `DROP` - The paused member is disconnected and removed from every group.
+    """
+
+    SKIP = "skip"
+    QUEUE = "queue"
+    DROP = "drop"
+
+
+class BroadcastHub:
+    """
+    In-process registry of named WebSocket groups. A published message is framed once
+    and the resulting bytes object is written to the transport of every member of the
+    group, avoiding the per-recipient framing and copying of `ASGIWebSocketConnection`.
+
+    * `groups` -
+        (*Dict[str, Set[HTTPWSProtocol]]*): The member protocols of each group.
+
+    * `policy` -
+        (*BroadcastPolicy*): How frames are handled for members that paused writing.
+
+    * `bus` -
+        (*UnixBus*): Forwards published frames to the other worker processes, set
+        when the server runs more than one worker.
+
+    * `published` -
+        (*int*): The number of messages published to the hub.
+
+    * `delivered`, `skipped`, `queued`, `dropped` -
+        (*int*): The number of frames handled for members by each outcome.
+    """
+
+    def __init__(self, policy: BroadcastPolicy = BroadcastPolicy.SKIP) -> None:
+        self.groups: Dict[str, Set] = {}
+        self.policy: BroadcastPolicy = policy
+        self.bus = None
+        self.published: int = 0
+        self.delivered: int = 0
+        self.skipped: int = 0
+        self.queued: int = 0
+        self.dropped: int = 0
+
+    def join(self, group: str, protocol) -> None:
+        """Add the protocol to the group, creating the group if it does not exist."""
+        members = self.groups.get(group)
+        if members is None:
+            members = self.groups[group] = set()
+            if self.bus is not None:
+                self.bus.subscribe(group)
+        members.add(protocol)
+        protocol.groups.add(group)
+
+    def leave(self, group: str, protocol) -> None:
+        """Remove the protocol from the group, discarding the group once it is empty."""
+        members = self.groups.get(group)
+        if members is not None:
+            members.discard(protocol)
+            if not members:
+                del self.groups[group]
+                if self.bus is not None:
+                    self.bus.unsubscribe(group)
+        protocol.groups.discard(group)
+
+    def leave_all(self, protocol) -> None:
+        """Remove the protocol from every group it has joined."""
+        for group in list(protocol.groups):
+            self.leave(group, protocol)
+
+    def publish(
+        self,
+        group: str,
+        payload_data: Union[str, bytes],
+        opcode: Optional[WebSocketOpcode] = None,
+    ) -> int:
+        """
+        Frame the payload once and write it to every member of the group, forwarding
+        the frame to any other workers with members of the group. Returns the number
+        of local members the frame was written to.
+        """
+        if opcode is None:
+            opcode = (
+                WebSocketOpcode.TEXT
+                if isinstance(payload_data, str)
+                else WebSocketOpcode.BINARY
+            )
+        self.published += 1
+        members = self.groups.get(group)
+        bus = self.bus
+        remote = bus is not None and bus.has_subscribers(group)
+        if not members and not remote:
+            return 0
+
+        frame = build_frame(payload_data, opcode=opcode)
+        if remote:
+            bus.publish(group, frame)
+        if not members:
+            return 0
+        return self.deliver(members, frame)
+
+    def deliver(self, members: Set, frame: bytes) -> int:
+        """
+        Write the pre-built frame to each of the members, applying the policy to any
+        member that has paused writing.
+        """
+        policy = self.policy
+        delivered = 0
+
+        # Iterate a copy of the members, the `DROP` policy may modify the group.
+        for protocol in tuple(members):
+            outbound = protocol.outbound
+            if not protocol.write_paused and not outbound.frames:
+                protocol.transport.write(frame)
+                delivered += 1
+            elif not protocol.write_paused or policy is BroadcastPolicy.QUEUE:
+                # The member already has frames queued, or has paused writing with the
+                # `QUEUE` policy, so the frame is queued behind them to keep the
+                # member's frames in order.
+                if outbound.put_nowait(frame):
+                    self.queued += 1
+                else:
+                    self.skipped += 1
+            elif policy is BroadcastPolicy.SKIP:
+                self.skipped += 1
+            else:
+                logger.debug("Dropping slow broadcast member %s", protocol.client)
+                self.leave_all(protocol)
+                # The connection is closed without a close frame, the application is
+                # told as it would be for a lost connection.
+                protocol.asgi_connection.disconnect(ABNORMAL_CLOSURE_CODE)
+                protocol.close()
+                self.dropped += 1
+
+        self.delivered += delivered
+        return delivered
@@ -0,0 +1,380 @@
+import asyncio
+import enum
+import json
+import logging
+import os
+import struct
+import threading
+from typing import Dict, Set, Tuple
+
+logger = logging.getLogger()
+
+
+# Every bus message begins with the message kind, the group name length and the
+# payload length, followed by the group name and payload bytes.
+BUS_HEADER = struct.Struct("!BHI")
+
+
+class BusMessageKind(enum.Enum):
+    """The kinds of message exchanged between workers on the bus."""
+
+    HELLO = 1
+    SUBSCRIBE = 2
+    UNSUBSCRIBE = 3
+    PUBLISH = 4
+    METRICS = 5
+
+
+def pack_bus_message(kind: BusMessageKind, group: bytes, payload: bytes = b"") -> bytes:
+    """Serialize a single bus message."""
+    return b"".join(
+        [BUS_HEADER.pack(kind.value, len(group), len(payload)), group, payload]
+    )
+
+
+def get_bus_path(bus_dir: str, worker_id: int) -> str:
+    """The Unix socket path a worker listens on for messages from its peers."""
+    return os.path.join(bus_dir, f"worker-{worker_id}.sock")
+
+
+class BusPeerProtocol(asyncio.BufferedProtocol):
+    """
+    Receives the messages sent by a single peer worker. The peer identifies itself with
+    an initial `HELLO` message, then sends its group membership changes and the frames
+    published to groups this worker has subscribers for.
+    """
+
+    def __init__(self, bus: "UnixBus") -> None:
+        self.bus: "UnixBus" = bus
+        self.peer_id: int = None
+        self.buffer_data: bytearray = bytearray(65536)
+        self.buffer_view: memoryview = memoryview(self.buffer_data)
+        self.buffer_len: int = 0
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+
+    def connection_lost(self, exc: Exception) -> None:
+        if self.peer_id is not None:
+            self.bus.on_peer_lost(self.peer_id)
+        self.buffer_view.release()
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if len(self.buffer_data) - self.buffer_len < 4096:
+            # Grow the buffer to fit a large message, the view must be released
+            # before the underlying bytearray can be resized.
+            self.buffer_view.release()
+            self.buffer_data.extend(bytes(len(self.buffer_data)))
+            self.buffer_view = memoryview(self.buffer_data)
+        return self.buffer_view[self.buffer_len :]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.buffer_len += nbytes
+        data = self.buffer_data
+        offset = 0
+        header_size = BUS_HEADER.size
+
+        # Process every complete message currently in the buffer.
+        while self.buffer_len - offset >= header_size:
+            kind, group_len, payload_len = BUS_HEADER.unpack_from(data, offset)
+            end = offset + header_size + group_len + payload_len
+            if end > self.buffer_len:
+                break
+            group_start = offset + header_size
+            group = bytes(data[group_start : group_start + group_len]).decode()
+            payload = bytes(data[group_start + group_len : end])
+            self.on_message(BusMessageKind(kind), group, payload)
+            offset = end
+
+        if offset:
+            # Discard the processed messages, leaving any partial message at the start
+            # of the buffer.
+            remaining = self.buffer_len - offset
+            data[:remaining] = data[offset : self.buffer_len]
+            self.buffer_len = remaining
+
+    def on_message(self, kind: BusMessageKind, group: str, payload: bytes) -> None:
+        if kind is BusMessageKind.HELLO:
+            self.peer_id = int(payload)
+        elif kind is BusMessageKind.SUBSCRIBE:
+            self.bus.on_peer_subscribe(self.peer_id, group)
+        elif kind is BusMessageKind.UNSUBSCRIBE:
+            self.bus.on_peer_unsubscribe(self.peer_id, group)
+        elif kind is BusMessageKind.PUBLISH:
+            self.bus.on_peer_publish(group, payload)
+        elif kind is BusMessageKind.METRICS:
+            self.bus.on_peer_metrics(self.peer_id, payload)
+
+
+class UnixBus:
+    """
+    Local message bus between the worker processes of a server, without an external
+    broker. Each worker listens on its own Unix domain socket in `bus_dir` and connects
+    to the socket of every other worker.
+
+    A worker announces the groups it has local members for, so published frames are
+    only forwarded to workers that have subscribers for the group.
+
+    * `worker_id` -
+        (*int*): The index of this worker.
+
+    * `num_workers` -
+        (*int*): The total number of workers connected by the bus.
+
+    * `peers` -
+        (*Dict[int, asyncio.Transport]*): Outbound transports to the other workers.
+
+    * `remote_groups` -
+        (*Dict[str, Set[int]]*): The peer workers with subscribers for each group.
+
+    * `peer_metrics` -
+        (*Dict[int, Dict[Tuple[str, str], float]]*): The latest metric samples sent by
+        each peer worker, only received by worker 0.
+
+    * `forwarded`, `received` -
+        (*int*): The number of frames sent to and received from peer workers.
+    """
+
+    def __init__(self, hub, worker_id: int, num_workers: int, bus_dir: str) -> None:
+        self.hub = hub
+        self.worker_id: int = worker_id
+        self.num_workers: int = num_workers
+        self.bus_dir: str = bus_dir
+        self.peers: Dict[int, asyncio.Transport] = {}
+        self.remote_groups: Dict[str, Set[int]] = {}
+        self.peer_metrics: Dict[int, Dict[Tuple[str, str], float]] = {}
+        self.server: asyncio.AbstractServer = None
+        self.forwarded: int = 0
+        self.received: int = 0
+        self.closing: bool = False
+        hub.bus = self
+
+    async def start(self, connect_timeout: float = 10.0) -> None:
+        """
+        Listen for peer workers and connect to each of them. Peers that have not
+        started listening yet are retried until the timeout.
+        """
+        loop = asyncio.get_running_loop()
+        path = get_bus_path(self.bus_dir, self.worker_id)
+        self.server = await loop.create_unix_server(
+            lambda: BusPeerProtocol(self), path=path
+        )
+        await asyncio.gather(
+            *[
+                self.connect(peer_id, connect_timeout)
+                for peer_id in range(self.num_workers)
+                if peer_id != self.worker_id
+            ]
+        )
+
+    async def connect(self, peer_id: int, connect_timeout: float) -> None:
+        loop = asyncio.get_running_loop()
+        path = get_bus_path(self.bus_dir, peer_id)
+        deadline = loop.time() + connect_timeout
+        delay = 0.01
+
+        while True:
+            try:
+                transport, _ = await loop.create_unix_connection(
+                    asyncio.Protocol, path=path
+                )
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > deadline:
+                    raise
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+        # Identify this worker, then announce every group that already has local
+        # members so the peer starts forwarding frames for them.
+        messages = [
+            pack_bus_message(BusMessageKind.HELLO, b"", str(self.worker_id).encode())
+        ]
+        messages.extend(
+            pack_bus_message(BusMessageKind.SUBSCRIBE, group.encode())
+            for group in self.hub.groups
+        )
+        transport.writelines(messages)
+        self.peers[peer_id] = transport
+
+    def close(self) -> None:
+        self.closing = True
+        if self.server is not None:
+            self.server.close()
+        for transport in self.peers.values():
+            transport.close()
+        self.peers.clear()
+
+    def send_all(self, message: bytes) -> None:
+        for transport in self.peers.values():
+            transport.write(message)
+
+    def subscribe(self, group: str) -> None:
+        """Called by the hub when the first local member joins a group."""
+        self.send_all(pack_bus_message(BusMessageKind.SUBSCRIBE, group.encode()))
+
+    def unsubscribe(self, group: str) -> None:
+        """Called by the hub when the last local member leaves a group."""
+        self.send_all(pack_bus_message(BusMessageKind.UNSUBSCRIBE, group.encode()))
+
+    def has_subscribers(self, group: str) -> bool:
+        return group in self.remote_groups
+
+    def publish(self, group: str, frame: bytes) -> int:
+        """
+        Forward an already framed message to the workers with subscribers for the
+        group. Returns the number of workers the frame was forwarded to.
+        """
+        peer_ids = self.remote_groups.get(group)
+        if not peer_ids:
+            return 0
+
+        message = pack_bus_message(BusMessageKind.PUBLISH, group.encode(), frame)
+        forwarded = 0
+        for peer_id in peer_ids:
+            transport = self.peers.get(peer_id)
+            if transport is not None:
+                transport.write(message)
+                forwarded += 1
+
+        self.forwarded += forwarded
+        return forwarded
+
+    def send_metrics(self, samples: Dict[Tuple[str, str], float]) -> None:
+        """Send the metric samples of this worker to worker 0, which exports them."""
+        transport = self.peers.get(0)
+        if transport is not None:
+            payload = json.dumps(
+                [[name, labels, value] for (name, labels), value in samples.items()]
+            )
+            transport.write(
+                pack_bus_message(BusMessageKind.METRICS, b"", payload.encode())
+            )
+
+    def on_peer_subscribe(self, peer_id: int, group: str) -> None:
+        peer_ids = self.remote_groups.get(group)
+        if peer_ids is None:
+            peer_ids = self.remote_groups[group] = set()
+        peer_ids.add(peer_id)
+
+    def on_peer_unsubscribe(self, peer_id: int, group: str) -> None:
+        peer_ids = self.remote_groups.get(group)
+        if peer_ids is not None:
+            peer_ids.discard(peer_id)
+            if not peer_ids:
+                del self.remote_groups[group]
+
+    def on_peer_publish(self, group: str, frame: bytes) -> None:
+        self.received += 1
+        members = self.hub.groups.get(group)
+        if members:
+            self.hub.deliver(members, frame)
+
+    def on_peer_metrics(self, peer_id: int, payload: bytes) -> None:
+        self.peer_metrics[peer_id] = {
+            (name, labels): value for name, labels, value in json.loads(payload)
+        }
+
+    def on_peer_lost(self, peer_id: int) -> None:
+        if not self.closing:
+            logger.warning("Lost bus connection to worker %s", peer_id)
+        self.peer_metrics.pop(peer_id, None)
+        for group in list(self.remote_groups):
+            self.on_peer_unsubscribe(peer_id, group)
+
+
+class ThreadBusRegistry:
+    """
+    The groups subscribed by each event loop of a server running one event loop per
+    thread, shared by the `ThreadBus` of every loop.
+
+    * `groups` -
+        (*Dict[str, Set[ThreadBus]]*): The buses with local members of each group.
+    """
+
+    def __init__(self) -> None:
+        self.lock: threading.Lock = threading.Lock()
+        self.groups: Dict[str, Set["ThreadBus"]] = {}
+
+    def subscribe(self, group: str, bus: "ThreadBus") -> None:
+        with self.lock:
+            buses = self.groups.get(group)
+            if buses is None:
+                buses = self.groups[group] = set()
+            buses.add(bus)
+
+    def unsubscribe(self, group: str, bus: "ThreadBus") -> None:
+        with self.lock:
+            buses = self.groups.get(group)
+            if buses is not None:
+                buses.discard(bus)
+                if not buses:
+                    del self.groups[group]
+
+    def get_subscribers(self, group: str) -> Tuple["ThreadBus", ...]:
+        with self.lock:
+            return tuple(self.groups.get(group, ()))
+
+    def remove(self, bus: "ThreadBus") -> None:
+        with self.lock:
+            for group in list(self.groups):
+                buses = self.groups[group]
+                buses.discard(bus)
+                if not buses:
+                    del self.groups[group]
+
+
+class ThreadBus:
+    """
+    Message bus between the event loops of a server running one event loop per thread.
+    Each loop has its own broadcast hub, and published frames are delivered to the
+    members of the other loops by scheduling the delivery on their loop.
+
+    * `loop` -
+        (*asyncio.AbstractEventLoop*): The event loop of the hub.
+
+    * `forwarded`, `received` -
+        (*int*): The number of frames sent to and received from the other loops.
+    """
+
+    def __init__(self, hub, registry: ThreadBusRegistry) -> None:
+        self.hub = hub
+        self.registry: ThreadBusRegistry = registry
+        self.loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        self.forwarded: int = 0
+        self.received: int = 0
+        hub.bus = self
+
+    def close(self) -> None:
+        self.registry.remove(self)
+
+    def subscribe(self, group: str) -> None:
+        """Called by the hub when the first local member joins a group."""
+        self.registry.subscribe(group, self)
+
+    def unsubscribe(self, group: str) -> None:
+        """Called by the hub when the last local member leaves a group."""
+        self.registry.unsubscribe(group, self)
+
+    def has_subscribers(self, group: str) -> bool:
+        subscribers = self.registry.get_subscribers(group)
+        return len(subscribers) > (self in subscribers)
+
+    def publish(self, group: str, frame: bytes) -> int:
+        """
+        Deliver an already framed message on the other loops with subscribers for the
+        group. Returns the number of loops the frame was forwarded to.
+        """
+        forwarded = 0
+        for bus in self.registry.get_subscribers(group):
+            if bus is not self:
+                bus.loop.call_soon_threadsafe(bus.on_peer_publish, group, frame)
+                forwarded += 1
+        self.forwarded += forwarded
+        return forwarded
+
+    def on_peer_publish(self, group: str, frame: bytes) -> None:
+        self.received += 1
+        members = self.hub.groups.get(group)
+        if members:
+            self.hub.deliver(members, frame)
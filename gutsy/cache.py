@@ -0,0 +1,265 @@
+import asyncio
+import collections
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger()
+
+
+# Only responses with these status codes are stored by the response cache.
+CACHEABLE_STATUS_CODES = frozenset((200, 203, 204, 300, 301, 404, 410))
+
+
+def get_shared_max_age(cache_control: bytes) -> Optional[int]:
+    """
+    Return the `s-maxage` directive of a Cache-Control header value, or `None` if the
+    response must not be stored by a shared cache.
+    """
+    max_age = None
+    for directive in cache_control.split(b","):
+        name, _, value = directive.strip().partition(b"=")
+        name = name.lower()
+        if name in (b"no-store", b"private", b"no-cache"):
+            return None
+        if name == b"s-maxage":
+            try:
+                max_age = int(value.strip(b'"'))
+            except ValueError:
+                return None
+    return max_age
+
+
+def get_header_values(headers: List[Tuple[bytes, bytes]], names: Tuple[bytes]) -> Tuple:
+    """The values of the named request headers, `None` for any missing header."""
+    values = dict.fromkeys(names)
+    for name, value in headers:
+        if name in values:
+            values[name] = value
+    return tuple(values[name] for name in names)
+
+
+class CachedResponse:
+    """
+    A fully serialized response stored by the response cache.
+
+    * `content` -
+        (*bytes*): The response bytes as written to the transport.
+
+    * `vary` -
+        (*Tuple[bytes]*): The lowercased header names listed in the Vary header.
+
+    * `expires` -
+        (*float*): The event loop time the entry expires.
+    """
+
+    __slots__ = ("content", "vary", "expires")
+
+    def __init__(self, content: bytes, vary: Tuple[bytes], expires: float) -> None:
+        self.content: bytes = content
+        self.vary: Tuple[bytes] = vary
+        self.expires: float = expires
+
+
+class ResponseCache:
+    """
+    Opt-in micro-cache of serialized responses to GET requests. A cache hit is written
+    to the transport from `buffer_updated` without running the application.
+
+    Entries are keyed on the method, path, query string and the values of the request
+    headers listed in the response's Vary header. The TTL of an entry is the
+    `s-maxage` of the response Cache-Control header, and entries are evicted least
+    recently used once their total size exceeds the byte budget.
+
+    While a response for a key is being produced, other requests for the same key wait
+    for it rather than running the application again.
+
+    * `max_bytes` -
+        (*int*): The byte budget of the stored responses.
+
+    * `lock` -
+        (*threading.Lock*): Set when the cache is shared by event loops running in
+        different threads.
+
+    * `size` -
+        (*int*): The total size of the stored responses.
+
+    * `hits`, `misses`, `coalesced`, `stores`, `evictions` -
+        (*int*): The number of lookups, waiting requests and entry changes.
+    """
+
+    def __init__(self, max_bytes: int, lock: threading.Lock = None) -> None:
+        self.max_bytes: int = max_bytes
+        self.lock: threading.Lock = lock
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+        self.vary: Dict[Tuple, Tuple[bytes]] = {}
+        self.inflight: Dict[Tuple, List] = {}
+        self.size: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.coalesced: int = 0
+        self.stores: int = 0
+        self.evictions: int = 0
+
+    def get_key(self, parser, vary: Tuple[bytes] = None) -> Tuple:
+        """Build the cache key of the request currently held by the parser."""
+        resource = (parser.http_method, parser.path, parser.query_string)
+        if vary is None:
+            vary = self.vary.get(resource, ())
+        if not vary:
+            return resource
+        return resource + get_header_values(parser.headers, vary)
+
+    def lookup(self, protocol) -> Optional[Tuple]:
+        """
+        Called by the protocol when the headers of a GET request are complete. Returns
+        `None` if the request was answered by the cache or is waiting for another
+        request with the same key, otherwise the key to store the response under.
+        """
+        lock = self.lock
+        if lock is not None:
+            with lock:
+                entry, key = self.lookup_entry(protocol)
+        else:
+            entry, key = self.lookup_entry(protocol)
+        if entry is not None:
+            # The hit is answered once the lock is released, completing the response
+            # replays pipelined requests that look up the cache again.
+            protocol.transport.write(entry.content)
+            protocol.on_response_complete()
+        return key
+
+    def lookup_entry(
+        self, protocol
+    ) -> Tuple[Optional[CachedResponse], Optional[Tuple]]:
+        """
+        Returns the entry the request is answered with, or the key to store the response
+        under. Neither is returned if the request is waiting for another request.
+        """
+        key = self.get_key(protocol.parser)
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            if entry.expires > asyncio.get_event_loop().time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry, None
+            self.remove(key)
+
+        self.misses += 1
+        waiters = self.inflight.get(key)
+        if waiters is not None:
+            # A response for the key is already being produced by the application.
+            # The waiter is answered on its own event loop.
+            self.coalesced += 1
+            waiters.append((asyncio.get_running_loop(), protocol))
+            return None, None
+
+        self.inflight[key] = []
+        return None, key
+
+    def store(
+        self,
+        key: Tuple,
+        headers: List[Tuple[bytes, bytes]],
+        content: bytes,
+        max_age: int,
+        vary: Tuple[bytes],
+    ) -> Optional[Tuple]:
+        """
+        Store a complete response, evicting the least recently used entries. Returns the
+        key the response was stored under.
+        """
+        lock = self.lock
+        if lock is not None:
+            with lock:
+                return self.store_entry(key, headers, content, max_age, vary)
+        return self.store_entry(key, headers, content, max_age, vary)
+
+    def store_entry(
+        self,
+        key: Tuple,
+        headers: List[Tuple[bytes, bytes]],
+        content: bytes,
+        max_age: int,
+        vary: Tuple[bytes],
+    ) -> Optional[Tuple]:
+        if len(content) > self.max_bytes:
+            return None
+
+        # The key of a response with a Vary header includes the request header values.
+        resource = key[:3]
+        self.vary[resource] = vary
+        key = resource + get_header_values(headers, vary) if vary else resource
+
+        if key in self.entries:
+            self.remove(key)
+
+        loop = asyncio.get_event_loop()
+        self.entries[key] = CachedResponse(content, vary, loop.time() + max_age)
+        self.size += len(content)
+        self.stores += 1
+
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.content)
+            self.evictions += 1
+
+        return key
+
+    def remove(self, key: Tuple) -> None:
+        entry = self.entries.pop(key)
+        self.size -= len(entry.content)
+
+    def complete(self, key: Tuple, stored_key: Optional[Tuple]) -> None:
+        """
+        Called once the response for a key is complete, or the application failed to
+        produce one. Waiting requests are answered from the stored entry if it matches
+        their key, otherwise they run the application themselves.
+        """
+        lock = self.lock
+        if lock is not None:
+            with lock:
+                waiters = self.inflight.pop(key, None)
+                entry = self.entries.get(stored_key)
+        else:
+            waiters = self.inflight.pop(key, None)
+            entry = self.entries.get(stored_key)
+        if not waiters:
+            return
+
+        loop = asyncio.get_running_loop()
+        for waiter_loop, protocol in waiters:
+            if waiter_loop is loop:
+                self.answer(protocol, entry, stored_key)
+            else:
+                waiter_loop.call_soon_threadsafe(
+                    self.answer, protocol, entry, stored_key
+                )
+
+    def answer(
+        self,
+        protocol,
+        entry: Optional[CachedResponse],
+        stored_key: Optional[Tuple],
+    ) -> None:
+        if protocol.transport.is_closing():
+            return
+        if entry is not None and self.get_key(protocol.parser, entry.vary) == (
+            stored_key
+        ):
+            protocol.transport.write(entry.content)
+            protocol.on_response_complete()
+        else:
+            protocol.run_http_app()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,169 @@
+import enum
+import itertools
+import logging
+import random
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterator, NamedTuple
+
+logger = logging.getLogger()
+
+
+# The first bytes of a capture file, the last byte is the version of the format.
+CAPTURE_MAGIC = b"ABPCAP\x00\x01"
+
+# Each record is the kind of record, the connection id, the microseconds since the
+# capture started and the length of the data that follows.
+RECORD_HEADER = struct.Struct("!BIQI")
+
+
+class RecordKind(enum.IntEnum):
+    OPEN = 1
+    DATA = 2
+    CLOSE = 3
+
+
+class CaptureRecord(NamedTuple):
+    kind: RecordKind
+    connection_id: int
+    timestamp: float
+    data: bytes
+
+
+class CaptureFormatError(Exception):
+    pass
+
+
+class TrafficCapture:
+    """
+    Records the bytes received on a sample of the connections to a capture file, with
+    the boundaries of each read and the time it was received, so the exact segmentation
+    seen by `buffer_updated` can be replayed.
+
+    The connections to capture are sampled when they are opened, and every read of a
+    sampled connection is recorded. Recording stops once the file has reached its size
+    cap, the connections already recorded are left incomplete.
+
+    * `path` -
+        (*str*): The capture file, overwritten if it exists.
+
+    * `sample_rate` -
+        (*float*): The fraction of the connections that are captured.
+
+    * `max_bytes` -
+        (*int*): The size cap of the capture file.
+
+    * `lock` -
+        (*threading.Lock*): Set when the capture is shared by event loops running in
+        different threads.
+
+    * `size` -
+        (*int*): The bytes written to the capture file.
+
+    * `connections` -
+        (*int*): The connections captured.
+
+    * `full` -
+        (*bool*): Whether the size cap was reached.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: float = 1.0,
+        max_bytes: int = 104857600,
+        lock: threading.Lock = None,
+    ) -> None:
+        self.path: str = path
+        self.sample_rate: float = sample_rate
+        self.max_bytes: int = max_bytes
+        self.lock: threading.Lock = lock
+        self.file: BinaryIO = open(path, "wb")
+        self.file.write(CAPTURE_MAGIC)
+        self.size: int = len(CAPTURE_MAGIC)
+        self.connections: int = 0
+        self.full: bool = False
+        self.ids: Iterator[int] = itertools.count()
+        self.started: int = time.perf_counter_ns()
+
+    def open_connection(self) -> int:
+        """
+        Called when a connection is made. Returns the id the connection is recorded
+        under, or `None` if it is not captured.
+        """
+        if self.full:
+            return None
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        connection_id = next(self.ids)
+        self.write(RecordKind.OPEN, connection_id, b"")
+        return connection_id
+
+    def record(self, connection_id: int, data: bytes) -> None:
+        """Record the data of a single read from a captured connection."""
+        self.write(RecordKind.DATA, connection_id, data)
+
+    def close_connection(self, connection_id: int) -> None:
+        self.write(RecordKind.CLOSE, connection_id, b"")
+
+    def write(self, kind: RecordKind, connection_id: int, data: bytes) -> None:
+        lock = self.lock
+        if lock is not None:
+            with lock:
+                self.write_record(kind, connection_id, data)
+        else:
+            self.write_record(kind, connection_id, data)
+
+    def write_record(self, kind: RecordKind, connection_id: int, data: bytes) -> None:
+        if self.full:
+            return
+        size = RECORD_HEADER.size + len(data)
+        if self.size + size > self.max_bytes:
+            self.full = True
+            logger.warning(
+                f"Traffic capture {self.path} reached {self.size} bytes, stopped "
+                "recording"
+            )
+            return
+        timestamp = (time.perf_counter_ns() - self.started) // 1000
+        # The file is buffered, so each record is copied into the file buffer rather
+        # than written to disk from the event loop.
+        self.file.write(RECORD_HEADER.pack(kind, connection_id, timestamp, len(data)))
+        self.file.write(data)
+        self.size += size
+        if kind is RecordKind.OPEN:
+            self.connections += 1
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.file.close()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "connections": self.connections,
+            "full": self.full,
+        }
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """
+    Read the records of a capture file in the order they were recorded. A record cut
+    short by the end of the file, such as one left by a server that was killed, ends
+    the capture.
+    """
+    with open(path, "rb") as capture_file:
+        if capture_file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise CaptureFormatError(f"{path} is not a capture file")
+        while True:
+            header = capture_file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            kind, connection_id, timestamp, length = RECORD_HEADER.unpack(header)
+            data = capture_file.read(length)
+            if len(data) < length:
+                return
+            yield CaptureRecord(
+                RecordKind(kind), connection_id, timestamp / 1000000, data
+            )
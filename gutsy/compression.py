@@ -0,0 +1,197 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+# The content types that are compressed by default, matched on the media type prefix.
+COMPRESSIBLE_CONTENT_TYPES = (
+    b"text/",
+    b"application/json",
+    b"application/javascript",
+    b"application/xml",
+    b"application/xhtml+xml",
+    b"image/svg+xml",
+)
+
+
+def get_supported_encodings() -> Tuple[bytes]:
+    """The supported content codings in order of preference."""
+    if brotli is not None:
+        return (b"br", b"gzip", b"deflate")
+    return (b"gzip", b"deflate")
+
+
+def select_encoding(accept_encoding: bytes, encodings: Tuple[bytes]) -> Optional[bytes]:
+    """
+    Negotiate the content coding of a response from the request Accept-Encoding header,
+    returning the acceptable encoding with the highest quality value. Ties are broken
+    by the order of the supported encodings.
+    """
+    qualities = {}
+    for coding in accept_encoding.split(b","):
+        name, _, params = coding.partition(b";")
+        quality = 1.0
+        params = params.strip()
+        if params[:2].lower() == b"q=":
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+
+    wildcard = qualities.get(b"*", 0.0)
+    selected, selected_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, wildcard)
+        if quality > selected_quality:
+            selected, selected_quality = encoding, quality
+    return selected
+
+
+class Encoder:
+    """
+    Incremental compressor for a single response body.
+
+    The data of each `compress` call is flushed so a streamed chunk can be decoded by
+    the client as soon as it is received, `finish` ends the compressed stream.
+    """
+
+    __slots__ = ("encoding", "compressor")
+
+    def __init__(self, encoding: bytes, level: int) -> None:
+        self.encoding: bytes = encoding
+        if encoding == b"br":
+            self.compressor = brotli.Compressor(quality=min(level, 11))
+        elif encoding == b"gzip":
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        else:
+            self.compressor = zlib.compressobj(level, zlib.DEFLATED, 15)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == b"br":
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == b"br":
+            return self.compressor.process(data) + self.compressor.finish()
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class ResponseCompressor:
+    """
+    Server-level response compression negotiated from the request Accept-Encoding
+    header. Brotli is used when the optional `brotli` package is installed.
+
+    * `min_size` -
+        (*int*): Responses with a smaller known body size are not compressed.
+
+    * `content_types` -
+        (*Tuple[bytes]*): The media type prefixes of the responses that are compressed.
+
+    * `level` -
+        (*int*): The compression level.
+
+    * `thread_min_size` -
+        (*int*): Bodies of at least this size are compressed in the thread pool rather
+        than on the event loop, `None` to always compress on the event loop.
+
+    * `responses`, `bytes_in`, `bytes_out` -
+        (*int*): The number of compressed responses and their total size before and
+        after compression.
+
+    * `cpu_time` -
+        (*float*): The total thread CPU time spent compressing, in seconds.
+    """
+
+    def __init__(
+        self,
+        min_size: int = 500,
+        content_types: Tuple[bytes] = COMPRESSIBLE_CONTENT_TYPES,
+        level: int = 6,
+        thread_min_size: int = None,
+        executor: concurrent.futures.Executor = None,
+    ) -> None:
+        self.min_size: int = min_size
+        self.content_types: Tuple[bytes] = content_types
+        self.level: int = level
+        self.thread_min_size: int = thread_min_size
+        self.executor: concurrent.futures.Executor = executor
+        self.encodings: Tuple[bytes] = get_supported_encodings()
+        # The counters are updated from the thread pool and from the event loop threads.
+        self.lock: threading.Lock = threading.Lock()
+        self.responses: int = 0
+        self.bytes_in: int = 0
+        self.bytes_out: int = 0
+        self.cpu_time: float = 0.0
+
+    def is_compressible(self, status: int, headers: list) -> bool:
+        """
+        Determine from the response start event if the response body may be compressed.
+        """
+        if status in (204, 304):
+            return False
+        content_type = None
+        for header_name, header_value in headers:
+            if header_name == b"content-type":
+                content_type = header_value.lower()
+            elif header_name == b"content-encoding":
+                return False
+            elif header_name == b"content-length" and int(header_value) < self.min_size:
+                return False
+        return content_type is not None and content_type.startswith(self.content_types)
+
+    def get_encoder(self, accept_encoding: bytes) -> Optional[Encoder]:
+        """
+        Return the encoder negotiated from the request Accept-Encoding header, or `None`
+        if the client does not accept a supported encoding.
+        """
+        if accept_encoding is None:
+            return None
+        encoding = select_encoding(accept_encoding, self.encodings)
+        if encoding is None:
+            return None
+        return Encoder(encoding, self.level)
+
+    def run_encoder(self, encoder: Encoder, data: bytes, finish: bool) -> bytes:
+        start = time.thread_time()
+        if finish:
+            compressed = encoder.finish(data)
+        else:
+            compressed = encoder.compress(data)
+        cpu_time = time.thread_time() - start
+        with self.lock:
+            self.responses += finish
+            self.cpu_time += cpu_time
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+        return compressed
+
+    async def compress(self, encoder: Encoder, data: bytes, finish: bool) -> bytes:
+        """
+        Compress the next part of a response body, in the thread pool if it is large
+        enough.
+        """
+        if self.thread_min_size is not None and len(data) >= self.thread_min_size:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                self.executor, self.run_encoder, encoder, data, finish
+            )
+        return self.run_encoder(encoder, data, finish)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "responses": self.responses,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.bytes_out / self.bytes_in if self.bytes_in else 1.0,
+            "cpu_time": self.cpu_time,
+        }
@@ -1,11 +1,26 @@
 import asyncio
 import enum
-from dataclasses import dataclass, field
+import logging
+import struct
+import time
 
 from starlette.types import ASGIApp, Scope, Message
 
+from aiobufpro.body import SPOOLED_BODY, RequestBodySpool
+from aiobufpro.cache import CACHEABLE_STATUS_CODES, get_shared_max_age
+from aiobufpro.compression import Encoder
 from aiobufpro.utils import get_server_headers
-from aiobufpro.parsers.websocket import WebSocketOpcode, WebSocketError
+from aiobufpro.parsers.http2 import ErrorCode
+from aiobufpro.parsers.websocket import (
+    WebSocketCloseCode,
+    WebSocketOpcode,
+    WebSocketError,
+    build_frame,
+)
+
+logger = logging.getLogger()
+
+EARLY_HINTS_STATUS_LINE = b"HTTP/1.1 103 Early Hints\r\n"
 
 
 class ASGIConnectionState(enum.Enum):
@@ -17,26 +32,121 @@ class ASGIConnectionState(enum.Enum):
     CLOSED = enum.auto()
 
 
-@dataclass
 class ASGIConnection:
     """
     Base ASGI connection class. Defines the common connection behaviour of HTTP and
     WebSocket protocol interfaces.
     """
 
-    protocol: asyncio.BaseTransport
-    state: ASGIConnectionState = field(default=ASGIConnectionState.REQUEST, init=False)
-    app_queue: asyncio.Queue = field(default=None, init=False)
-    content_length: int = field(default=None, init=False)
+    __slots__ = (
+        "protocol",
+        "state",
+        "scope",
+        "app_queue",
+        "app_running",
+        "content_length",
+        "status",
+        "response_size",
+        "parse_time",
+        "queued_at",
+        "app_started",
+    )
+
+    def __init__(self, protocol: asyncio.BufferedProtocol) -> None:
+        self.protocol: asyncio.BufferedProtocol = protocol
+        self.state: ASGIConnectionState = ASGIConnectionState.REQUEST
+        self.scope: Scope = None
+        self.app_queue: asyncio.Queue = asyncio.Queue()
+        self.app_running: bool = False
+        self.content_length: int = None
+        self.status: int = None
+        self.response_size: int = 0
+        self.parse_time: int = None
+        self.queued_at: int = None
+        self.app_started: int = None
+
+    def reset(self) -> None:
+        """
+        Reset the connection to be reused for the next request on the same protocol
+        connection. Only valid once the application of the previous request has
+        completed.
+        """
+        self.state = ASGIConnectionState.REQUEST
+        self.content_length = None
+        self.status = None
+        self.response_size = 0
+
+        # Discard any messages the previous application did not receive.
+        app_queue = self.app_queue
+        while not app_queue.empty():
+            app_queue.get_nowait()
 
     def run_asgi(self, app: ASGIApp, scope: Scope):
         """
         Instantiate the ASGI application.
         https://asgi.readthedocs.io/en/latest/specs/main.html#applications
         """
+        self.scope = scope
+        protocol = self.protocol
+        if protocol.server_timing:
+            self.parse_time = protocol.parse_time
+            self.queued_at = time.perf_counter_ns()
         asgi_instance = app(scope)
-        self.app_queue = asyncio.Queue()
-        asyncio.create_task(asgi_instance(self.receive, self.send))
+
+        # The initial message is queued before the application starts, so that an
+        # eagerly started application can receive it without suspending.
+        initial_message = self.get_initial_message()
+        if initial_message is not None:
+            self.put_message(initial_message)
+        self.app_running = True
+        protocol.start_app(self.run_app(asgi_instance))
+
+    async def run_app(self, asgi_instance) -> None:
+        metrics = self.protocol.metrics
+        access_log = self.protocol.access_log
+        started = None
+        if metrics is not None or access_log is not None or self.queued_at is not None:
+            started = time.perf_counter_ns()
+            self.app_started = started
+        try:
+            await asgi_instance(self.receive, self.send)
+        except Exception:
+            if metrics is not None:
+                metrics.app_errors += 1
+            raise
+        finally:
+            self.app_running = False
+            if started is not None:
+                duration = time.perf_counter_ns() - started
+                if metrics is not None:
+                    self.observe_app_time(metrics, duration)
+                if access_log is not None:
+                    self.log_access(access_log, duration)
+
+    def observe_app_time(self, metrics, duration: int) -> None:
+        """Record the time taken by the application in nanoseconds."""
+        metrics.app_time.observe(duration)
+
+    def log_access(self, access_log, duration: int) -> None:
+        """Log the completed request and response."""
+        access_log.log(self.scope, self.status, self.response_size, duration)
+
+    def get_server_timing(self) -> bytes:
+        """
+        The `server-timing` header value of the response, with the time taken to parse
+        the request headers, the time the application waited to be run and the time it
+        took to start the response, in milliseconds.
+        """
+        app_time = time.perf_counter_ns() - self.app_started
+        queue_time = self.app_started - self.queued_at
+        timing = b"queue;dur=%.3f, app;dur=%.3f" % (queue_time / 1e6, app_time / 1e6)
+        if self.parse_time is not None:
+            timing = b"parse;dur=%.3f, %s" % (self.parse_time / 1e6, timing)
+        return timing
+
+    def get_initial_message(self) -> Message:
+        """Override in connection class. The first message received by the app."""
+        raise NotImplementedError
 
     def put_message(self, message: Message) -> None:
         """Put a message in the queue to be received by the application."""
@@ -82,11 +192,111 @@ class ASGIConnection:
 
 
 class ASGIHTTPConnection(ASGIConnection):
-    def run_asgi(self, app: ASGIApp, scope: Scope) -> None:
-        super().run_asgi(app, scope)
+
+    __slots__ = (
+        "content",
+        "cache_key",
+        "cache_max_age",
+        "cache_vary",
+        "encoder",
+        "spool",
+        "queued_body",
+    )
+
+    def __init__(self, protocol: asyncio.BufferedProtocol) -> None:
+        super().__init__(protocol)
+        self.cache_key: tuple = None
+        self.cache_max_age: int = None
+        self.cache_vary: tuple = ()
+        self.encoder: Encoder = None
+        self.spool: RequestBodySpool = None
+        self.queued_body: int = 0
+
+    def reset(self) -> None:
+        super().reset()
+        self.cache_max_age = None
+        self.cache_vary = ()
+        self.encoder = None
+        self.spool = None
+        self.queued_body = 0
+
+    async def run_app(self, asgi_instance) -> None:
+        try:
+            await super().run_app(asgi_instance)
+        finally:
+            if self.state in (
+                ASGIConnectionState.RESPONSE,
+                ASGIConnectionState.STREAMING,
+            ):
+                # The application did not complete the response it started, which the
+                # client can only tell from the connection being closed.
+                self.protocol.transport.close()
+            if self.spool is not None:
+                self.spool.close()
+            if self.cache_key is not None:
+                # The application did not complete a cacheable response, so any
+                # requests waiting on this one run the application themselves.
+                self.protocol.response_cache.complete(self.cache_key, None)
+                self.cache_key = None
+
+    def get_initial_message(self) -> Message:
         # Place an initial `http.request` message type in the application queue to
-        # indicate an incoming request.
-        self.put_message({"type": "http.request", "body": b""})
+        # indicate an incoming request. Requests with a body are received as the body
+        # data arrives instead.
+        if self.protocol.request_body is not None:
+            return None
+        return {"type": "http.request", "body": b""}
+
+    def on_request_body(self, body: bytes, complete: bool) -> None:
+        """
+        Called by the protocol with the decoded request body data as it is received.
+        """
+        spool = self.spool
+        if spool is None:
+            self.queued_body += len(body)
+            self.put_message(
+                {"type": "http.request", "body": body, "more_body": not complete}
+            )
+            return
+
+        spool.write(body)
+        if complete:
+            spool.finish()
+            self.put_message(SPOOLED_BODY)
+
+    async def receive(self) -> Message:
+        # A spooled body is read from the spool as the application receives it, rather
+        # than being queued in memory.
+        spool = self.spool
+        if spool is not None and spool.reading:
+            return spool.read_message()
+        message = await self.app_queue.get()
+        if message is SPOOLED_BODY:
+            return spool.read_message()
+        if self.queued_body and message["type"] == "http.request":
+            self.queued_body -= len(message["body"])
+            self.protocol.on_body_received(self.queued_body)
+        return message
+
+    async def on_http_response_early_hint(self, message: Message) -> None:
+        """
+        Handler for the early hint events, sent before the response starts.
+        https://www.rfc-editor.org/rfc/rfc8297
+        """
+        if self.state is not ASGIConnectionState.REQUEST:
+            raise Exception(
+                "Invalid `http.response.early_hint` event: The response has already "
+                "started."
+            )
+        links = message.get("links")
+        # HTTP/1.0 clients do not expect informational responses.
+        if not links or self.scope["http_version"] == "1.0":
+            return
+        content = [EARLY_HINTS_STATUS_LINE]
+        for link in links:
+            content.append(b"".join([b"link: ", link, b"\r\n"]))
+        content.append(b"\r\n")
+        self.protocol.transport.write(b"".join(content))
 
     async def on_http_response_start(self, message: Message) -> None:
         """
@@ -101,16 +311,36 @@ class ASGIHTTPConnection(ASGIConnection):
         # Retrieve the HTTP status code and any headers sent from the application.
         status = message["status"]
         headers = message.get("headers", [])
+        self.status = status
 
         # Start building the response with the base server headers and include any
         # headers from the application in the response.
         self.content = get_server_headers(status)
+
+        compressor = self.protocol.compressor
+        if (
+            compressor is not None
+            # The response to a HEAD request has no body to compress, and the
+            # content-length of the application is that of the uncompressed body.
+            and self.scope["method"] != "HEAD"
+            and compressor.is_compressible(status, headers)
+        ):
+            # The response depends on the Accept-Encoding header whether or not the
+            # client accepts a supported encoding.
+            self.encoder = compressor.get_encoder(self.protocol.parser.accept_encoding)
+            self.content.append(b"vary: accept-encoding\r\n")
+            self.cache_vary = (b"accept-encoding",)
+
         for header_name, header_value in headers:
 
             if header_name == b"content-length":
                 # If we see the content-length header, then set the value on our
                 # instance to be used when sending the response.
                 self.content_length = int(header_value.decode())
+                if self.encoder is not None:
+                    # The length of the compressed body is not known until it has
+                    # been compressed, the header is added if it is not.
+                    continue
 
             # Default to keep-alive unless the connection header has a close value.
             elif header_name == b"connection" and header_value == b"close":
@@ -118,6 +348,15 @@ class ASGIHTTPConnection(ASGIConnection):
 
             self.content.append(b"".join([header_name, b": ", header_value, b"\r\n"]))
 
+        if self.cache_key is not None:
+            self.cache_max_age = self.get_cache_max_age(status, headers)
+        elif self.queued_at is not None:
+            # Responses that may be stored in the response cache do not include the
+            # timing of the request that stored them.
+            self.content.append(
+                b"".join([b"server-timing: ", self.get_server_timing(), b"\r\n"])
+            )
+
         self.update_connection_state(ASGIConnectionState.RESPONSE)
 
     async def on_http_response_body(self, message: Message) -> None:
@@ -135,6 +374,7 @@ class ASGIHTTPConnection(ASGIConnection):
 
         body = message.get("body", b"")
         more_body = message.get("more_body", False)
+        self.response_size += len(body)
 
         if self.state is ASGIConnectionState.RESPONSE:
             # If we aren't currently streaming, then we will either update the state
@@ -144,15 +384,29 @@ class ASGIHTTPConnection(ASGIConnection):
                 # There is no more body to be received from the application, so we
                 # complete the response and close the connection.
 
+                if self.encoder is not None:
+                    if len(body) < self.protocol.compressor.min_size:
+                        self.encoder = None
+                        if self.content_length is not None:
+                            self.content.append(
+                                b"content-length: %d\r\n" % self.content_length
+                            )
+                    else:
+                        body = await self.compress(body, finish=True)
+                        self.content_length = None
+
                 if self.content_length is None:
                     # If we didn't see a content-length in the headers during the start
                     # event, then we create it here based on the body size.
-                    self.content.append(b"content-length: %x\r\n\r\n" % len(body))
+                    self.content.append(b"content-length: %d\r\n\r\n" % len(body))
                 else:
                     self.content.append(b"\r\n")
 
-                self.content.extend([body, b"\r\n"])
-                await self.protocol.feed_data(b"".join(self.content))
+                self.content.append(body)
+                response = b"".join(self.content)
+                await self.protocol.feed_data(response)
+                if self.cache_key is not None:
+                    self.store_response(response)
                 self.update_connection_state(ASGIConnectionState.CLOSED)
 
             else:
@@ -160,21 +414,22 @@ class ASGIHTTPConnection(ASGIConnection):
                 # There is additional body to be received from the application, so
                 # we need to use the chunked transfer encoding header to stream any
                 # additional body data being sent from the application.
-                self.content.extend(
-                    [
-                        b"transfer-encoding: chunked\r\n\r\n",
-                        b"%x\r\n" % len(body),
-                        body,
-                        b"\r\n",
-                    ]
-                )
+                if self.encoder is not None:
+                    body = await self.compress(body, finish=False)
+                self.content.append(b"transfer-encoding: chunked\r\n\r\n")
+                if body:
+                    # An empty chunk would end the chunked body.
+                    self.content.extend([b"%x\r\n" % len(body), body, b"\r\n"])
                 await self.protocol.feed_data(b"".join(self.content))
                 self.update_connection_state(ASGIConnectionState.STREAMING)
 
         elif self.state is ASGIConnectionState.STREAMING:
-            await self.protocol.feed_data(
-                b"".join([b"%x\r\n" % len(body), body, b"\r\n"])
-            )
+            if self.encoder is not None:
+                body = await self.compress(body, finish=not more_body)
+            if body:
+                await self.protocol.feed_data(
+                    b"".join([b"%x\r\n" % len(body), body, b"\r\n"])
+                )
 
             if not more_body:
                 await self.protocol.feed_data(b"0\r\n\r\n")
@@ -187,25 +442,215 @@ class ASGIHTTPConnection(ASGIConnection):
         self.put_message({"type": "http.disconnect"})
         self.protocol.on_response_complete()
 
+    async def compress(self, body: bytes, finish: bool) -> bytes:
+        """
+        Compress the next part of the response body, adding the content-encoding header
+        before the first part.
+        """
+        if self.state is ASGIConnectionState.RESPONSE:
+            self.content.append(
+                b"".join([b"content-encoding: ", self.encoder.encoding, b"\r\n"])
+            )
+        return await self.protocol.compressor.compress(self.encoder, body, finish)
+
+    def get_cache_max_age(self, status: int, headers: list) -> int:
+        """
+        Return the number of seconds the response may be stored by the response cache,
+        or `None` if it must not be stored. Streamed responses are never stored.
+        """
+        if status not in CACHEABLE_STATUS_CODES or not self.protocol.keep_alive:
+            return None
+
+        max_age = None
+        for header_name, header_value in headers:
+            if header_name == b"cache-control":
+                max_age = get_shared_max_age(header_value)
+                if max_age is None:
+                    return None
+            elif header_name == b"vary":
+                vary = tuple(name.strip().lower() for name in header_value.split(b","))
+                if b"*" in vary:
+                    return None
+                self.cache_vary += vary
+            elif header_name == b"set-cookie":
+                return None
+        return max_age
+
+    def store_response(self, response: bytes) -> None:
+        """
+        Store the complete response in the response cache and answer any requests that
+        were waiting for it.
+        """
+        response_cache = self.protocol.response_cache
+        stored_key = None
+        if self.cache_max_age:
+            stored_key = response_cache.store(
+                self.cache_key,
+                self.protocol.parser.headers,
+                response,
+                self.cache_max_age,
+                self.cache_vary,
+            )
+        response_cache.complete(self.cache_key, stored_key)
+        self.cache_key = None
+
+
+class ASGIHTTP2Connection(ASGIConnection):
+    """
+    ASGI connection of a single HTTP/2 stream. The response is sent as HEADERS and DATA
+    frames by the HTTP/2 parser of the protocol.
+    """
+
+    __slots__ = ("stream_id", "end_stream", "headers")
+
+    def __init__(
+        self, protocol: asyncio.BufferedProtocol, stream_id: int, end_stream: bool
+    ) -> None:
+        super().__init__(protocol)
+        self.stream_id: int = stream_id
+        self.end_stream: bool = end_stream
+        self.headers: list = None
+
+    def get_initial_message(self) -> Message:
+        # A request without a body is complete once its headers are received, otherwise
+        # the body is received from the DATA frames of the stream.
+        if not self.end_stream:
+            return None
+        return {"type": "http.request", "body": b""}
+
+    async def run_app(self, asgi_instance) -> None:
+        try:
+            await super().run_app(asgi_instance)
+        finally:
+            if self.state is not ASGIConnectionState.CLOSED:
+                # The application did not complete the response, only the stream is
+                # reset rather than the entire connection.
+                self.protocol.parser.reset_stream(
+                    self.stream_id, ErrorCode.INTERNAL_ERROR
+                )
+
+    def on_request_body(self, body: bytes, complete: bool) -> None:
+        self.put_message(
+            {"type": "http.request", "body": body, "more_body": not complete}
+        )
+
+    async def receive(self) -> Message:
+        message = await self.app_queue.get()
+        if message["type"] == "http.request":
+            # The flow control windows are credited as the application receives the
+            # body, so the client is held back by a slow application.
+            self.protocol.parser.consume_data(self.stream_id, len(message["body"]))
+        return message
+
+    async def on_http_response_early_hint(self, message: Message) -> None:
+        if self.state is not ASGIConnectionState.REQUEST:
+            raise Exception(
+                "Invalid `http.response.early_hint` event: The response has already "
+                "started."
+            )
+        links = message.get("links")
+        if links:
+            headers = [(b"link", link) for link in links]
+            self.protocol.parser.send_headers(self.stream_id, 103, headers, False)
+
+    async def on_http_response_start(self, message: Message) -> None:
+        if self.state is not ASGIConnectionState.REQUEST:
+            raise Exception(
+                "Invalid `http.response.start` event: The response has already started."
+            )
+        self.status = message["status"]
+        self.headers = message.get("headers", [])
+        if self.queued_at is not None:
+            self.headers = [
+                *self.headers,
+                (b"server-timing", self.get_server_timing()),
+            ]
+        self.update_connection_state(ASGIConnectionState.RESPONSE)
+
+    async def on_http_response_body(self, message: Message) -> None:
+        if self.state not in (
+            ASGIConnectionState.RESPONSE,
+            ASGIConnectionState.STREAMING,
+        ):
+            raise Exception(
+                "Invalid `http.response.body` event: The response has not started."
+            )
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        self.response_size += len(body)
+        parser = self.protocol.parser
+
+        if self.state is ASGIConnectionState.RESPONSE:
+            # A response without a body ends the stream with the HEADERS frame.
+            headers_only = not body and not more_body
+            parser.send_headers(self.stream_id, self.status, self.headers, headers_only)
+            if not headers_only:
+                await parser.send_data(self.stream_id, body, not more_body)
+        elif body or not more_body:
+            await parser.send_data(self.stream_id, body, not more_body)
+
+        if more_body:
+            self.state = ASGIConnectionState.STREAMING
+        else:
+            self.update_connection_state(ASGIConnectionState.CLOSED)
+
+        if self.protocol.write_paused:
+            await self.protocol.drain()
+
+    def on_connection_complete(self) -> None:
+        self.put_message({"type": "http.disconnect"})
+
 
 class ASGIWebSocketConnection(ASGIConnection):
-    def run_asgi(self, app: ASGIApp, scope: Scope) -> None:
-        super().run_asgi(app, scope)
+
+    __slots__ = ("disconnected",)
+
+    def __init__(self, protocol: asyncio.BufferedProtocol) -> None:
+        super().__init__(protocol)
+        self.disconnected: bool = False
+
+    def disconnect(self, code: int) -> None:
+        """
+        Put the `websocket.disconnect` message in the application queue. The connection
+        is reported closed once, the transport closing after the server has closed the
+        connection does not report it again.
+        """
+        if self.disconnected:
+            return
+        self.disconnected = True
+        self.put_message({"type": "websocket.disconnect", "code": code})
+
+    def observe_app_time(self, metrics, duration: int) -> None:
+        # The application runs for the lifetime of the WebSocket connection.
+        pass
+
+    def log_access(self, access_log, duration: int) -> None:
+        pass
+
+    def get_initial_message(self) -> Message:
         # Place an initial `websocket.connect` message type in the application queue to
         # indicate an incoming request.
-        self.put_message({"type": "websocket.connect", "order": 0})
+        return {"type": "websocket.connect", "order": 0}
 
     async def send(self, message: Message) -> None:
         message_type = message["type"]
         opcode = None
 
+        if message_type.startswith("websocket.broadcast."):
+            # Broadcast extension events are dispatched to a handler method in the
+            # same way as the base connection class.
+            handler = getattr(self, f"on_{message_type.replace('.', '_')}")
+            handler(message)
+            return
+
         payload_data = message.get("text")
         if payload_data:
             opcode = WebSocketOpcode.TEXT
         else:
             payload_data = message.get("bytes")
             if payload_data:
-                opcode = WebSocketOpcode.BYTES
+                opcode = WebSocketOpcode.BINARY
 
         if self.state is ASGIConnectionState.CLOSED:
             raise Exception(f"Unexpected message, ASGIConnection is {self.state}")
@@ -213,8 +658,8 @@ class ASGIWebSocketConnection(ASGIConnection):
         if self.state == ASGIConnectionState.REQUEST:
             subprotocol = message.get("subprotocol", None)
             if subprotocol is not None:
-                self.protocol.handshake_headers.append(
-                    (b"Sec-WebSocket-Protocol", subprotocol.encode("utf-8"))
+                self.protocol.handshake_headers += b"".join(
+                    [b"Sec-WebSocket-Protocol: ", subprotocol.encode("utf-8"), b"\r\n"]
                 )
 
             if not self.protocol.accepted:
@@ -238,13 +683,50 @@ class ASGIWebSocketConnection(ASGIConnection):
                         payload_data, opcode=opcode
                     )
 
-                except WebSocketError as exc:
-                    print(exc)
-                    self.protocol.close()
+                except WebSocketError:
+                    logger.exception("Error framing a WebSocket message")
+                    self.update_connection_state(ASGIConnectionState.CLOSED)
+                    code = WebSocketCloseCode.INTERNAL_SERVER_ERROR.value
+                    self.protocol.outbound.close(
+                        build_frame(
+                            struct.pack("!H", code), opcode=WebSocketOpcode.CLOSE
+                        )
+                    )
+                    return
 
-                await self.protocol.feed_data(content)
+                # Frames are written by the outbound queue, which applies the send
+                # queue limit and coalesces the frames queued in this loop iteration.
+                await self.protocol.outbound.put(content)
 
             if message_type == "websocket.close":
                 code = message.get("code", 1000)
                 self.update_connection_state(ASGIConnectionState.CLOSED)
-                # todo
+                self.protocol.outbound.close(
+                    build_frame(struct.pack("!H", code), opcode=WebSocketOpcode.CLOSE)
+                )
+
+    def on_websocket_broadcast_join(self, message: Message) -> None:
+        """
+        Handler for the broadcast extension join event. Adds the connection to a named
+        group of the server's broadcast hub.
+        """
+        if self.state is not ASGIConnectionState.RESPONSE:
+            raise Exception(
+                "Invalid `websocket.broadcast.join` event: The connection is not open."
+            )
+        self.protocol.broadcast_hub.join(message["group"], self.protocol)
+
+    def on_websocket_broadcast_leave(self, message: Message) -> None:
+        """Handler for the broadcast extension leave event."""
+        self.protocol.broadcast_hub.leave(message["group"], self.protocol)
+
+    def on_websocket_broadcast_publish(self, message: Message) -> None:
+        """
+        Handler for the broadcast extension publish event. The message is framed once
+        by the hub and written to every member of the group, including this connection
+        if it has joined the group.
+        """
+        payload_data = message.get("text")
+        if payload_data is None:
+            payload_data = message.get("bytes", b"")
+        self.protocol.broadcast_hub.publish(message["group"], payload_data)
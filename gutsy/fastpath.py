@@ -0,0 +1,168 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+
+from aiobufpro.utils import get_server_headers
+
+logger = logging.getLogger()
+
+
+FastPathResponse = Tuple[int, List[Tuple[bytes, bytes]], bytes]
+FastPathHandler = Callable[
+    ["FastPathRequest"], Union[FastPathResponse, Awaitable[FastPathResponse]]
+]
+
+
+def build_response(
+    status: int, headers: List[Tuple[bytes, bytes]], body: bytes
+) -> bytes:
+    """Serialize a complete fast-path response."""
+    content = get_server_headers(status)
+    for header_name, header_value in headers:
+        content.append(b"".join([header_name, b": ", header_value, b"\r\n"]))
+    content.append(b"content-length: %d\r\n\r\n" % len(body))
+    content.append(body)
+    return b"".join(content)
+
+
+class FastPathRequest:
+    """
+    The minimal view of a request passed to a fast-path handler.
+
+    * `method` -
+        (*str*): The request method.
+
+    * `path` -
+        (*str*): The request path.
+
+    * `query_string` -
+        (*str*): The query string of the request-target.
+
+    * `headers` -
+        (*List[Tuple[bytes, bytes]]*): The request headers, with lowercase names.
+
+    * `client` -
+        (*Tuple[str, int]*): The peer address of the connection.
+    """
+
+    __slots__ = ("method", "path", "query_string", "headers", "client")
+
+    def __init__(self, parser, client: Tuple[str, int]) -> None:
+        self.method: str = parser.http_method
+        self.path: str = parser.path
+        self.query_string: str = parser.query_string
+        self.headers: List[Tuple[bytes, bytes]] = parser.headers
+        self.client: Tuple[str, int] = client
+
+
+class StaticResponse:
+    """
+    A precomputed fast-path response. The bytes are rebuilt at most once per second to
+    keep the date header current.
+    """
+
+    __slots__ = ("status", "headers", "body", "content", "built")
+
+    def __init__(
+        self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes
+    ) -> None:
+        self.status: int = status
+        self.headers: List[Tuple[bytes, bytes]] = headers
+        self.body: bytes = body
+        self.content: bytes = None
+        self.built: int = None
+
+    def get_content(self) -> bytes:
+        now = int(time.time())
+        if self.built != now:
+            self.content = build_response(self.status, self.headers, self.body)
+            self.built = now
+        return self.content
+
+
+class FastPathRouter:
+    """
+    Routes requests to handlers that bypass the ASGI application entirely. Routes are
+    matched on the exact method and path once the request headers are complete,
+    requests that do not match fall through to the ASGI application.
+
+    * `routes` -
+        (*Dict[Tuple[str, str], FastPathHandler]*): The handlers of each route.
+
+    * `static` -
+        (*Dict[Tuple[str, str], StaticResponse]*): The precomputed responses.
+    """
+
+    def __init__(self) -> None:
+        self.routes: Dict[Tuple[str, str], FastPathHandler] = {}
+        self.static: Dict[Tuple[str, str], StaticResponse] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.routes or self.static)
+
+    def add_route(self, method: str, path: str, handler: FastPathHandler) -> None:
+        """
+        Register a handler called with a `FastPathRequest`. The handler returns the
+        status, headers and body of the response, either directly or as an awaitable.
+        """
+        self.routes[(method.upper(), path)] = handler
+
+    def add_static_route(
+        self,
+        path: str,
+        body: bytes,
+        *,
+        status: int = 200,
+        headers: List[Tuple[bytes, bytes]] = None,
+        method: str = "GET",
+    ) -> None:
+        """Register a route that is always answered with the same response."""
+        response = StaticResponse(status, headers or [], body)
+        self.static[(method.upper(), path)] = response
+
+    def dispatch(self, protocol) -> bool:
+        """
+        Called by the protocol when the request headers are complete. Returns `True` if
+        the request was handled by a fast-path route.
+        """
+        parser = protocol.parser
+        route = (parser.http_method, parser.path)
+
+        static_response = self.static.get(route)
+        if static_response is not None:
+            protocol.transport.write(static_response.get_content())
+            protocol.on_response_complete()
+            return True
+
+        handler = self.routes.get(route)
+        if handler is None:
+            return False
+
+        try:
+            response = handler(FastPathRequest(parser, protocol.client))
+        except Exception:
+            logger.exception("Exception in fast-path handler")
+            response = (500, [], b"Internal Server Error")
+
+        if inspect.isawaitable(response):
+            asyncio.ensure_future(self.send_awaited_response(protocol, response))
+        else:
+            self.send_response(protocol, response)
+        return True
+
+    async def send_awaited_response(self, protocol, response: Awaitable) -> None:
+        try:
+            response = await response
+        except Exception:
+            logger.exception("Exception in fast-path handler")
+            response = (500, [], b"Internal Server Error")
+        self.send_response(protocol, response)
+
+    def send_response(self, protocol, response: FastPathResponse) -> None:
+        if protocol.transport.is_closing():
+            return
+        status, headers, body = response
+        protocol.transport.write(build_response(status, headers, body))
+        protocol.on_response_complete()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import math
+import struct
+from typing import Dict, Set
+
+from aiobufpro.parsers.websocket import (
+    WebSocketCloseCode,
+    WebSocketOpcode,
+    build_frame,
+)
+
+logger = logging.getLogger()
+
+
+# The ping and close frames are identical for every connection, so they are built once
+# and the same bytes are written to each transport.
+PING_FRAME = build_frame(b"", opcode=WebSocketOpcode.PING)
+GOING_AWAY_FRAME = build_frame(
+    struct.pack("!H", WebSocketCloseCode.GOING_AWAY.value),
+    opcode=WebSocketOpcode.CLOSE,
+)
+
+
+class HeartbeatScheduler:
+    """
+    Sends server-initiated pings to open WebSocket connections and closes the
+    connections that do not answer with a pong before the deadline.
+
+    Rather than a sleeping task per connection, connections are placed in buckets keyed
+    by the tick they are next due in. A single timer fires once per tick and handles
+    every connection in the due bucket together.
+
+    * `interval` -
+        (*float*): Seconds between a pong and the next ping.
+
+    * `timeout` -
+        (*float*): Seconds a connection has to answer a ping.
+
+    * `tick` -
+        (*float*): The scheduling resolution in seconds.
+
+    * `buckets` -
+        (*Dict[int, Set[HTTPWSProtocol]]*): The connections due in each tick.
+
+    * `pings_sent`, `pongs_received`, `reaped` -
+        (*int*): Counters of pings, pongs and connections closed for not answering.
+    """
+
+    def __init__(self, interval: float, timeout: float, tick: float = 1.0) -> None:
+        self.interval: float = interval
+        self.timeout: float = timeout
+        self.tick: float = tick
+        self.interval_ticks: int = max(1, math.ceil(interval / tick))
+        self.timeout_ticks: int = max(1, math.ceil(timeout / tick))
+        self.buckets: Dict[int, Set] = {}
+        self.current_tick: int = None
+        self.timer: asyncio.TimerHandle = None
+        self.pings_sent: int = 0
+        self.pongs_received: int = 0
+        self.reaped: int = 0
+
+    def schedule(self, protocol, ticks: int) -> None:
+        """Move the protocol into the bucket that is due `ticks` from now."""
+        if protocol.heartbeat_tick is not None:
+            self.buckets[protocol.heartbeat_tick].discard(protocol)
+
+        due_tick = self.current_tick + ticks
+        bucket = self.buckets.get(due_tick)
+        if bucket is None:
+            bucket = self.buckets[due_tick] = set()
+        bucket.add(protocol)
+        protocol.heartbeat_tick = due_tick
+
+    def register(self, protocol) -> None:
+        """Called when a WebSocket connection is accepted."""
+        if self.timer is None:
+            loop = asyncio.get_running_loop()
+            self.current_tick = int(loop.time() / self.tick)
+            self.timer = loop.call_at((self.current_tick + 1) * self.tick, self.on_tick)
+        protocol.awaiting_pong = False
+        self.schedule(protocol, self.interval_ticks)
+
+    def unregister(self, protocol) -> None:
+        """Called when the connection is lost."""
+        if protocol.heartbeat_tick is not None:
+            self.buckets[protocol.heartbeat_tick].discard(protocol)
+            protocol.heartbeat_tick = None
+
+    def on_pong(self, protocol) -> None:
+        """Called when a pong frame is received, the next ping is then rescheduled."""
+        if protocol.awaiting_pong:
+            self.pongs_received += 1
+            protocol.awaiting_pong = False
+            self.schedule(protocol, self.interval_ticks)
+
+    def on_tick(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.current_tick += 1
+        due = self.buckets.pop(self.current_tick, None)
+
+        if due:
+            pings_sent = 0
+            for protocol in due:
+                protocol.heartbeat_tick = None
+                if protocol.awaiting_pong:
+                    self.reap(protocol)
+                else:
+                    protocol.transport.write(PING_FRAME)
+                    protocol.awaiting_pong = True
+                    self.schedule(protocol, self.timeout_ticks)
+                    pings_sent += 1
+            self.pings_sent += pings_sent
+
+        self.timer = loop.call_at((self.current_tick + 1) * self.tick, self.on_tick)
+
+    def reap(self, protocol) -> None:
+        """Close a connection that did not answer the last ping before the deadline."""
+        logger.debug("Closing unresponsive WebSocket connection %s", protocol.client)
+        self.reaped += 1
+        protocol.awaiting_pong = False
+        protocol.transport.write(GOING_AWAY_FRAME)
+        protocol.transport.close()
+        protocol.asgi_connection.disconnect(WebSocketCloseCode.GOING_AWAY.value)
+
+    def close(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.buckets.clear()
@@ -0,0 +1,142 @@
+import asyncio
+import enum
+import logging
+
+from starlette.types import ASGIApp, Message
+
+logger = logging.getLogger()
+
+
+class LifespanMode(enum.Enum):
+    """
+    Whether the ASGI lifespan protocol is run.
+
+    * `AUTO` - The protocol is run, and is treated as unsupported if the application
+        raises an exception before completing the startup.
+
+    * `ON` - The protocol is run, and the server fails to start if the application does
+        not support it.
+
+    * `OFF` - The protocol is not run.
+    """
+
+    AUTO = "auto"
+    ON = "on"
+    OFF = "off"
+
+
+class LifespanError(Exception):
+    pass
+
+
+class Lifespan:
+    """
+    Runs the ASGI lifespan protocol of an application on an event loop. The startup
+    event is sent before the loop accepts connections, so the application can open its
+    connection pools and warm its caches on the loop they are used from, and the
+    shutdown event once the connections have been drained.
+
+    * `app` -
+        (*ASGIApp*): The application.
+
+    * `mode` -
+        (*LifespanMode*): Whether the protocol is required.
+
+    * `timeout` -
+        (*float*): The seconds the application has to complete its shutdown.
+
+    * `state` -
+        (*dict*): The lifespan state namespace, a shallow copy of which is passed in the
+        scope of each request.
+
+    * `supported` -
+        (*bool*): Whether the application supports the protocol.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        mode: LifespanMode = LifespanMode.AUTO,
+        timeout: float = 30.0,
+    ) -> None:
+        self.app: ASGIApp = app
+        self.mode: LifespanMode = mode
+        self.timeout: float = timeout
+        self.state: dict = {}
+        self.supported: bool = True
+        self.failed: str = None
+        self.app_queue: asyncio.Queue = None
+        self.startup_complete: asyncio.Event = None
+        self.shutdown_complete: asyncio.Event = None
+        self.task: asyncio.Task = None
+
+    async def startup(self) -> None:
+        """
+        Send the startup event and wait for the application to complete it. Raises
+        `LifespanError` if the startup failed.
+        """
+        self.app_queue = asyncio.Queue()
+        self.startup_complete = asyncio.Event()
+        self.shutdown_complete = asyncio.Event()
+        self.app_queue.put_nowait({"type": "lifespan.startup"})
+        self.task = asyncio.create_task(self.run())
+        await self.startup_complete.wait()
+        if self.failed is not None:
+            raise LifespanError(f"Application startup failed: {self.failed}")
+
+    async def shutdown(self) -> None:
+        """Send the shutdown event and wait for the application to complete it."""
+        if not self.supported or self.task.done():
+            return
+        self.app_queue.put_nowait({"type": "lifespan.shutdown"})
+        try:
+            await asyncio.wait_for(self.shutdown_complete.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Application shutdown did not complete within {self.timeout} seconds"
+            )
+            self.task.cancel()
+            return
+        if self.failed is not None:
+            logger.error(f"Application shutdown failed: {self.failed}")
+
+    async def run(self) -> None:
+        scope = {
+            "type": "lifespan",
+            "asgi": {"version": "2.0", "spec_version": "2.0"},
+            "state": self.state,
+        }
+        try:
+            asgi_instance = self.app(scope)
+            await asgi_instance(self.receive, self.send)
+        except Exception as exc:
+            if self.startup_complete.is_set():
+                logger.exception("Exception in the ASGI lifespan")
+            elif self.mode is LifespanMode.AUTO:
+                # Applications without lifespan support raise on the unknown scope or
+                # on the unexpected event.
+                self.supported = False
+                logger.info("The application does not support the ASGI lifespan")
+            else:
+                self.failed = repr(exc)
+        finally:
+            self.startup_complete.set()
+            self.shutdown_complete.set()
+
+    async def receive(self) -> Message:
+        return await self.app_queue.get()
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "lifespan.startup.complete":
+            self.startup_complete.set()
+        elif message_type == "lifespan.startup.failed":
+            self.failed = message.get("message", "")
+            self.startup_complete.set()
+        elif message_type == "lifespan.shutdown.complete":
+            self.shutdown_complete.set()
+        elif message_type == "lifespan.shutdown.failed":
+            self.failed = message.get("message", "")
+            self.shutdown_complete.set()
+        else:
+            raise Exception(f"Invalid lifespan event: {message_type}")
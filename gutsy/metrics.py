@@ -0,0 +1,443 @@
+import asyncio
+import bisect
+import logging
+import ssl
+from typing import Callable, Dict, List, Tuple
+
+from aiobufpro.fastpath import build_response
+from aiobufpro.tls import get_session_stats
+
+logger = logging.getLogger()
+
+
+# The upper bounds of the latency histogram buckets in seconds.
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# The type and help text of every exported metric, in the order they are rendered.
+METRIC_FAMILIES = {
+    "aiobufpro_connections_total": ("counter", "Connections accepted."),
+    "aiobufpro_connections_active": ("gauge", "Connections currently open."),
+    "aiobufpro_requests_total": ("counter", "Requests received, by protocol."),
+    "aiobufpro_websocket_connections_total": (
+        "counter",
+        "WebSocket connections accepted.",
+    ),
+    "aiobufpro_received_bytes_total": ("counter", "Bytes received from clients."),
+    "aiobufpro_sent_bytes_total": ("counter", "Bytes written to clients."),
+    "aiobufpro_parse_errors_total": (
+        "counter",
+        "Connections closed for an invalid HTTP/1.1 request or HTTP/2 protocol error.",
+    ),
+    "aiobufpro_app_errors_total": ("counter", "Exceptions raised by the application."),
+    "aiobufpro_write_pauses_total": (
+        "counter",
+        "Times writing was paused by a full transport buffer.",
+    ),
+    "aiobufpro_header_parse_seconds": (
+        "histogram",
+        "Time from the first byte of a request to its parsed headers.",
+    ),
+    "aiobufpro_app_seconds": (
+        "histogram",
+        "Time the application takes to handle an HTTP request.",
+    ),
+    "aiobufpro_write_drain_seconds": (
+        "histogram",
+        "Time writing was paused until the transport buffer drained.",
+    ),
+    "aiobufpro_target_cache_lookups_total": (
+        "counter",
+        "Request-target cache lookups, by result.",
+    ),
+    "aiobufpro_response_cache_lookups_total": (
+        "counter",
+        "Response cache lookups, by result.",
+    ),
+    "aiobufpro_response_cache_bytes": ("gauge", "Size of the cached responses."),
+    "aiobufpro_response_cache_evictions_total": (
+        "counter",
+        "Responses evicted from the response cache.",
+    ),
+    "aiobufpro_compression_responses_total": ("counter", "Responses compressed."),
+    "aiobufpro_compression_bytes_total": (
+        "counter",
+        "Response body bytes before and after compression.",
+    ),
+    "aiobufpro_compression_cpu_seconds_total": (
+        "counter",
+        "CPU time spent compressing responses.",
+    ),
+    "aiobufpro_body_spooled_total": (
+        "counter",
+        "Request bodies spooled, and those written to disk.",
+    ),
+    "aiobufpro_body_memory_bytes": (
+        "gauge",
+        "Size of the spooled request bodies held in memory.",
+    ),
+    "aiobufpro_tls_handshakes_total": (
+        "counter",
+        "Completed TLS handshakes, and those that resumed a session.",
+    ),
+    "aiobufpro_broadcast_frames_total": (
+        "counter",
+        "WebSocket broadcast frames handled for group members, by outcome.",
+    ),
+    "aiobufpro_bus_frames_total": (
+        "counter",
+        "Broadcast frames sent to and received from other workers or event loops.",
+    ),
+    "aiobufpro_websocket_pings_total": (
+        "counter",
+        "Heartbeat pings sent, pongs received and connections timed out.",
+    ),
+    "aiobufpro_slow_callbacks_total": (
+        "counter",
+        "Event loop callbacks that ran for longer than the slow callback duration.",
+    ),
+    "aiobufpro_event_loop_lag_seconds": (
+        "gauge",
+        "Delay of the event loop in running a scheduled timer, by loop.",
+    ),
+    "aiobufpro_load_shedding": (
+        "gauge",
+        "Whether the event loop is shedding load, by loop.",
+    ),
+    "aiobufpro_shed_total": (
+        "counter",
+        "Requests rejected and idle connections closed while shedding load.",
+    ),
+    "aiobufpro_shed_periods_total": (
+        "counter",
+        "Times an event loop started shedding load.",
+    ),
+}
+
+# The metric samples, keyed by the sample name and its labels.
+Samples = Dict[Tuple[str, str], float]
+
+
+def add_sample(samples: Samples, name: str, value: float, labels: str = "") -> None:
+    key = (name, labels)
+    samples[key] = samples.get(key, 0) + value
+
+
+def merge_samples(samples: Samples, other: Samples) -> None:
+    for key, value in other.items():
+        samples[key] = samples.get(key, 0) + value
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets of durations recorded in integer nanoseconds, so an
+    observation is a bisection and two integer additions.
+
+    * `buckets` -
+        (*Tuple[float]*): The upper bounds of the buckets in seconds.
+
+    * `counts` -
+        (*List[int]*): The number of observations in each bucket, the last bucket has
+        no upper bound.
+
+    * `total` -
+        (*int*): The sum of the observations in nanoseconds.
+    """
+
+    __slots__ = ("buckets", "bounds", "counts", "total")
+
+    def __init__(self, buckets: Tuple[float] = LATENCY_BUCKETS) -> None:
+        self.buckets: Tuple[float] = buckets
+        self.bounds: List[int] = [round(bucket * 1e9) for bucket in buckets]
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.total: int = 0
+
+    def observe(self, duration: int) -> None:
+        """Record a duration in nanoseconds."""
+        self.counts[bisect.bisect_left(self.bounds, duration)] += 1
+        self.total += duration
+
+    def get_samples(self, samples: Samples, name: str) -> None:
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            add_sample(samples, f"{name}_bucket", cumulative, f'{{le="{bucket}"}}')
+        cumulative += self.counts[-1]
+        add_sample(samples, f"{name}_bucket", cumulative, '{le="+Inf"}')
+        add_sample(samples, f"{name}_sum", self.total / 1e9)
+        add_sample(samples, f"{name}_count", cumulative)
+
+
+class ServerMetrics:
+    """
+    The counters and latency histograms of the connections of a single event loop,
+    which are only updated from that loop and so are not locked.
+
+    * `connections`, `connections_closed` -
+        (*int*): The number of connections accepted and closed.
+
+    * `requests`, `streams` -
+        (*int*): The number of HTTP/1.1 requests and HTTP/2 streams received.
+
+    * `websocket_connections` -
+        (*int*): The number of WebSocket connections accepted.
+
+    * `bytes_received`, `bytes_sent` -
+        (*int*): The number of bytes read from and written to the transports.
+
+    * `parse_errors`, `app_errors` -
+        (*int*): The number of invalid requests and application exceptions.
+
+    * `write_pauses` -
+        (*int*): The number of times writing was paused.
+
+    * `header_parse`, `app_time`, `write_drain` -
+        (*Histogram*): The latency histograms.
+    """
+
+    __slots__ = (
+        "connections",
+        "connections_closed",
+        "requests",
+        "streams",
+        "websocket_connections",
+        "bytes_received",
+        "bytes_sent",
+        "parse_errors",
+        "app_errors",
+        "write_pauses",
+        "header_parse",
+        "app_time",
+        "write_drain",
+    )
+
+    def __init__(self) -> None:
+        self.connections: int = 0
+        self.connections_closed: int = 0
+        self.requests: int = 0
+        self.streams: int = 0
+        self.websocket_connections: int = 0
+        self.bytes_received: int = 0
+        self.bytes_sent: int = 0
+        self.parse_errors: int = 0
+        self.app_errors: int = 0
+        self.write_pauses: int = 0
+        self.header_parse: Histogram = Histogram()
+        self.app_time: Histogram = Histogram()
+        self.write_drain: Histogram = Histogram()
+
+    def get_samples(self, samples: Samples) -> None:
+        add_sample(samples, "aiobufpro_connections_total", self.connections)
+        add_sample(
+            samples,
+            "aiobufpro_connections_active",
+            self.connections - self.connections_closed,
+        )
+        add_sample(
+            samples, "aiobufpro_requests_total", self.requests, '{protocol="http/1.1"}'
+        )
+        add_sample(samples, "aiobufpro_requests_total", self.streams, '{protocol="h2"}')
+        add_sample(
+            samples,
+            "aiobufpro_websocket_connections_total",
+            self.websocket_connections,
+        )
+        add_sample(samples, "aiobufpro_received_bytes_total", self.bytes_received)
+        add_sample(samples, "aiobufpro_sent_bytes_total", self.bytes_sent)
+        add_sample(samples, "aiobufpro_parse_errors_total", self.parse_errors)
+        add_sample(samples, "aiobufpro_app_errors_total", self.app_errors)
+        add_sample(samples, "aiobufpro_write_pauses_total", self.write_pauses)
+        self.header_parse.get_samples(samples, "aiobufpro_header_parse_seconds")
+        self.app_time.get_samples(samples, "aiobufpro_app_seconds")
+        self.write_drain.get_samples(samples, "aiobufpro_write_drain_seconds")
+
+
+class MeteredTransport:
+    """
+    Wraps the transport of a connection to count the bytes written to it, so every
+    writer of the protocol's transport is counted without changes. The other transport
+    methods are passed through.
+    """
+
+    __slots__ = ("transport", "metrics")
+
+    def __init__(self, transport: asyncio.Transport, metrics: ServerMetrics) -> None:
+        self.transport: asyncio.Transport = transport
+        self.metrics: ServerMetrics = metrics
+
+    def write(self, data: bytes) -> None:
+        self.metrics.bytes_sent += len(data)
+        self.transport.write(data)
+
+    def writelines(self, list_of_data: List[bytes]) -> None:
+        self.metrics.bytes_sent += sum(map(len, list_of_data))
+        self.transport.writelines(list_of_data)
+
+    def __getattr__(self, name: str):
+        return getattr(self.transport, name)
+
+
+def get_component_samples(
+    samples: Samples,
+    target_cache=None,
+    response_cache=None,
+    compressor=None,
+    body_spooler=None,
+    ssl_context: ssl.SSLContext = None,
+    broadcast_hub=None,
+    heartbeat=None,
+    bus=None,
+    slow_callback_monitor=None,
+    lag_monitor=None,
+) -> None:
+    """Add the counters the optional server components already keep."""
+    if target_cache is not None:
+        name = "aiobufpro_target_cache_lookups_total"
+        add_sample(samples, name, target_cache.hits, '{result="hit"}')
+        add_sample(samples, name, target_cache.misses, '{result="miss"}')
+    if response_cache is not None:
+        name = "aiobufpro_response_cache_lookups_total"
+        add_sample(samples, name, response_cache.hits, '{result="hit"}')
+        add_sample(samples, name, response_cache.misses, '{result="miss"}')
+        add_sample(samples, name, response_cache.coalesced, '{result="coalesced"}')
+        add_sample(samples, "aiobufpro_response_cache_bytes", response_cache.size)
+        add_sample(
+            samples,
+            "aiobufpro_response_cache_evictions_total",
+            response_cache.evictions,
+        )
+    if compressor is not None:
+        name = "aiobufpro_compression_bytes_total"
+        add_sample(
+            samples, "aiobufpro_compression_responses_total", compressor.responses
+        )
+        add_sample(samples, name, compressor.bytes_in, '{stage="in"}')
+        add_sample(samples, name, compressor.bytes_out, '{stage="out"}')
+        add_sample(
+            samples, "aiobufpro_compression_cpu_seconds_total", compressor.cpu_time
+        )
+    if body_spooler is not None:
+        name = "aiobufpro_body_spooled_total"
+        add_sample(samples, name, body_spooler.spooled, '{storage="any"}')
+        add_sample(samples, name, body_spooler.rolled_over, '{storage="disk"}')
+        add_sample(samples, "aiobufpro_body_memory_bytes", body_spooler.memory_used)
+    if ssl_context is not None:
+        stats = get_session_stats(ssl_context)
+        name = "aiobufpro_tls_handshakes_total"
+        add_sample(samples, name, stats["accepted"], '{session="any"}')
+        add_sample(samples, name, stats["session_hits"], '{session="resumed"}')
+    if broadcast_hub is not None:
+        name = "aiobufpro_broadcast_frames_total"
+        for outcome in ("delivered", "skipped", "queued", "dropped"):
+            value = getattr(broadcast_hub, outcome)
+            add_sample(samples, name, value, f'{{outcome="{outcome}"}}')
+    if heartbeat is not None:
+        name = "aiobufpro_websocket_pings_total"
+        add_sample(samples, name, heartbeat.pings_sent, '{event="ping"}')
+        add_sample(samples, name, heartbeat.pongs_received, '{event="pong"}')
+        add_sample(samples, name, heartbeat.reaped, '{event="timeout"}')
+    if bus is not None:
+        name = "aiobufpro_bus_frames_total"
+        add_sample(samples, name, bus.forwarded, '{direction="sent"}')
+        add_sample(samples, name, bus.received, '{direction="received"}')
+    if slow_callback_monitor is not None:
+        add_sample(
+            samples,
+            "aiobufpro_slow_callbacks_total",
+            slow_callback_monitor.slow_callbacks,
+        )
+    if lag_monitor is not None:
+        labels = f'{{loop="{lag_monitor.name}"}}'
+        add_sample(samples, "aiobufpro_event_loop_lag_seconds", lag_monitor.lag, labels)
+        add_sample(
+            samples, "aiobufpro_load_shedding", int(lag_monitor.shedding), labels
+        )
+        name = "aiobufpro_shed_total"
+        add_sample(samples, name, lag_monitor.shed_requests, '{action="reject"}')
+        add_sample(samples, name, lag_monitor.closed_idle, '{action="close-idle"}')
+        add_sample(samples, "aiobufpro_shed_periods_total", lag_monitor.shed_periods)
+
+
+def get_family(sample_name: str) -> str:
+    if sample_name in METRIC_FAMILIES:
+        return sample_name
+    return sample_name.rsplit("_", 1)[0]
+
+
+def render_metrics(samples: Samples) -> bytes:
+    """Serialize the samples in the Prometheus text exposition format."""
+    families: Dict[str, List[str]] = {}
+    for (name, labels), value in samples.items():
+        if isinstance(value, float) and not value.is_integer():
+            value = repr(value)
+        else:
+            value = int(value)
+        families.setdefault(get_family(name), []).append(f"{name}{labels} {value}")
+
+    lines = []
+    for family, (metric_type, help_text) in METRIC_FAMILIES.items():
+        family_lines = families.get(family)
+        if family_lines:
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            lines.extend(family_lines)
+    lines.append("")
+    return "\n".join(lines).encode()
+
+
+class MetricsProtocol(asyncio.Protocol):
+    """
+    Answers `GET /metrics` on the admin listener with the samples returned by the
+    `collect` callable, then closes the connection.
+    """
+
+    def __init__(self, collect: Callable[[], Samples]) -> None:
+        self.collect: Callable[[], Samples] = collect
+        self.buffer: bytearray = bytearray()
+        self.transport: asyncio.Transport = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self.buffer += data
+        if b"\r\n\r\n" not in self.buffer:
+            if len(self.buffer) > 8192:
+                self.transport.close()
+            return
+
+        request_line = bytes(self.buffer.split(b"\r\n", 1)[0]).split()
+        headers = [(b"connection", b"close")]
+        if (
+            len(request_line) == 3
+            and request_line[0] == b"GET"
+            and request_line[1].split(b"?", 1)[0] == b"/metrics"
+        ):
+            try:
+                body = render_metrics(self.collect())
+            except Exception:
+                logger.exception("Exception collecting metrics")
+                response = build_response(500, headers, b"")
+            else:
+                headers.append((b"content-type", b"text/plain; version=0.0.4"))
+                response = build_response(200, headers, body)
+        else:
+            response = build_response(404, headers, b"")
+        self.transport.write(response)
+        self.transport.close()
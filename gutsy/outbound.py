@@ -0,0 +1,198 @@
+import asyncio
+import collections
+import enum
+import logging
+import struct
+from typing import Deque, Dict
+
+from aiobufpro.parsers.websocket import (
+    WebSocketCloseCode,
+    WebSocketOpcode,
+    build_frame,
+)
+
+logger = logging.getLogger()
+
+
+POLICY_VIOLATION_FRAME = build_frame(
+    struct.pack("!H", WebSocketCloseCode.POLICY_VIOLATION.value),
+    opcode=WebSocketOpcode.CLOSE,
+)
+
+
+class SlowConsumerPolicy(enum.Enum):
+    """
+    Determines what happens when a frame would take the outbound queue of a connection
+    over its byte limit.
+
+    * `BLOCK` - The sender waits until the queue has drained enough to fit the frame.
+
+    * `DROP_OLDEST` - The oldest queued frames are discarded to make room.
+
+    * `CLOSE` - The connection is closed with a 1008 (policy violation) close frame.
+    """
+
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    CLOSE = "close"
+
+
+class OutboundQueue:
+    """
+    Bounded queue of the frames waiting to be written to a WebSocket connection.
+
+    Frames are not written immediately, a flush is scheduled for the next loop
+    iteration so that every frame queued during the current iteration is written with a
+    single `writelines` call. While the transport has paused writing, frames are held
+    until `resume_writing` flushes the queue.
+
+    * `limit` -
+        (*int*): The maximum number of queued bytes.
+
+    * `policy` -
+        (*SlowConsumerPolicy*): How frames that exceed the limit are handled.
+
+    * `frames` -
+        (*Deque[bytes]*): The frames waiting to be written.
+
+    * `queued_bytes` -
+        (*int*): The total size of the queued frames.
+
+    * `dropped` -
+        (*int*): The number of frames discarded by the `DROP_OLDEST` policy.
+
+    * `closed` -
+        (*int*): Set to 1 when the connection was closed by the `CLOSE` policy.
+    """
+
+    def __init__(
+        self,
+        protocol,
+        limit: int = 1048576,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.BLOCK,
+    ) -> None:
+        self.protocol = protocol
+        self.limit: int = limit
+        self.policy: SlowConsumerPolicy = policy
+        self.frames: Deque[bytes] = collections.deque()
+        self.queued_bytes: int = 0
+        self.dropped: int = 0
+        self.closed: int = 0
+        self.closing: bool = False
+        self.flush_handle: asyncio.Handle = None
+        self.space_waiter: asyncio.Event = None
+
+    def stats(self) -> Dict[str, int]:
+        """The current queue statistics for the connection."""
+        return {
+            "depth": len(self.frames),
+            "queued_bytes": self.queued_bytes,
+            "dropped": self.dropped,
+            "closed": self.closed,
+        }
+
+    def is_full(self, frame_size: int) -> bool:
+        # A frame larger than the limit is still accepted by an empty queue.
+        return bool(self.frames) and self.queued_bytes + frame_size > self.limit
+
+    async def put(self, frame: bytes) -> bool:
+        """
+        Queue a frame sent by the application, waiting for the queue to drain when the
+        `BLOCK` policy is used.
+        """
+        if self.policy is SlowConsumerPolicy.BLOCK:
+            while self.is_full(len(frame)) and not self.closing:
+                if self.space_waiter is None:
+                    self.space_waiter = asyncio.Event()
+                self.space_waiter.clear()
+                await self.space_waiter.wait()
+        return self.put_nowait(frame)
+
+    def put_nowait(self, frame: bytes) -> bool:
+        """
+        Queue a frame without waiting. Returns `False` if the frame was not queued,
+        either because the connection is closing or because the queue is full and the
+        `BLOCK` policy is used.
+        """
+        if self.closing:
+            return False
+
+        frame_size = len(frame)
+        if self.is_full(frame_size):
+            if self.policy is SlowConsumerPolicy.BLOCK:
+                return False
+
+            elif self.policy is SlowConsumerPolicy.DROP_OLDEST:
+                while self.is_full(frame_size):
+                    self.queued_bytes -= len(self.frames.popleft())
+                    self.dropped += 1
+
+            else:
+                self.close_slow_consumer()
+                return False
+
+        self.frames.append(frame)
+        self.queued_bytes += frame_size
+        self.schedule_flush()
+        return True
+
+    def schedule_flush(self) -> None:
+        if self.flush_handle is None and not self.protocol.write_paused:
+            loop = asyncio.get_event_loop()
+            self.flush_handle = loop.call_soon(self.flush)
+
+    def flush(self) -> None:
+        """
+        Write every queued frame to the transport. Called once per loop iteration while
+        there are frames queued, and when the transport resumes writing.
+        """
+        self.flush_handle = None
+        if self.protocol.write_paused:
+            return
+
+        if self.frames:
+            self.protocol.transport.writelines(self.frames)
+            self.frames.clear()
+            self.queued_bytes = 0
+            if self.space_waiter is not None:
+                self.space_waiter.set()
+
+        if self.closing:
+            self.protocol.transport.close()
+
+    def close(self, frame: bytes) -> None:
+        """
+        Queue the final close frame, the transport is closed once it has been written.
+        """
+        self.put_nowait(frame)
+        self.closing = True
+        if self.space_waiter is not None:
+            self.space_waiter.set()
+
+    def abort(self) -> None:
+        """Called when the connection is lost, releasing any blocked senders."""
+        self.frames.clear()
+        self.queued_bytes = 0
+        self.closing = True
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if self.space_waiter is not None:
+            self.space_waiter.set()
+
+    def close_slow_consumer(self) -> None:
+        """Discard the queued frames and close the connection with a 1008 frame."""
+        logger.debug("Closing slow WebSocket consumer %s", self.protocol.client)
+        self.frames.clear()
+        self.queued_bytes = 0
+        self.closed = 1
+        self.closing = True
+        if self.space_waiter is not None:
+            self.space_waiter.set()
+
+        transport = self.protocol.transport
+        transport.write(POLICY_VIOLATION_FRAME)
+        transport.close()
+        self.protocol.asgi_connection.disconnect(
+            WebSocketCloseCode.POLICY_VIOLATION.value
+        )
@@ -0,0 +1,227 @@
+import asyncio
+import enum
+import logging
+from typing import FrozenSet, List, Set
+
+from aiobufpro.fastpath import StaticResponse
+
+logger = logging.getLogger()
+
+
+# The response to requests received while shedding load, the client may retry it once
+# the server has recovered.
+SHED_RESPONSE = StaticResponse(
+    503,
+    [
+        (b"content-type", b"text/plain; charset=utf-8"),
+        (b"retry-after", b"1"),
+        (b"connection", b"close"),
+    ],
+    b"Service Unavailable",
+)
+
+# The weight of the previous lag when a sample is lower, so the lag rises with the first
+# late sample and falls over several samples once the loop has caught up.
+LAG_DECAY = 0.8
+
+
+class ShedAction(enum.Enum):
+    """
+    How load is shed while the event loop lag is over the threshold.
+
+    * `REJECT` - New requests are answered with a 503 response and the connection is
+        closed, and new HTTP/2 streams are refused.
+
+    * `PAUSE_ACCEPT` - The listening sockets stop accepting connections, which wait in
+        the backlog until the server has recovered. Only supported by the asyncio
+        selector event loops.
+
+    * `CLOSE_IDLE` - Keep-alive connections without a request in progress are closed.
+    """
+
+    REJECT = "reject"
+    PAUSE_ACCEPT = "pause-accept"
+    CLOSE_IDLE = "close-idle"
+
+
+def can_pause_serving(server: asyncio.AbstractServer) -> bool:
+    """
+    Whether accepting connections can be paused on a server. asyncio has no public API
+    to pause a server without closing its listening sockets, so this is only supported
+    by the servers of the asyncio selector event loops, whose listening sockets are
+    watched with `add_reader`. The servers of other event loops, such as uvloop and the
+    proactor event loop on Windows, keep accepting connections.
+    """
+    return isinstance(server, asyncio.base_events.Server) and isinstance(
+        server.get_loop(), asyncio.selector_events.BaseSelectorEventLoop
+    )
+
+
+def pause_serving(server: asyncio.AbstractServer) -> None:
+    """
+    Stop accepting connections on the listening sockets of a server, leaving them open.
+    The server is marked as not serving so that `start_serving` resumes it.
+    """
+    loop = server.get_loop()
+    for sock in server.sockets:
+        loop.remove_reader(sock.fileno())
+    server._serving = False
+
+
+def resume_serving(server: asyncio.AbstractServer) -> None:
+    server.get_loop().create_task(server.start_serving())
+
+
+class LoopLagMonitor:
+    """
+    Samples the lag of an event loop, the delay between when a timer was scheduled to
+    run and when the loop ran it, and sheds load while the lag is over the threshold.
+    Shedding stops once the lag has fallen below the lower recovery threshold, so the
+    server does not switch on every sample close to the threshold.
+
+    * `threshold` -
+        (*float*): The lag in seconds that starts shedding load.
+
+    * `recover_threshold` -
+        (*float*): The lag in seconds below which shedding stops.
+
+    * `interval` -
+        (*float*): The seconds between samples.
+
+    * `actions` -
+        (*FrozenSet[ShedAction]*): How load is shed.
+
+    * `name` -
+        (*str*): The name of the event loop in the metrics.
+
+    * `lag` -
+        (*float*): The current lag in seconds, decayed over several samples.
+
+    * `max_lag` -
+        (*float*): The highest lag sampled.
+
+    * `shedding` -
+        (*bool*): Whether load is currently being shed.
+
+    * `shed_periods` -
+        (*int*): The number of times shedding started.
+
+    * `shed_requests` -
+        (*int*): The requests and HTTP/2 streams rejected.
+
+    * `closed_idle` -
+        (*int*): The idle connections closed.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        recover_threshold: float = None,
+        interval: float = 0.05,
+        actions: FrozenSet[ShedAction] = frozenset((ShedAction.REJECT,)),
+        name: str = "0",
+    ) -> None:
+        if recover_threshold is None:
+            recover_threshold = threshold / 2
+        if recover_threshold > threshold:
+            raise ValueError("The recovery threshold cannot exceed the threshold")
+        self.threshold: float = threshold
+        self.recover_threshold: float = recover_threshold
+        self.interval: float = interval
+        self.actions: FrozenSet[ShedAction] = frozenset(actions)
+        self.name: str = name
+        self.lag: float = 0.0
+        self.max_lag: float = 0.0
+        self.shedding: bool = False
+        self.shed_periods: int = 0
+        self.shed_requests: int = 0
+        self.closed_idle: int = 0
+        self.servers: List[asyncio.AbstractServer] = []
+        self.connections: Set = set()
+        self.loop: asyncio.AbstractEventLoop = None
+        self.expected: float = None
+        self.timer: asyncio.TimerHandle = None
+
+    def start(self) -> None:
+        """Start sampling the running event loop."""
+        self.loop = asyncio.get_running_loop()
+        if ShedAction.PAUSE_ACCEPT in self.actions and not all(
+            can_pause_serving(server) for server in self.servers
+        ):
+            logger.warning(
+                f"Accepting connections cannot be paused with {type(self.loop)}, "
+                "connections are accepted while shedding load"
+            )
+        self.schedule(self.loop.time())
+
+    def stop(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.shedding:
+            self.stop_shedding()
+
+    def schedule(self, now: float) -> None:
+        self.expected = now + self.interval
+        self.timer = self.loop.call_at(self.expected, self.on_sample)
+
+    def on_sample(self) -> None:
+        now = self.loop.time()
+        sample = max(now - self.expected, 0.0)
+        self.lag = max(sample, self.lag * LAG_DECAY)
+        if sample > self.max_lag:
+            self.max_lag = sample
+
+        if self.shedding:
+            if self.lag < self.recover_threshold:
+                self.stop_shedding()
+            elif ShedAction.CLOSE_IDLE in self.actions:
+                # Connections that completed a response since the last sample.
+                self.close_idle()
+        elif self.lag >= self.threshold:
+            self.start_shedding()
+        self.schedule(now)
+
+    def start_shedding(self) -> None:
+        self.shedding = True
+        self.shed_periods += 1
+        logger.warning(
+            f"Event loop lag of {self.lag:.3f} seconds, shedding load with "
+            + ", ".join(sorted(action.value for action in self.actions))
+        )
+        if ShedAction.PAUSE_ACCEPT in self.actions:
+            for server in self.servers:
+                if can_pause_serving(server):
+                    pause_serving(server)
+        if ShedAction.CLOSE_IDLE in self.actions:
+            self.close_idle()
+
+    def stop_shedding(self) -> None:
+        self.shedding = False
+        logger.warning(f"Event loop lag of {self.lag:.3f} seconds, stopped shedding")
+        if ShedAction.PAUSE_ACCEPT in self.actions:
+            for server in self.servers:
+                if server.sockets and can_pause_serving(server):
+                    resume_serving(server)
+
+    def should_reject(self) -> bool:
+        """Whether a new request should be rejected, counting it if so."""
+        if self.shedding and ShedAction.REJECT in self.actions:
+            self.shed_requests += 1
+            return True
+        return False
+
+    def close_idle(self) -> None:
+        for protocol in list(self.connections):
+            if protocol.close_if_idle():
+                self.closed_idle += 1
+
+    def stats(self) -> dict:
+        return {
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "shedding": self.shedding,
+            "shed_periods": self.shed_periods,
+            "shed_requests": self.shed_requests,
+            "closed_idle": self.closed_idle,
+        }
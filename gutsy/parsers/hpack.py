@@ -0,0 +1,616 @@
+import collections
+from typing import Deque, Dict, List, Tuple
+
+
+class HPACKError(Exception):
+    """Raised when a header block cannot be decoded."""
+
+
+# The static table of RFC 7541 Appendix A, index 1 is the first entry.
+STATIC_TABLE = (
+    (b":authority", b""),
+    (b":method", b"GET"),
+    (b":method", b"POST"),
+    (b":path", b"/"),
+    (b":path", b"/index.html"),
+    (b":scheme", b"http"),
+    (b":scheme", b"https"),
+    (b":status", b"200"),
+    (b":status", b"204"),
+    (b":status", b"206"),
+    (b":status", b"304"),
+    (b":status", b"400"),
+    (b":status", b"404"),
+    (b":status", b"500"),
+    (b"accept-charset", b""),
+    (b"accept-encoding", b"gzip, deflate"),
+    (b"accept-language", b""),
+    (b"accept-ranges", b""),
+    (b"accept", b""),
+    (b"access-control-allow-origin", b""),
+    (b"age", b""),
+    (b"allow", b""),
+    (b"authorization", b""),
+    (b"cache-control", b""),
+    (b"content-disposition", b""),
+    (b"content-encoding", b""),
+    (b"content-language", b""),
+    (b"content-length", b""),
+    (b"content-location", b""),
+    (b"content-range", b""),
+    (b"content-type", b""),
+    (b"cookie", b""),
+    (b"date", b""),
+    (b"etag", b""),
+    (b"expect", b""),
+    (b"expires", b""),
+    (b"from", b""),
+    (b"host", b""),
+    (b"if-match", b""),
+    (b"if-modified-since", b""),
+    (b"if-none-match", b""),
+    (b"if-range", b""),
+    (b"if-unmodified-since", b""),
+    (b"last-modified", b""),
+    (b"link", b""),
+    (b"location", b""),
+    (b"max-forwards", b""),
+    (b"proxy-authenticate", b""),
+    (b"proxy-authorization", b""),
+    (b"range", b""),
+    (b"referer", b""),
+    (b"refresh", b""),
+    (b"retry-after", b""),
+    (b"server", b""),
+    (b"set-cookie", b""),
+    (b"strict-transport-security", b""),
+    (b"transfer-encoding", b""),
+    (b"user-agent", b""),
+    (b"vary", b""),
+    (b"via", b""),
+    (b"www-authenticate", b""),
+)
+
+STATIC_TABLE_SIZE = len(STATIC_TABLE)
+
+# The static table indexes of complete entries, and of the first entry for each name.
+STATIC_INDEXES: Dict[Tuple[bytes, bytes], int] = {
+    entry: index for index, entry in enumerate(STATIC_TABLE, start=1) if entry[1]
+}
+STATIC_NAME_INDEXES: Dict[bytes, int] = {}
+for index, (name, _) in enumerate(STATIC_TABLE, start=1):
+    STATIC_NAME_INDEXES.setdefault(name, index)
+
+# The Huffman code and its length in bits for each byte value of RFC 7541 Appendix B,
+# the last entry is the end-of-string symbol.
+HUFFMAN_CODES = (
+    (0x1FF8, 13),
+    (0x7FFFD8, 23),
+    (0xFFFFFE2, 28),
+    (0xFFFFFE3, 28),
+    (0xFFFFFE4, 28),
+    (0xFFFFFE5, 28),
+    (0xFFFFFE6, 28),
+    (0xFFFFFE7, 28),
+    (0xFFFFFE8, 28),
+    (0xFFFFEA, 24),
+    (0x3FFFFFFC, 30),
+    (0xFFFFFE9, 28),
+    (0xFFFFFEA, 28),
+    (0x3FFFFFFD, 30),
+    (0xFFFFFEB, 28),
+    (0xFFFFFEC, 28),
+    (0xFFFFFED, 28),
+    (0xFFFFFEE, 28),
+    (0xFFFFFEF, 28),
+    (0xFFFFFF0, 28),
+    (0xFFFFFF1, 28),
+    (0xFFFFFF2, 28),
+    (0x3FFFFFFE, 30),
+    (0xFFFFFF3, 28),
+    (0xFFFFFF4, 28),
+    (0xFFFFFF5, 28),
+    (0xFFFFFF6, 28),
+    (0xFFFFFF7, 28),
+    (0xFFFFFF8, 28),
+    (0xFFFFFF9, 28),
+    (0xFFFFFFA, 28),
+    (0xFFFFFFB, 28),
+    (0x14, 6),
+    (0x3F8, 10),
+    (0x3F9, 10),
+    (0xFFA, 12),
+    (0x1FF9, 13),
+    (0x15, 6),
+    (0xF8, 8),
+    (0x7FA, 11),
+    (0x3FA, 10),
+    (0x3FB, 10),
+    (0xF9, 8),
+    (0x7FB, 11),
+    (0xFA, 8),
+    (0x16, 6),
+    (0x17, 6),
+    (0x18, 6),
+    (0x0, 5),
+    (0x1, 5),
+    (0x2, 5),
+    (0x19, 6),
+    (0x1A, 6),
+    (0x1B, 6),
+    (0x1C, 6),
+    (0x1D, 6),
+    (0x1E, 6),
+    (0x1F, 6),
+    (0x5C, 7),
+    (0xFB, 8),
+    (0x7FFC, 15),
+    (0x20, 6),
+    (0xFFB, 12),
+    (0x3FC, 10),
+    (0x1FFA, 13),
+    (0x21, 6),
+    (0x5D, 7),
+    (0x5E, 7),
+    (0x5F, 7),
+    (0x60, 7),
+    (0x61, 7),
+    (0x62, 7),
+    (0x63, 7),
+    (0x64, 7),
+    (0x65, 7),
+    (0x66, 7),
+    (0x67, 7),
+    (0x68, 7),
+    (0x69, 7),
+    (0x6A, 7),
+    (0x6B, 7),
+    (0x6C, 7),
+    (0x6D, 7),
+    (0x6E, 7),
+    (0x6F, 7),
+    (0x70, 7),
+    (0x71, 7),
+    (0x72, 7),
+    (0xFC, 8),
+    (0x73, 7),
+    (0xFD, 8),
+    (0x1FFB, 13),
+    (0x7FFF0, 19),
+    (0x1FFC, 13),
+    (0x3FFC, 14),
+    (0x22, 6),
+    (0x7FFD, 15),
+    (0x3, 5),
+    (0x23, 6),
+    (0x4, 5),
+    (0x24, 6),
+    (0x5, 5),
+    (0x25, 6),
+    (0x26, 6),
+    (0x27, 6),
+    (0x6, 5),
+    (0x74, 7),
+    (0x75, 7),
+    (0x28, 6),
+    (0x29, 6),
+    (0x2A, 6),
+    (0x7, 5),
+    (0x2B, 6),
+    (0x76, 7),
+    (0x2C, 6),
+    (0x8, 5),
+    (0x9, 5),
+    (0x2D, 6),
+    (0x77, 7),
+    (0x78, 7),
+    (0x79, 7),
+    (0x7A, 7),
+    (0x7B, 7),
+    (0x7FFE, 15),
+    (0x7FC, 11),
+    (0x3FFD, 14),
+    (0x1FFD, 13),
+    (0xFFFFFFC, 28),
+    (0xFFFE6, 20),
+    (0x3FFFD2, 22),
+    (0xFFFE7, 20),
+    (0xFFFE8, 20),
+    (0x3FFFD3, 22),
+    (0x3FFFD4, 22),
+    (0x3FFFD5, 22),
+    (0x7FFFD9, 23),
+    (0x3FFFD6, 22),
+    (0x7FFFDA, 23),
+    (0x7FFFDB, 23),
+    (0x7FFFDC, 23),
+    (0x7FFFDD, 23),
+    (0x7FFFDE, 23),
+    (0xFFFFEB, 24),
+    (0x7FFFDF, 23),
+    (0xFFFFEC, 24),
+    (0xFFFFED, 24),
+    (0x3FFFD7, 22),
+    (0x7FFFE0, 23),
+    (0xFFFFEE, 24),
+    (0x7FFFE1, 23),
+    (0x7FFFE2, 23),
+    (0x7FFFE3, 23),
+    (0x7FFFE4, 23),
+    (0x1FFFDC, 21),
+    (0x3FFFD8, 22),
+    (0x7FFFE5, 23),
+    (0x3FFFD9, 22),
+    (0x7FFFE6, 23),
+    (0x7FFFE7, 23),
+    (0xFFFFEF, 24),
+    (0x3FFFDA, 22),
+    (0x1FFFDD, 21),
+    (0xFFFE9, 20),
+    (0x3FFFDB, 22),
+    (0x3FFFDC, 22),
+    (0x7FFFE8, 23),
+    (0x7FFFE9, 23),
+    (0x1FFFDE, 21),
+    (0x7FFFEA, 23),
+    (0x3FFFDD, 22),
+    (0x3FFFDE, 22),
+    (0xFFFFF0, 24),
+    (0x1FFFDF, 21),
+    (0x3FFFDF, 22),
+    (0x7FFFEB, 23),
+    (0x7FFFEC, 23),
+    (0x1FFFE0, 21),
+    (0x1FFFE1, 21),
+    (0x3FFFE0, 22),
+    (0x1FFFE2, 21),
+    (0x7FFFED, 23),
+    (0x3FFFE1, 22),
+    (0x7FFFEE, 23),
+    (0x7FFFEF, 23),
+    (0xFFFEA, 20),
+    (0x3FFFE2, 22),
+    (0x3FFFE3, 22),
+    (0x3FFFE4, 22),
+    (0x7FFFF0, 23),
+    (0x3FFFE5, 22),
+    (0x3FFFE6, 22),
+    (0x7FFFF1, 23),
+    (0x3FFFFE0, 26),
+    (0x3FFFFE1, 26),
+    (0xFFFEB, 20),
+    (0x7FFF1, 19),
+    (0x3FFFE7, 22),
+    (0x7FFFF2, 23),
+    (0x3FFFE8, 22),
+    (0x1FFFFEC, 25),
+    (0x3FFFFE2, 26),
+    (0x3FFFFE3, 26),
+    (0x3FFFFE4, 26),
+    (0x7FFFFDE, 27),
+    (0x7FFFFDF, 27),
+    (0x3FFFFE5, 26),
+    (0xFFFFF1, 24),
+    (0x1FFFFED, 25),
+    (0x7FFF2, 19),
+    (0x1FFFE3, 21),
+    (0x3FFFFE6, 26),
+    (0x7FFFFE0, 27),
+    (0x7FFFFE1, 27),
+    (0x3FFFFE7, 26),
+    (0x7FFFFE2, 27),
+    (0xFFFFF2, 24),
+    (0x1FFFE4, 21),
+    (0x1FFFE5, 21),
+    (0x3FFFFE8, 26),
+    (0x3FFFFE9, 26),
+    (0xFFFFFFD, 28),
+    (0x7FFFFE3, 27),
+    (0x7FFFFE4, 27),
+    (0x7FFFFE5, 27),
+    (0xFFFEC, 20),
+    (0xFFFFF3, 24),
+    (0xFFFED, 20),
+    (0x1FFFE6, 21),
+    (0x3FFFE9, 22),
+    (0x1FFFE7, 21),
+    (0x1FFFE8, 21),
+    (0x7FFFF3, 23),
+    (0x3FFFEA, 22),
+    (0x3FFFEB, 22),
+    (0x1FFFFEE, 25),
+    (0x1FFFFEF, 25),
+    (0xFFFFF4, 24),
+    (0xFFFFF5, 24),
+    (0x3FFFFEA, 26),
+    (0x7FFFF4, 23),
+    (0x3FFFFEB, 26),
+    (0x7FFFFE6, 27),
+    (0x3FFFFEC, 26),
+    (0x3FFFFED, 26),
+    (0x7FFFFE7, 27),
+    (0x7FFFFE8, 27),
+    (0x7FFFFE9, 27),
+    (0x7FFFFEA, 27),
+    (0x7FFFFEB, 27),
+    (0xFFFFFFE, 28),
+    (0x7FFFFEC, 27),
+    (0x7FFFFED, 27),
+    (0x7FFFFEE, 27),
+    (0x7FFFFEF, 27),
+    (0x7FFFFF0, 27),
+    (0x3FFFFEE, 26),
+    (0x3FFFFFFF, 30),
+)
+
+HUFFMAN_EOS = 256
+
+# Maps the length and value of each code to its symbol.
+HUFFMAN_SYMBOLS: Dict[Tuple[int, int], int] = {
+    (length, code): symbol for symbol, (code, length) in enumerate(HUFFMAN_CODES)
+}
+
+
+def huffman_encode(data: bytes) -> bytes:
+    value = 0
+    length = 0
+    for byte in data:
+        code, code_length = HUFFMAN_CODES[byte]
+        value = (value << code_length) | code
+        length += code_length
+
+    # The final byte is padded with the most significant bits of the EOS code.
+    padding = -length % 8
+    value = (value << padding) | ((1 << padding) - 1)
+    return value.to_bytes((length + padding) // 8, "big")
+
+
+def huffman_decode(data: bytes) -> bytes:
+    decoded = bytearray()
+    code = 0
+    length = 0
+    for byte in data:
+        for shift in range(7, -1, -1):
+            code = (code << 1) | ((byte >> shift) & 1)
+            length += 1
+            # The shortest code is 5 bits.
+            if length < 5:
+                continue
+            symbol = HUFFMAN_SYMBOLS.get((length, code))
+            if symbol is not None:
+                if symbol == HUFFMAN_EOS:
+                    raise HPACKError("Huffman string contains EOS")
+                decoded.append(symbol)
+                code = 0
+                length = 0
+
+    if length > 7 or code != (1 << length) - 1:
+        raise HPACKError("Invalid Huffman padding")
+    return bytes(decoded)
+
+
+def encode_integer(value: int, prefix_bits: int, flags: int) -> bytes:
+    """Encode an integer with an N-bit prefix, the flags are the high prefix bits."""
+    max_prefix = (1 << prefix_bits) - 1
+    if value < max_prefix:
+        return bytes([flags | value])
+
+    encoded = bytearray([flags | max_prefix])
+    value -= max_prefix
+    while value >= 128:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def decode_integer(data: bytes, pos: int, prefix_bits: int) -> Tuple[int, int]:
+    """Decode an integer with an N-bit prefix, returning the value and next position."""
+    max_prefix = (1 << prefix_bits) - 1
+    value = data[pos] & max_prefix
+    pos += 1
+    if value < max_prefix:
+        return value, pos
+
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise HPACKError("Truncated integer")
+        byte = data[pos]
+        pos += 1
+        value += (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+        if shift > 28:
+            raise HPACKError("Integer overflow")
+
+
+def encode_string(value: bytes) -> bytes:
+    """Encode a string literal, Huffman encoded if that is shorter."""
+    encoded = huffman_encode(value)
+    if len(encoded) < len(value):
+        return encode_integer(len(encoded), 7, 0x80) + encoded
+    return encode_integer(len(value), 7, 0x00) + value
+
+
+# Decoded Huffman strings keyed by their encoded bytes. Header values such as the
+# user-agent repeat on every request of clients that do not index them.
+HUFFMAN_DECODE_CACHE: Dict[bytes, bytes] = {}
+HUFFMAN_DECODE_CACHE_SIZE = 1024
+HUFFMAN_DECODE_CACHE_MAX_LENGTH = 256
+
+
+def decode_string(data: bytes, pos: int) -> Tuple[bytes, int]:
+    if pos >= len(data):
+        raise HPACKError("Truncated string")
+    huffman = data[pos] & 0x80
+    length, pos = decode_integer(data, pos, 7)
+    end = pos + length
+    if end > len(data):
+        raise HPACKError("Truncated string")
+    value = bytes(data[pos:end])
+    if huffman:
+        decoded = HUFFMAN_DECODE_CACHE.get(value)
+        if decoded is None:
+            decoded = huffman_decode(value)
+            if length <= HUFFMAN_DECODE_CACHE_MAX_LENGTH:
+                if len(HUFFMAN_DECODE_CACHE) >= HUFFMAN_DECODE_CACHE_SIZE:
+                    HUFFMAN_DECODE_CACHE.clear()
+                HUFFMAN_DECODE_CACHE[value] = decoded
+        value = decoded
+    return value, end
+
+
+class HPACKDecoder:
+    """
+    Decode the header blocks of a connection, maintaining the dynamic table shared by
+    every header block received on the connection.
+
+    * `max_table_size` -
+        (*int*): The dynamic table size advertised in the server settings, the encoder
+        may use a smaller table.
+
+    * `max_header_list_size` -
+        (*int*): The maximum size of a decoded header list.
+
+    * `table` -
+        (*Deque[Tuple[bytes, bytes]]*): The dynamic table, newest entry first.
+
+    * `table_size` -
+        (*int*): The current size of the dynamic table.
+    """
+
+    __slots__ = (
+        "max_table_size",
+        "table_size_limit",
+        "max_header_list_size",
+        "table",
+        "table_size",
+    )
+
+    def __init__(
+        self, max_table_size: int = 4096, max_header_list_size: int = 65536
+    ) -> None:
+        self.max_table_size: int = max_table_size
+        self.table_size_limit: int = max_table_size
+        self.max_header_list_size: int = max_header_list_size
+        self.table: Deque[Tuple[bytes, bytes]] = collections.deque()
+        self.table_size: int = 0
+
+    def get_entry(self, index: int) -> Tuple[bytes, bytes]:
+        if index == 0:
+            raise HPACKError("Invalid index 0")
+        if index <= STATIC_TABLE_SIZE:
+            return STATIC_TABLE[index - 1]
+        try:
+            return self.table[index - STATIC_TABLE_SIZE - 1]
+        except IndexError:
+            raise HPACKError(f"Invalid index {index}")
+
+    def add_entry(self, name: bytes, value: bytes) -> None:
+        size = len(name) + len(value) + 32
+        self.table.appendleft((name, value))
+        self.table_size += size
+        self.evict()
+
+    def evict(self) -> None:
+        table = self.table
+        while self.table_size > self.table_size_limit and table:
+            name, value = table.pop()
+            self.table_size -= len(name) + len(value) + 32
+
+    def decode(self, data: bytes) -> List[Tuple[bytes, bytes]]:
+        """Decode a complete header block into a list of header name/value pairs."""
+        headers = []
+        header_list_size = 0
+        pos = 0
+        data_len = len(data)
+
+        while pos < data_len:
+            byte = data[pos]
+
+            if byte & 0x80:
+                # Indexed header field.
+                index, pos = decode_integer(data, pos, 7)
+                name, value = self.get_entry(index)
+
+            elif byte & 0x40:
+                # Literal header field with incremental indexing.
+                index, pos = decode_integer(data, pos, 6)
+                if index:
+                    name = self.get_entry(index)[0]
+                else:
+                    name, pos = decode_string(data, pos)
+                value, pos = decode_string(data, pos)
+                self.add_entry(name, value)
+
+            elif byte & 0x20:
+                # Dynamic table size update.
+                size, pos = decode_integer(data, pos, 5)
+                if size > self.max_table_size:
+                    raise HPACKError("Dynamic table size update exceeds the limit")
+                self.table_size_limit = size
+                self.evict()
+                continue
+
+            else:
+                # Literal header field without indexing or never indexed.
+                index, pos = decode_integer(data, pos, 4)
+                if index:
+                    name = self.get_entry(index)[0]
+                else:
+                    name, pos = decode_string(data, pos)
+                value, pos = decode_string(data, pos)
+
+            header_list_size += len(name) + len(value) + 32
+            if header_list_size > self.max_header_list_size:
+                raise HPACKError("Header list exceeds the maximum size")
+            headers.append((name, value))
+
+        return headers
+
+
+class HPACKEncoder:
+    """
+    Encode response header blocks. Headers are encoded with the static table or as
+    literals without indexing, the dynamic table of the peer decoder is not used so the
+    encoder has no per-connection state and may be shared by every connection.
+
+    * `cache_size` -
+        (*int*): The maximum number of encoded header fields kept, the cache is
+        cleared once it is full.
+
+    * `cache` -
+        (*Dict[Tuple[bytes, bytes], bytes]*): The encoded representation of each
+        recently encoded header field.
+    """
+
+    __slots__ = ("cache_size", "cache")
+
+    def __init__(self, cache_size: int = 512) -> None:
+        self.cache_size: int = cache_size
+        self.cache: Dict[Tuple[bytes, bytes], bytes] = {}
+
+    def encode_field(self, name: bytes, value: bytes) -> bytes:
+        index = STATIC_INDEXES.get((name, value))
+        if index is not None:
+            return encode_integer(index, 7, 0x80)
+
+        name_index = STATIC_NAME_INDEXES.get(name, 0)
+        if name_index:
+            return encode_integer(name_index, 4, 0x00) + encode_string(value)
+        return b"\x00" + encode_string(name) + encode_string(value)
+
+    def encode(self, headers: List[Tuple[bytes, bytes]]) -> bytes:
+        cache = self.cache
+        encoded = []
+        for field in headers:
+            representation = cache.get(field)
+            if representation is None:
+                representation = self.encode_field(*field)
+                if len(cache) >= self.cache_size:
+                    cache.clear()
+                cache[field] = representation
+            encoded.append(representation)
+        return b"".join(encoded)
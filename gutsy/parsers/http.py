@@ -1,13 +1,169 @@
 import enum
 
+import collections
+import threading
 import logging
-from typing import List
+from typing import Dict, List, Tuple
 from urllib.parse import urlparse
 
 
 logger = logging.getLogger()
 
 
+# Header names that are lowercased through a lookup table rather than `bytes.lower()`.
+# Every casing in the table maps to the same lowercase bytes object, so the header names
+# of each request share these objects instead of allocating new ones.
+COMMON_HEADER_NAMES = (
+    b"accept",
+    b"accept-charset",
+    b"accept-encoding",
+    b"accept-language",
+    b"authorization",
+    b"cache-control",
+    b"connection",
+    b"content-length",
+    b"content-type",
+    b"cookie",
+    b"dnt",
+    b"expect",
+    b"host",
+    b"if-modified-since",
+    b"if-none-match",
+    b"keep-alive",
+    b"origin",
+    b"pragma",
+    b"range",
+    b"referer",
+    b"sec-fetch-dest",
+    b"sec-fetch-mode",
+    b"sec-fetch-site",
+    b"sec-fetch-user",
+    b"sec-websocket-extensions",
+    b"sec-websocket-key",
+    b"sec-websocket-protocol",
+    b"sec-websocket-version",
+    b"transfer-encoding",
+    b"upgrade",
+    b"upgrade-insecure-requests",
+    b"user-agent",
+    b"x-forwarded-for",
+    b"x-forwarded-proto",
+    b"x-real-ip",
+    b"x-request-id",
+)
+
+
+def build_header_name_table() -> Dict[bytes, bytes]:
+    table = {}
+    for name in COMMON_HEADER_NAMES:
+        title = name.title()
+        for variant in (name, title, name.upper(), title.replace(b"socket", b"Socket")):
+            table[variant] = name
+    return table
+
+
+HEADER_NAMES = build_header_name_table()
+
+# The headers recorded in fixed parser fields while the headers are parsed.
+WELL_KNOWN_HEADERS = {
+    b"host": "host",
+    b"content-length": "content_length",
+    b"transfer-encoding": "transfer_encoding",
+    b"connection": "connection",
+    b"upgrade": "upgrade",
+    b"expect": "expect",
+    b"accept-encoding": "accept_encoding",
+    b"sec-websocket-key": "sec_websocket_key",
+    b"sec-websocket-version": "sec_websocket_version",
+    b"sec-websocket-protocol": "sec_websocket_protocol",
+    b"sec-websocket-extensions": "sec_websocket_extensions",
+}
+
+# The headers that frame the request body, which are checked when they are repeated
+# rather than resolved to the last value.
+FRAMING_HEADERS = frozenset((b"content-length", b"transfer-encoding"))
+
+
+# Request line methods and versions that are decoded through a lookup table, sharing the
+# same string objects between requests.
+HTTP_METHODS = {
+    method.encode(): method
+    for method in ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
+}
+HTTP_VERSIONS = {version.encode(): version for version in ("HTTP/1.1", "HTTP/1.0")}
+
+
+def parse_request_target(target: bytes) -> Tuple[str, str]:
+    """
+    Split the request-target into the path and query string.
+
+    Origin-form targets, which begin with `/`, are split on the first `?` without
+    parsing the full URL. Any other form, such as an absolute URL, uses `urlparse`.
+    """
+    if target[:1] == b"/":
+        path, _, query_string = target.partition(b"?")
+        return path.decode("ascii"), query_string.decode("ascii")
+
+    parsed_target = urlparse(target.decode("ascii"))
+    return parsed_target.path, parsed_target.query
+
+
+class RequestTargetCache:
+    """
+    Bounded LRU cache of the parsed request-targets, keyed by the raw request-target
+    bytes of the request line.
+
+    * `maxsize` -
+        (*int*): The maximum number of cached targets, `0` disables the cache.
+
+    * `lock` -
+        (*threading.Lock*): Set when the cache is shared by event loops running in
+        different threads.
+
+    * `hits`, `misses` -
+        (*int*): The number of lookups that were and were not found in the cache.
+    """
+
+    __slots__ = ("maxsize", "entries", "lock", "hits", "misses")
+
+    def __init__(self, maxsize: int = 1024, lock: threading.Lock = None) -> None:
+        self.maxsize: int = maxsize
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+        self.lock: threading.Lock = lock
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, target: bytes) -> Tuple[str, str]:
+        """Return the path and query string of the request-target."""
+        lock = self.lock
+        if lock is not None:
+            with lock:
+                return self.get_entry(target)
+        return self.get_entry(target)
+
+    def get_entry(self, target: bytes) -> Tuple[str, str]:
+        entries = self.entries
+        entry = entries.get(target)
+        if entry is not None:
+            entries.move_to_end(target)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = parse_request_target(target)
+        if self.maxsize:
+            entries[target] = entry
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+REQUEST_TARGET_CACHE = RequestTargetCache()
+
+
 class HTTPParserState(enum.Enum):
     """Current state of the HTTP parser."""
 
@@ -36,8 +192,25 @@ class HTTPParser:
     * `raw_headers` -
         (*bytes*): Store the raw headers a complete bytes string.
 
+    * `body_data` -
+        (*bytes*): Any data received after the end of the headers, the beginning of the
+        request body.
+
     * `headers` -
         (*List[Tuple[bytes, bytes]]*): A list of all the parsed header name/value pairs.
+        Header names are lowercased.
+
+    * `host`, `content_length`, `transfer_encoding`, `connection`, `upgrade`,
+      `expect`, `accept_encoding`, `sec_websocket_key`, `sec_websocket_version`,
+      `sec_websocket_protocol`, `sec_websocket_extensions` -
+        (*bytes*): The value of the header if it was present in the request, recorded
+        while the headers are parsed, default is `None`. Repeated `transfer-encoding`
+        headers are combined into a single list of codings.
+
+    * `invalid_header` -
+        (*bytes*): The reason the request cannot be handled if its headers frame the
+        body ambiguously, such as conflicting `content-length` headers, default is
+        `None`.
 
     * `parsing_data` -
         (*bytes*): The incoming data being parsed to form a header.
@@ -66,7 +239,43 @@ class HTTPParser:
         default is `None`.
     """
 
-    def __init__(self):
+    __slots__ = (
+        "target_cache",
+        "state",
+        "http_method",
+        "http_version",
+        "path",
+        "query_string",
+        "headers",
+        "parsing_data",
+        "parsing_header",
+        "parsing_sep_pos",
+        "next_sep_pos",
+        "next_header",
+        "raw_headers",
+        "body_data",
+        "upgrade_header",
+        "should_upgrade",
+        "host",
+        "content_length",
+        "transfer_encoding",
+        "connection",
+        "upgrade",
+        "expect",
+        "accept_encoding",
+        "sec_websocket_key",
+        "sec_websocket_version",
+        "sec_websocket_protocol",
+        "sec_websocket_extensions",
+        "invalid_header",
+    )
+
+    def __init__(self, target_cache: RequestTargetCache = None):
+        self.target_cache: RequestTargetCache = target_cache or REQUEST_TARGET_CACHE
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the parser to parse the next request on a keep-alive connection."""
         self.state: HTTPParserState = HTTPParserState.PARSING_REQUEST
         self.http_method: str = None
         self.http_version: str = None
@@ -79,13 +288,49 @@ class HTTPParser:
         self.next_sep_pos: int = None
         self.next_header: bytes = b""
         self.raw_headers = b""
+        self.body_data = b""
         self.upgrade_header = None
         self.should_upgrade = None
+        self.host: bytes = None
+        self.content_length: bytes = None
+        self.transfer_encoding: bytes = None
+        self.connection: bytes = None
+        self.upgrade: bytes = None
+        self.expect: bytes = None
+        self.accept_encoding: bytes = None
+        self.sec_websocket_key: bytes = None
+        self.sec_websocket_version: bytes = None
+        self.sec_websocket_protocol: bytes = None
+        self.sec_websocket_extensions: bytes = None
+        self.invalid_header: bytes = None
 
     @property
     def is_complete(self):
         return self.state is HTTPParserState.PARSING_COMPLETE
 
+    def on_headers_complete(self) -> None:
+        """
+        Determine if this is an upgrade request from the Connection and Upgrade headers.
+        """
+        connection = self.connection
+        self.should_upgrade = (
+            connection is not None and b"upgrade" in connection.lower()
+        )
+        if self.should_upgrade and self.upgrade is not None:
+            logger.debug("Upgrade request identified: %s", self.upgrade)
+            self.upgrade_header = (b"upgrade", self.upgrade)
+
+    def on_repeated_framing_header(self, name: bytes, value: bytes) -> None:
+        """
+        Called when a header framing the request body is repeated. Resolving these to
+        the last value would let a request be framed differently than by a proxy in
+        front of the server.
+        """
+        if name == b"transfer-encoding":
+            self.transfer_encoding = b", ".join([self.transfer_encoding, value])
+        elif value != self.content_length:
+            self.invalid_header = b"Conflicting content-length headers."
+
     def parse_headers(self, data: bytes) -> None:
         """
         Parse the incoming bytes data sent by the `HTTPBufferedProtocol` to build
@@ -145,18 +390,19 @@ class HTTPParser:
 
                     # The first occurence of the newline character indicates that the
                     # http request method and version string has been completely read.
-                    http_method, path, http_version = (
-                        _parsing_header.decode("ascii").strip().split(" ")
+                    http_method, target, http_version = (
+                        _parsing_header.strip().split(b" ")
                     )
 
                     # Set the http method, version, and any potential query string data
                     # on the parser instance, then update the parser state to continue
-                    # reading the headers.
-                    self.http_method = http_method
-                    self.http_version = http_version
-                    _parsed_path = urlparse(path)
-                    self.path = _parsed_path.path
-                    self.query_string = _parsed_path.query
+                    # reading the headers. The path and query string of hot targets are
+                    # retrieved from the request-target cache.
+                    method = HTTP_METHODS.get(http_method)
+                    self.http_method = method or http_method.decode("ascii")
+                    version = HTTP_VERSIONS.get(http_version)
+                    self.http_version = version or http_version.decode("ascii")
+                    self.path, self.query_string = self.target_cache.get(target)
                     self.state = HTTPParserState.PARSING_HEADERS
 
                 else:
@@ -171,34 +417,32 @@ class HTTPParser:
 
                         # Slice the latest parsed header name and value and append to
                         # the headers list.
-                        current_header = _next_header[: _next_sep_pos - 1]
+                        raw_header = _next_header[: _next_sep_pos - 1]
                         current_value = _next_header[
                             _next_sep_pos + 1 : len(_next_header) - 2
                         ]
-                        header = (current_header, current_value)
-
-                        if self.should_upgrade is None:
-
-                            # The Connection header has not yet been parsed. If it's the
-                            # current header, then use it to determine if this is an
-                            # upgrade request.
-                            if current_header.lower() == b"connection":
-
-                                if b"upgrade" not in current_value.lower():
-                                    self.should_upgrade = False
-                                else:
-                                    logger.debug("Upgrade request identified.")
-                                    self.should_upgrade = True
-
-                        elif self.should_upgrade and self.upgrade_header is None:
-
-                            # The Connection header indicated an upgrade request, check
-                            # if the current header is the upgrade header.
-                            if current_header.lower() == b"upgrade":
-                                logger.debug(f"Upgrade header identified: {header}")
-                                self.upgrade_header = header
 
-                        self.headers.append(header)
+                        # Lowercase the header name, common names are looked up to
+                        # reuse the same lowercase bytes object.
+                        current_header = HEADER_NAMES.get(raw_header)
+                        if current_header is None:
+                            current_header = raw_header.lower()
+
+                        # Record the headers used by the protocol in fixed fields, so
+                        # the headers list does not need to be searched again.
+                        field_name = WELL_KNOWN_HEADERS.get(current_header)
+                        if field_name is not None:
+                            if (
+                                current_header in FRAMING_HEADERS
+                                and getattr(self, field_name) is not None
+                            ):
+                                self.on_repeated_framing_header(
+                                    current_header, current_value
+                                )
+                            else:
+                                setattr(self, field_name, current_value)
+
+                        self.headers.append((current_header, current_value))
 
                     # The headers have been completely parsed. The current iteration
                     # will update the state and the next iteration will cleanup the
@@ -209,6 +453,14 @@ class HTTPParser:
                         _next_header += _parsing_header
                         self.next_header = _next_header
                         self.state = HTTPParserState.PARSING_COMPLETE
+                        self.on_headers_complete()
+
+                        # The remaining data is the beginning of the request body, so
+                        # it is kept for the protocol rather than parsed as headers.
+                        self.body_data = bytes(data[i + 1 :])
+                        self.parsing_header = b""
+                        self.parsing_data = None
+                        return
 
                     # A header has been completed parsed, set the `next_header` bytes
                     # and the `next_sep_pos` index for the current parsing header. The
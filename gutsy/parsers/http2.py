@@ -0,0 +1,827 @@
+import asyncio
+import enum
+import logging
+import struct
+import time
+from email.utils import formatdate
+from typing import Dict, List, Tuple
+
+from aiobufpro.parsers.hpack import HPACKDecoder, HPACKEncoder, HPACKError
+
+logger = logging.getLogger()
+
+
+H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+# The frame header is a 24-bit length, the type, the flags and the stream identifier.
+FRAME_HEADER = struct.Struct("!BHBBL")
+
+SETTING = struct.Struct("!HL")
+
+MAX_WINDOW_SIZE = 2**31 - 1
+
+DEFAULT_WINDOW_SIZE = 65535
+
+# Hop-by-hop headers are not allowed in HTTP/2 responses.
+CONNECTION_HEADERS = frozenset(
+    (
+        b"connection",
+        b"keep-alive",
+        b"proxy-connection",
+        b"transfer-encoding",
+        b"upgrade",
+    )
+)
+
+# The encoder has no per-connection state, so its cache of encoded header fields is
+# shared by every connection.
+RESPONSE_ENCODER = HPACKEncoder()
+
+DATE_HEADER: Tuple[int, Tuple[bytes, bytes]] = (None, None)
+
+
+def get_date_header() -> Tuple[bytes, bytes]:
+    """The date response header, formatted at most once per second."""
+    global DATE_HEADER
+    now = int(time.time())
+    if DATE_HEADER[0] != now:
+        DATE_HEADER = (now, (b"date", formatdate(now, usegmt=True).encode()))
+    return DATE_HEADER[1]
+
+
+class FrameType(enum.IntEnum):
+    DATA = 0x0
+    HEADERS = 0x1
+    PRIORITY = 0x2
+    RST_STREAM = 0x3
+    SETTINGS = 0x4
+    PUSH_PROMISE = 0x5
+    PING = 0x6
+    GOAWAY = 0x7
+    WINDOW_UPDATE = 0x8
+    CONTINUATION = 0x9
+
+
+class FrameFlag(enum.IntEnum):
+    END_STREAM = 0x1
+    ACK = 0x1
+    END_HEADERS = 0x4
+    PADDED = 0x8
+    PRIORITY = 0x20
+
+
+class SettingCode(enum.IntEnum):
+    HEADER_TABLE_SIZE = 0x1
+    ENABLE_PUSH = 0x2
+    MAX_CONCURRENT_STREAMS = 0x3
+    INITIAL_WINDOW_SIZE = 0x4
+    MAX_FRAME_SIZE = 0x5
+    MAX_HEADER_LIST_SIZE = 0x6
+
+
+class ErrorCode(enum.IntEnum):
+    NO_ERROR = 0x0
+    PROTOCOL_ERROR = 0x1
+    INTERNAL_ERROR = 0x2
+    FLOW_CONTROL_ERROR = 0x3
+    SETTINGS_TIMEOUT = 0x4
+    STREAM_CLOSED = 0x5
+    FRAME_SIZE_ERROR = 0x6
+    REFUSED_STREAM = 0x7
+    CANCEL = 0x8
+    COMPRESSION_ERROR = 0x9
+
+
+class HTTP2Error(Exception):
+    """A connection error, the connection is closed with a GOAWAY frame."""
+
+    def __init__(self, error_code: ErrorCode, message: str) -> None:
+        super().__init__(message)
+        self.error_code: ErrorCode = error_code
+
+
+class HTTP2StreamError(HTTP2Error):
+    """A stream error, the stream is closed with a RST_STREAM frame."""
+
+    def __init__(self, stream_id: int, error_code: ErrorCode, message: str) -> None:
+        super().__init__(error_code, message)
+        self.stream_id: int = stream_id
+
+
+def build_frame(
+    frame_type: FrameType, flags: int, stream_id: int, payload: bytes = b""
+) -> bytes:
+    length = len(payload)
+    header = FRAME_HEADER.pack(
+        length >> 16, length & 0xFFFF, frame_type, flags, stream_id
+    )
+    return header + payload
+
+
+def parse_settings(payload: bytes) -> Dict[int, int]:
+    if len(payload) % 6:
+        raise HTTP2Error(ErrorCode.FRAME_SIZE_ERROR, "Invalid SETTINGS length")
+    return dict(SETTING.iter_unpack(payload))
+
+
+class HTTP2Settings:
+    """
+    The settings the server sends to clients in its connection preface.
+
+    * `max_concurrent_streams` -
+        (*int*): The maximum number of streams a client may have open at once.
+
+    * `initial_window_size` -
+        (*int*): The flow control window of each stream and of the connection, the
+        amount of request body data a client may send before it is acknowledged.
+
+    * `max_frame_size` -
+        (*int*): The largest frame payload the server accepts.
+
+    * `header_table_size` -
+        (*int*): The size of the HPACK dynamic table used to decode request headers.
+
+    * `max_header_list_size` -
+        (*int*): The maximum size of the decoded request headers.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_streams: int = 100,
+        initial_window_size: int = 65535,
+        max_frame_size: int = 16384,
+        header_table_size: int = 4096,
+        max_header_list_size: int = 65536,
+    ) -> None:
+        self.max_concurrent_streams: int = max_concurrent_streams
+        self.initial_window_size: int = initial_window_size
+        self.max_frame_size: int = max_frame_size
+        self.header_table_size: int = header_table_size
+        self.max_header_list_size: int = max_header_list_size
+
+    def get_payload(self) -> bytes:
+        return b"".join(
+            [
+                SETTING.pack(
+                    SettingCode.MAX_CONCURRENT_STREAMS, self.max_concurrent_streams
+                ),
+                SETTING.pack(SettingCode.INITIAL_WINDOW_SIZE, self.initial_window_size),
+                SETTING.pack(SettingCode.MAX_FRAME_SIZE, self.max_frame_size),
+                SETTING.pack(SettingCode.HEADER_TABLE_SIZE, self.header_table_size),
+                SETTING.pack(
+                    SettingCode.MAX_HEADER_LIST_SIZE, self.max_header_list_size
+                ),
+                SETTING.pack(SettingCode.ENABLE_PUSH, 0),
+            ]
+        )
+
+
+class HTTP2Stream:
+    """
+    A request/response exchange on an HTTP/2 connection.
+
+    * `connection` -
+        (*ASGIHTTP2Connection*): The ASGI connection running the application.
+
+    * `send_window` -
+        (*int*): The number of response body bytes the client allows to be sent.
+
+    * `recv_window` -
+        (*int*): The number of request body bytes the client may send.
+
+    * `recv_unacked` -
+        (*int*): The request body bytes received by the application since the last
+        window update.
+
+    * `recv_buffered` -
+        (*int*): The request body bytes queued and not yet received by the application.
+
+    * `remote_closed`, `local_closed` -
+        (*bool*): Set once the request and the response have ended.
+    """
+
+    __slots__ = (
+        "stream_id",
+        "connection",
+        "send_window",
+        "recv_window",
+        "recv_unacked",
+        "recv_buffered",
+        "window_waiter",
+        "remote_closed",
+        "local_closed",
+    )
+
+    def __init__(self, stream_id: int, send_window: int, recv_window: int) -> None:
+        self.stream_id: int = stream_id
+        self.connection = None
+        self.send_window: int = send_window
+        self.recv_window: int = recv_window
+        self.recv_unacked: int = 0
+        self.recv_buffered: int = 0
+        self.window_waiter: asyncio.Event = None
+        self.remote_closed: bool = False
+        self.local_closed: bool = False
+
+    def wake(self) -> None:
+        if self.window_waiter is not None:
+            self.window_waiter.set()
+
+
+class HTTP2Parser:
+    """
+    HTTP/2 connection handling for a protocol that received the HTTP/2 connection
+    preface or upgraded from HTTP/1.1 with `Upgrade: h2c`.
+
+    Frames are parsed as they are received and each stream runs the application as a
+    separate ASGI HTTP connection, so requests on the connection are handled
+    concurrently. Request body data is acknowledged with window updates once the
+    application has received half of the window, so a client sends no faster than the
+    application reads, and response body data is only sent while the stream and
+    connection send windows allow it.
+
+    * `settings` -
+        (*HTTP2Settings*): The server settings.
+
+    * `streams` -
+        (*Dict[int, HTTP2Stream]*): The open streams.
+
+    * `send_window`, `recv_window` -
+        (*int*): The connection-level send and receive windows.
+
+    * `recv_initial_window_size` -
+        (*int*): The receive window of new streams, the window of the settings once
+        the client has acknowledged them.
+
+    * `peer_initial_window_size`, `peer_max_frame_size` -
+        (*int*): The settings received from the client.
+    """
+
+    __slots__ = (
+        "protocol",
+        "settings",
+        "preface",
+        "buffer",
+        "streams",
+        "last_stream_id",
+        "decoder",
+        "encoder",
+        "header_stream_id",
+        "header_fragments",
+        "header_end_stream",
+        "send_window",
+        "recv_window",
+        "recv_unacked",
+        "recv_initial_window_size",
+        "peer_initial_window_size",
+        "peer_max_frame_size",
+        "goaway",
+        "closed",
+    )
+
+    def __init__(self, protocol, settings: HTTP2Settings, preface: bytes) -> None:
+        self.protocol = protocol
+        self.settings: HTTP2Settings = settings
+        self.preface: bytes = preface
+        self.buffer: bytearray = bytearray()
+        self.streams: Dict[int, HTTP2Stream] = {}
+        self.last_stream_id: int = 0
+        self.decoder: HPACKDecoder = HPACKDecoder(
+            max_table_size=settings.header_table_size,
+            max_header_list_size=settings.max_header_list_size,
+        )
+        self.encoder: HPACKEncoder = RESPONSE_ENCODER
+        self.header_stream_id: int = None
+        self.header_fragments: List[bytes] = []
+        self.header_end_stream: bool = False
+        self.send_window: int = DEFAULT_WINDOW_SIZE
+        # The connection window is raised by the preface when the settings window is
+        # larger than the default.
+        self.recv_window: int = max(settings.initial_window_size, DEFAULT_WINDOW_SIZE)
+        self.recv_unacked: int = 0
+        self.recv_initial_window_size: int = DEFAULT_WINDOW_SIZE
+        self.peer_initial_window_size: int = DEFAULT_WINDOW_SIZE
+        self.peer_max_frame_size: int = 16384
+        self.goaway: bool = False
+        self.closed: bool = False
+
+    def start(self) -> None:
+        """Send the server connection preface."""
+        frames = [build_frame(FrameType.SETTINGS, 0, 0, self.settings.get_payload())]
+        increment = self.settings.initial_window_size - DEFAULT_WINDOW_SIZE
+        if increment > 0:
+            # The connection window is not changed by the settings.
+            frames.append(
+                build_frame(FrameType.WINDOW_UPDATE, 0, 0, struct.pack("!L", increment))
+            )
+        self.protocol.transport.write(b"".join(frames))
+
+    def feed(self, data: bytes) -> None:
+        """Parse and handle every complete frame in the received data."""
+        if self.closed:
+            return
+        buffer = self.buffer
+        buffer += data
+
+        try:
+            if self.preface:
+                size = min(len(buffer), len(self.preface))
+                if buffer[:size] != self.preface[:size]:
+                    raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "Invalid preface")
+                del buffer[:size]
+                self.preface = self.preface[size:]
+                if self.preface:
+                    return
+
+            while len(buffer) >= 9:
+                length_high, length_low, frame_type, flags, stream_id = (
+                    FRAME_HEADER.unpack_from(buffer)
+                )
+                length = (length_high << 16) | length_low
+                if length > self.settings.max_frame_size:
+                    raise HTTP2Error(ErrorCode.FRAME_SIZE_ERROR, "Frame too large")
+                if len(buffer) < 9 + length:
+                    break
+                payload = bytes(buffer[9 : 9 + length])
+                del buffer[: 9 + length]
+
+                try:
+                    self.on_frame(
+                        frame_type, flags, stream_id & MAX_WINDOW_SIZE, payload
+                    )
+                except HTTP2StreamError as exc:
+                    logger.debug("HTTP/2 stream error: %s", exc)
+                    self.reset_stream(exc.stream_id, exc.error_code)
+
+        except HPACKError as exc:
+            self.close(ErrorCode.COMPRESSION_ERROR, str(exc))
+        except HTTP2Error as exc:
+            self.close(exc.error_code, str(exc))
+
+    def on_frame(self, frame_type: int, flags: int, stream_id: int, payload: bytes):
+        if self.header_stream_id is not None and (
+            frame_type != FrameType.CONTINUATION or stream_id != self.header_stream_id
+        ):
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "Expected CONTINUATION")
+
+        if frame_type == FrameType.DATA:
+            self.on_data(flags, stream_id, payload)
+        elif frame_type == FrameType.HEADERS:
+            self.on_headers(flags, stream_id, payload)
+        elif frame_type == FrameType.CONTINUATION:
+            self.on_continuation(flags, stream_id, payload)
+        elif frame_type == FrameType.SETTINGS:
+            self.on_settings(flags, stream_id, payload)
+        elif frame_type == FrameType.WINDOW_UPDATE:
+            self.on_window_update(stream_id, payload)
+        elif frame_type == FrameType.PING:
+            self.on_ping(flags, stream_id, payload)
+        elif frame_type == FrameType.RST_STREAM:
+            self.on_rst_stream(stream_id, payload)
+        elif frame_type == FrameType.GOAWAY:
+            # The client will not open more streams, the connection is closed once the
+            # open streams are complete.
+            self.goaway = True
+            if not self.streams:
+                self.close(ErrorCode.NO_ERROR, "GOAWAY received")
+        elif frame_type == FrameType.PUSH_PROMISE:
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "PUSH_PROMISE from client")
+        elif frame_type == FrameType.PRIORITY:
+            if len(payload) != 5:
+                raise HTTP2StreamError(
+                    stream_id, ErrorCode.FRAME_SIZE_ERROR, "Invalid PRIORITY length"
+                )
+
+        # Frames of an unknown type are ignored.
+
+    def remove_padding(self, flags: int, payload: bytes) -> bytes:
+        if flags & FrameFlag.PADDED:
+            if not payload or payload[0] >= len(payload):
+                raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "Invalid padding")
+            payload = payload[1 : len(payload) - payload[0]]
+        return payload
+
+    def on_data(self, flags: int, stream_id: int, payload: bytes) -> None:
+        if stream_id == 0:
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "DATA on stream 0")
+
+        # The entire frame counts against the flow control windows.
+        size = len(payload)
+        if size > self.recv_window:
+            raise HTTP2Error(ErrorCode.FLOW_CONTROL_ERROR, "Connection window exceeded")
+        self.recv_window -= size
+
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            if stream_id > self.last_stream_id:
+                raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "DATA on an idle stream")
+            # Frames already in flight when a stream was reset are ignored.
+            self.credit_connection(size)
+            return
+        if stream.remote_closed:
+            self.credit_connection(size)
+            raise HTTP2StreamError(stream_id, ErrorCode.STREAM_CLOSED, "Stream closed")
+        if size > stream.recv_window:
+            self.credit_connection(size)
+            raise HTTP2StreamError(
+                stream_id, ErrorCode.FLOW_CONTROL_ERROR, "Stream window exceeded"
+            )
+        stream.recv_window -= size
+
+        data = self.remove_padding(flags, payload)
+        end_stream = bool(flags & FrameFlag.END_STREAM)
+        # The windows are credited once the application receives the data, the padding
+        # is never received.
+        stream.recv_buffered += size
+        self.consume_data(stream_id, size - len(data))
+        if end_stream:
+            stream.remote_closed = True
+
+        if data or end_stream:
+            stream.connection.on_request_body(data, end_stream)
+        if end_stream and stream.local_closed:
+            self.remove_stream(stream_id)
+
+    def consume_data(self, stream_id: int, size: int) -> None:
+        """
+        Credit the flow control windows with request body data received by the
+        application, sending window updates once half of a window has been received.
+        """
+        stream = self.streams.get(stream_id)
+        if stream is None or not size:
+            # The data of a removed stream was credited to the connection with it.
+            return
+        stream.recv_buffered -= size
+        self.credit_connection(size)
+        if not stream.remote_closed:
+            stream.recv_unacked += size
+            if stream.recv_unacked >= self.settings.initial_window_size // 2:
+                self.send_window_update(stream_id, stream.recv_unacked)
+                stream.recv_window += stream.recv_unacked
+                stream.recv_unacked = 0
+
+    def credit_connection(self, size: int) -> None:
+        self.recv_unacked += size
+        if self.recv_unacked >= self.settings.initial_window_size // 2:
+            self.send_window_update(0, self.recv_unacked)
+            self.recv_window += self.recv_unacked
+            self.recv_unacked = 0
+
+    def on_headers(self, flags: int, stream_id: int, payload: bytes) -> None:
+        if stream_id == 0:
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "HEADERS on stream 0")
+        payload = self.remove_padding(flags, payload)
+        if flags & FrameFlag.PRIORITY:
+            payload = payload[5:]
+
+        self.header_stream_id = stream_id
+        self.header_fragments = [payload]
+        self.header_end_stream = bool(flags & FrameFlag.END_STREAM)
+        if flags & FrameFlag.END_HEADERS:
+            self.on_header_block()
+
+    def on_continuation(self, flags: int, stream_id: int, payload: bytes) -> None:
+        if self.header_stream_id is None:
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "Unexpected CONTINUATION")
+        self.header_fragments.append(payload)
+        if flags & FrameFlag.END_HEADERS:
+            self.on_header_block()
+
+    def on_header_block(self) -> None:
+        stream_id = self.header_stream_id
+        end_stream = self.header_end_stream
+        self.header_stream_id = None
+        started = None
+        if self.protocol.server_timing:
+            started = time.perf_counter_ns()
+
+        # The header block is always decoded to keep the dynamic table in sync, even if
+        # the stream is then refused.
+        headers = self.decoder.decode(b"".join(self.header_fragments))
+        self.header_fragments = []
+
+        stream = self.streams.get(stream_id)
+        if stream is not None:
+            # Trailers end the request body, their fields are discarded.
+            if stream.remote_closed or not end_stream:
+                raise HTTP2StreamError(
+                    stream_id, ErrorCode.PROTOCOL_ERROR, "Unexpected HEADERS"
+                )
+            stream.remote_closed = True
+            stream.connection.on_request_body(b"", True)
+            if stream.local_closed:
+                self.remove_stream(stream_id)
+            return
+
+        if stream_id % 2 == 0 or stream_id <= self.last_stream_id:
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "Invalid stream identifier")
+        self.last_stream_id = stream_id
+
+        if self.goaway:
+            raise HTTP2StreamError(stream_id, ErrorCode.REFUSED_STREAM, "Going away")
+
+        if len(self.streams) >= self.settings.max_concurrent_streams:
+            raise HTTP2StreamError(
+                stream_id, ErrorCode.REFUSED_STREAM, "Too many concurrent streams"
+            )
+
+        overload = self.protocol.overload
+        if overload is not None and overload.should_reject():
+            # The client can safely retry a refused stream.
+            raise HTTP2StreamError(stream_id, ErrorCode.REFUSED_STREAM, "Shedding load")
+
+        pseudo_headers = {}
+        request_headers = []
+        for name, value in headers:
+            if name.startswith(b":"):
+                if request_headers:
+                    raise HTTP2StreamError(
+                        stream_id, ErrorCode.PROTOCOL_ERROR, "Misplaced pseudo-header"
+                    )
+                pseudo_headers[name] = value
+            else:
+                request_headers.append((name, value))
+
+        method = pseudo_headers.get(b":method")
+        target = pseudo_headers.get(b":path")
+        if method is None or not target:
+            raise HTTP2StreamError(
+                stream_id, ErrorCode.PROTOCOL_ERROR, "Missing pseudo-headers"
+            )
+
+        authority = pseudo_headers.get(b":authority")
+        if authority is not None and not any(
+            name == b"host" for name, _ in request_headers
+        ):
+            request_headers.insert(0, (b"host", authority))
+
+        if started is not None:
+            self.protocol.parse_time = time.perf_counter_ns() - started
+        self.open_stream(
+            stream_id, method.decode("ascii"), target, request_headers, end_stream
+        )
+
+    def open_stream(
+        self,
+        stream_id: int,
+        method: str,
+        target: bytes,
+        headers: List[Tuple[bytes, bytes]],
+        end_stream: bool,
+    ) -> None:
+        """Start the application for a new stream."""
+        protocol = self.protocol
+        path, query_string = protocol.http_parser.target_cache.get(target)
+        scope = protocol.scope_template.copy()
+        scope["http_version"] = "2"
+        scope["method"] = method
+        scope["path"] = path
+        scope["query_string"] = query_string
+        scope["headers"] = headers
+        if protocol.lifespan_state is not None:
+            scope["state"] = protocol.lifespan_state.copy()
+
+        stream = HTTP2Stream(
+            stream_id, self.peer_initial_window_size, self.recv_initial_window_size
+        )
+        stream.remote_closed = end_stream
+        stream.connection = protocol.create_http2_connection(stream_id, end_stream)
+        self.streams[stream_id] = stream
+        stream.connection.run_asgi(app=protocol.app, scope=scope)
+
+    def on_settings(self, flags: int, stream_id: int, payload: bytes) -> None:
+        if stream_id != 0:
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "SETTINGS on a stream")
+        if flags & FrameFlag.ACK:
+            # The client may exceed a smaller window than the default until it has
+            # applied the settings.
+            delta = self.settings.initial_window_size - self.recv_initial_window_size
+            self.recv_initial_window_size = self.settings.initial_window_size
+            for stream in self.streams.values():
+                stream.recv_window += delta
+            return
+        self.apply_settings(parse_settings(payload))
+        self.protocol.transport.write(build_frame(FrameType.SETTINGS, FrameFlag.ACK, 0))
+
+    def apply_settings(self, settings: Dict[int, int]) -> None:
+        """Apply the settings received from the client."""
+        for code, value in settings.items():
+            if code == SettingCode.INITIAL_WINDOW_SIZE:
+                if value > MAX_WINDOW_SIZE:
+                    raise HTTP2Error(ErrorCode.FLOW_CONTROL_ERROR, "Window too large")
+                # The change applies to the send window of every open stream.
+                delta = value - self.peer_initial_window_size
+                self.peer_initial_window_size = value
+                for stream in self.streams.values():
+                    stream.send_window += delta
+                    stream.wake()
+            elif code == SettingCode.MAX_FRAME_SIZE:
+                if not 16384 <= value <= 16777215:
+                    raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "Invalid frame size")
+                self.peer_max_frame_size = value
+
+    def on_window_update(self, stream_id: int, payload: bytes) -> None:
+        if len(payload) != 4:
+            raise HTTP2Error(ErrorCode.FRAME_SIZE_ERROR, "Invalid WINDOW_UPDATE length")
+        increment = struct.unpack("!L", payload)[0] & MAX_WINDOW_SIZE
+        if increment == 0 and stream_id == 0:
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "Zero window increment")
+        if increment == 0:
+            raise HTTP2StreamError(
+                stream_id, ErrorCode.PROTOCOL_ERROR, "Zero window increment"
+            )
+
+        if stream_id == 0:
+            self.send_window += increment
+            if self.send_window > MAX_WINDOW_SIZE:
+                raise HTTP2Error(ErrorCode.FLOW_CONTROL_ERROR, "Window overflow")
+            for stream in self.streams.values():
+                stream.wake()
+            return
+
+        stream = self.streams.get(stream_id)
+        if stream is not None:
+            stream.send_window += increment
+            if stream.send_window > MAX_WINDOW_SIZE:
+                raise HTTP2StreamError(
+                    stream_id, ErrorCode.FLOW_CONTROL_ERROR, "Window overflow"
+                )
+            stream.wake()
+
+    def on_ping(self, flags: int, stream_id: int, payload: bytes) -> None:
+        if stream_id != 0 or len(payload) != 8:
+            raise HTTP2Error(ErrorCode.PROTOCOL_ERROR, "Invalid PING")
+        if not flags & FrameFlag.ACK:
+            frame = build_frame(FrameType.PING, FrameFlag.ACK, 0, payload)
+            self.protocol.transport.write(frame)
+
+    def on_rst_stream(self, stream_id: int, payload: bytes) -> None:
+        if len(payload) != 4:
+            raise HTTP2Error(ErrorCode.FRAME_SIZE_ERROR, "Invalid RST_STREAM length")
+        stream = self.streams.pop(stream_id, None)
+        if stream is not None:
+            stream.remote_closed = stream.local_closed = True
+            stream.connection.put_message({"type": "http.disconnect"})
+            stream.wake()
+            self.release_stream(stream)
+
+    def send_window_update(self, stream_id: int, increment: int) -> None:
+        payload = struct.pack("!L", increment)
+        frame = build_frame(FrameType.WINDOW_UPDATE, 0, stream_id, payload)
+        self.protocol.transport.write(frame)
+
+    def send_headers(
+        self,
+        stream_id: int,
+        status: int,
+        headers: List[Tuple[bytes, bytes]],
+        end_stream: bool,
+    ) -> None:
+        """Send the response headers of a stream."""
+        stream = self.streams.get(stream_id)
+        if stream is None or self.closed:
+            return
+
+        response_headers = [
+            (b":status", str(status).encode()),
+            (b"server", b"aiobufpro"),
+            get_date_header(),
+        ]
+        for name, value in headers:
+            name = name.lower()
+            if name not in CONNECTION_HEADERS:
+                response_headers.append((name, bytes(value)))
+        header_block = self.encoder.encode(response_headers)
+
+        # Header blocks larger than the maximum frame size continue in CONTINUATION
+        # frames.
+        max_frame_size = self.peer_max_frame_size
+        fragments = [
+            header_block[i : i + max_frame_size]
+            for i in range(0, len(header_block), max_frame_size)
+        ] or [b""]
+        flags = FrameFlag.END_STREAM if end_stream else 0
+        frames = []
+        for i, fragment in enumerate(fragments):
+            frame_type = FrameType.HEADERS if i == 0 else FrameType.CONTINUATION
+            frame_flags = flags if i == 0 else 0
+            if i == len(fragments) - 1:
+                frame_flags |= FrameFlag.END_HEADERS
+            frames.append(build_frame(frame_type, frame_flags, stream_id, fragment))
+        self.protocol.transport.write(b"".join(frames))
+
+        if end_stream:
+            self.end_local_stream(stream)
+
+    async def send_data(self, stream_id: int, data: bytes, end_stream: bool) -> None:
+        """
+        Send response body data, waiting for the client to open the flow control
+        windows when they are exhausted.
+        """
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            return
+
+        transport = self.protocol.transport
+        while True:
+            size = min(
+                len(data),
+                stream.send_window,
+                self.send_window,
+                self.peer_max_frame_size,
+            )
+            if size <= 0 and data:
+                if stream.local_closed or self.closed:
+                    return
+                if stream.window_waiter is None:
+                    stream.window_waiter = asyncio.Event()
+                stream.window_waiter.clear()
+                await stream.window_waiter.wait()
+                continue
+
+            chunk = data[:size]
+            data = data[size:]
+            stream.send_window -= size
+            self.send_window -= size
+            flags = FrameFlag.END_STREAM if end_stream and not data else 0
+            transport.write(build_frame(FrameType.DATA, flags, stream_id, chunk))
+            if not data:
+                break
+
+        if end_stream:
+            self.end_local_stream(stream)
+
+    def end_local_stream(self, stream: HTTP2Stream) -> None:
+        stream.local_closed = True
+        if not stream.remote_closed:
+            # The response is complete, so the rest of the request is not needed.
+            self.reset_stream(stream.stream_id, ErrorCode.NO_ERROR)
+        else:
+            self.remove_stream(stream.stream_id)
+
+    def remove_stream(self, stream_id: int) -> None:
+        stream = self.streams.pop(stream_id, None)
+        if stream is not None:
+            self.release_stream(stream)
+        if self.goaway and not self.streams:
+            self.close(ErrorCode.NO_ERROR, "Streams complete after GOAWAY")
+
+    def reset_stream(self, stream_id: int, error_code: ErrorCode) -> None:
+        if self.closed:
+            return
+        payload = struct.pack("!L", error_code)
+        frame = build_frame(FrameType.RST_STREAM, 0, stream_id, payload)
+        self.protocol.transport.write(frame)
+        stream = self.streams.pop(stream_id, None)
+        if stream is not None:
+            stream.remote_closed = stream.local_closed = True
+            stream.wake()
+            self.release_stream(stream)
+        if self.goaway and not self.streams:
+            self.close(ErrorCode.NO_ERROR, "Streams complete after GOAWAY")
+
+    def release_stream(self, stream: HTTP2Stream) -> None:
+        """
+        Credit the connection window with the data of a removed stream that the
+        application will not receive.
+        """
+        if stream.recv_buffered and not self.closed:
+            self.credit_connection(stream.recv_buffered)
+            stream.recv_buffered = 0
+
+    def shutdown(self) -> None:
+        """
+        Send a GOAWAY frame for a graceful shutdown. The streams already opened are
+        completed and the connection is closed once they are, new streams are refused.
+        """
+        if self.closed:
+            return
+        if not self.streams:
+            self.close(ErrorCode.NO_ERROR, "Shutting down")
+            return
+        self.goaway = True
+        payload = struct.pack("!LL", self.last_stream_id, ErrorCode.NO_ERROR)
+        self.protocol.transport.write(build_frame(FrameType.GOAWAY, 0, 0, payload))
+
+    def close(self, error_code: ErrorCode, message: str) -> None:
+        """Close the connection with a GOAWAY frame."""
+        if self.closed:
+            return
+        if error_code != ErrorCode.NO_ERROR:
+            logger.debug("HTTP/2 connection error: %s", message)
+            if self.protocol.metrics is not None:
+                self.protocol.metrics.parse_errors += 1
+        payload = struct.pack("!LL", self.last_stream_id, error_code)
+        self.protocol.transport.write(build_frame(FrameType.GOAWAY, 0, 0, payload))
+        self.protocol.transport.close()
+        self.connection_lost()
+
+    def connection_lost(self) -> None:
+        """Release every stream when the connection is closed or lost."""
+        self.closed = True
+        streams = list(self.streams.values())
+        self.streams.clear()
+        for stream in streams:
+            stream.remote_closed = stream.local_closed = True
+            stream.connection.put_message({"type": "http.disconnect"})
+            stream.wake()
@@ -1,6 +1,7 @@
 import asyncio
 import enum
-from typing import Union, Tuple
+import struct
+from typing import Optional, Union, Tuple
 
 
 def xor(bytes_one: int, bytes_two: int) -> int:
@@ -26,6 +27,30 @@ def xor(bytes_one: int, bytes_two: int) -> int:
 HEAD_FRAME_INDEXES = ((0, 1), (1, 2), (2, 3), (3, 4), (4, 8))
 MASK_AND_PAYLOAD_LEN_FRAME_INDEXES = ((0, 1), (1, 8))
 
+# The `websocket.disconnect` code of a connection closed without a close frame. It is
+# reserved for this and is never sent in a close frame.
+ABNORMAL_CLOSURE_CODE = 1006
+
+
+def get_frame_size(data: bytearray) -> Optional[int]:
+    """
+    The size of the frame at the start of the data, or `None` if not enough of the
+    frame header has been received to know it.
+    """
+    if len(data) < 2:
+        return None
+    mask_size = 4 if data[1] & 0x80 else 0
+    payload_len = data[1] & 0x7F
+    if payload_len == 126:
+        if len(data) < 4:
+            return None
+        return 4 + mask_size + struct.unpack_from("!H", data, 2)[0]
+    if payload_len == 127:
+        if len(data) < 10:
+            return None
+        return 10 + mask_size + struct.unpack_from("!Q", data, 2)[0]
+    return 2 + mask_size + payload_len
+
 
 class WebSocketError(Exception):
     """Raised when an error occurs in the WebSocket protocol."""
@@ -139,6 +164,38 @@ class WebSocketOpcode(enum.Enum):
     PONG = 10
 
 
+def build_frame(
+    payload_data: Union[str, bytes],
+    *,
+    opcode: WebSocketOpcode,
+    fin: int = 1,
+    rsv1: int = 0,
+    rsv2: int = 0,
+    rsv3: int = 0,
+) -> bytes:
+    """
+    Build a complete, unmasked server frame for the payload. The result does not
+    depend on the connection, so the same bytes object may be written to any number
+    of transports.
+
+    Payloads larger than 125 bytes use the 16-bit or 64-bit extended payload length.
+    """
+    if isinstance(payload_data, str):
+        payload_data = payload_data.encode()
+
+    header = (fin << 7) | (rsv1 << 6) | (rsv2 << 5) | (rsv3 << 4) | opcode.value
+    payload_len = len(payload_data)
+
+    if payload_len <= 125:
+        head = struct.pack("!BB", header, payload_len)
+    elif payload_len <= 0xFFFF:
+        head = struct.pack("!BBH", header, 126, payload_len)
+    else:
+        head = struct.pack("!BBQ", header, 127, payload_len)
+
+    return b"".join([head, payload_data])
+
+
 class WebSocketParser:
     """
       0                   1                   2                   3
@@ -161,10 +218,16 @@ class WebSocketParser:
      +---------------------------------------------------------------+
      """
 
+    __slots__ = ("protocol", "state")
+
     def __init__(self, protocol: asyncio.BufferedProtocol) -> None:
         # self.current_frame: WebSocketFrame = None
         # self.frames = []
         self.protocol: asyncio.BufferedProtocol = protocol
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the parser to begin reading a new frame."""
         self.state: WebSocketParserState = WebSocketParserState.INITIAL_BYTES
 
     def get_frame_values(self, data: bytes, indexes: Tuple[int, int]) -> int:
@@ -274,8 +337,7 @@ class WebSocketParser:
             payload_len_data = data[:payload_len_bytes]
             del data[:payload_len_bytes]
 
-            bitstr = f"{payload_len_data:08b}"
-            payload_len = int(bitstr, 2)
+            payload_len = int.from_bytes(payload_len_data, "big")
 
             self.state = WebSocketParserState.MASKING_KEY
 
@@ -310,16 +372,20 @@ class WebSocketParser:
 
                 if opcode is WebSocketOpcode.TEXT:
                     message["text"] = payload_data.decode("latin-1")
-                elif opcode is WebSocketOpcode.BYTES:
+                elif opcode is WebSocketOpcode.BINARY:
                     message["bytes"] = payload_data
 
                 self.protocol.asgi_connection.put_message(message)
 
             elif opcode is WebSocketOpcode.PING:
 
-                content = self.get_frame_content(payload_data, opcode=opcode)
+                # A ping is answered with a pong frame carrying the same payload.
+                content = build_frame(payload_data, opcode=WebSocketOpcode.PONG)
                 await self.protocol.feed_data(content)
 
+            elif opcode is WebSocketOpcode.PONG:
+                self.protocol.on_pong()
+
             self.state = WebSocketParserState.INITIAL_BYTES
 
     async def get_frame_content(
@@ -331,14 +397,7 @@ class WebSocketParser:
         rsv1=0,
         rsv2=0,
         rsv3=0,
-    ) -> None:
-
-        if isinstance(payload_data, str):
-            payload_data = payload_data.encode()
-
-        payload_len = len(payload_data)
-        opcode = f"{opcode.value:04}"
-        header = int(f"{fin}{rsv1}{rsv2}{rsv3}{opcode}", 2)
-        content = bytes([header, payload_len]) + payload_data
-
-        return content
+    ) -> bytes:
+        return build_frame(
+            payload_data, opcode=opcode, fin=fin, rsv1=rsv1, rsv2=rsv2, rsv3=rsv3
+        )
@@ -0,0 +1,173 @@
+import asyncio
+import cProfile
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+from aiobufpro.connections import ASGIConnection
+from aiobufpro.protocol import HTTPWSProtocol, HTTPWSProtocolState
+
+logger = logging.getLogger()
+
+
+class LoopProfiler:
+    """
+    Captures a cProfile profile of an event loop thread for a fixed duration, started
+    on demand such as from a signal handler, and writes it to a file that can be read
+    with `pstats` or `snakeviz`.
+
+    * `duration` -
+        (*float*): The seconds to profile for.
+
+    * `directory` -
+        (*str*): The directory the profiles are written to.
+
+    * `profile` -
+        (*cProfile.Profile*): The profile currently being captured.
+    """
+
+    def __init__(self, duration: float, directory: str) -> None:
+        self.duration: float = duration
+        self.directory: str = directory
+        self.profile: cProfile.Profile = None
+
+    def start(self) -> None:
+        """Start capturing, must be called from the thread of the event loop."""
+        if self.profile is not None:
+            logger.warning("A profile is already being captured")
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as exc:
+            # Another profiler is already active in this thread.
+            logger.warning(f"Unable to start profiling: {exc}")
+            return
+        self.profile = profile
+        logger.warning(f"Profiling the event loop for {self.duration} seconds")
+        asyncio.get_running_loop().call_later(self.duration, self.stop)
+
+    def stop(self) -> str:
+        """Stop capturing and write the profile, returning the file path."""
+        profile = self.profile
+        self.profile = None
+        profile.disable()
+        filename = "aiobufpro-%d-%d-%d.prof" % (
+            os.getpid(),
+            threading.get_ident(),
+            time.time(),
+        )
+        path = os.path.join(self.directory, filename)
+        profile.dump_stats(path)
+        logger.warning(f"Wrote event loop profile to {path}")
+        return path
+
+
+# The monitors of the event loops that report slow callbacks.
+SLOW_CALLBACK_MONITORS: Dict[asyncio.AbstractEventLoop, "SlowCallbackMonitor"] = {}
+
+HANDLE_RUN = asyncio.events.Handle._run
+
+
+def run_handle(handle: asyncio.Handle) -> None:
+    """
+    Replaces `Handle._run`, the method every event loop callback is run with, to time
+    the callbacks of monitored loops. This is where asyncio measures the callbacks in
+    debug mode, without the other costs of debug mode.
+    """
+    monitor = SLOW_CALLBACK_MONITORS.get(handle._loop)
+    if monitor is None:
+        HANDLE_RUN(handle)
+        return
+
+    # The frame of a task's coroutine is referenced before the step is run, because
+    # the coroutine releases it when it returns.
+    owner = getattr(handle._callback, "__self__", None)
+    frame = None
+    if isinstance(owner, asyncio.Task):
+        frame = owner.get_coro().cr_frame
+
+    start = time.perf_counter()
+    HANDLE_RUN(handle)
+    duration = time.perf_counter() - start
+    if duration >= monitor.threshold:
+        monitor.report(handle, owner, frame, duration)
+
+
+def describe_scope(scope: dict) -> str:
+    # A WebSocket scope has no method.
+    method = scope.get("method", "WebSocket")
+    return f"{method} {scope['path']} from {scope['client']}"
+
+
+def describe_protocol(protocol: HTTPWSProtocol) -> str:
+    """The request currently being handled by the protocol."""
+    parser = protocol.http_parser
+    if protocol.state is HTTPWSProtocolState.HTTP2:
+        return f"HTTP/2 connection from {protocol.client}"
+    if parser.http_method is not None:
+        return f"{parser.http_method} {parser.path} from {protocol.client}"
+    if protocol.scope is not None:
+        return describe_scope(protocol.scope)
+    return f"connection from {protocol.client}"
+
+
+class SlowCallbackMonitor:
+    """
+    Logs the callbacks of an event loop that run for longer than the loop's
+    `slow_callback_duration`, with the request of the connection they belong to.
+
+    Callbacks that run a step of an application task are reported as the application,
+    and callbacks of a transport as handling received data, which includes parsing and
+    any eagerly started application.
+
+    * `threshold` -
+        (*float*): The seconds a callback may run for before it is reported.
+
+    * `slow_callbacks` -
+        (*int*): The number of callbacks reported.
+    """
+
+    def __init__(self, threshold: float) -> None:
+        self.threshold: float = threshold
+        self.slow_callbacks: int = 0
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        loop.slow_callback_duration = self.threshold
+        SLOW_CALLBACK_MONITORS[loop] = self
+        asyncio.events.Handle._run = run_handle
+
+    def uninstall(self, loop: asyncio.AbstractEventLoop) -> None:
+        SLOW_CALLBACK_MONITORS.pop(loop, None)
+        if not SLOW_CALLBACK_MONITORS:
+            # The callbacks of unmonitored loops are no longer looked up.
+            asyncio.events.Handle._run = HANDLE_RUN
+
+    def report(self, handle: asyncio.Handle, owner, frame, duration: float) -> None:
+        self.slow_callbacks += 1
+        description = None
+
+        if frame is not None:
+            instance = frame.f_locals.get("self")
+            request = None
+            if isinstance(instance, ASGIConnection) and instance.scope is not None:
+                request = describe_scope(instance.scope)
+            elif isinstance(instance, HTTPWSProtocol):
+                request = describe_protocol(instance)
+            if request is not None:
+                description = f"in the application for {request}"
+        else:
+            protocol = getattr(owner, "_protocol", None)
+            # The protocol of a TLS transport wraps the application protocol.
+            protocol = getattr(protocol, "_app_protocol", protocol)
+            if isinstance(protocol, HTTPWSProtocol):
+                description = (
+                    f"handling received data for {describe_protocol(protocol)}"
+                )
+
+        if description is None:
+            description = f"in {owner if owner is not None else handle}"
+        logger.warning(f"Slow callback of {duration:.3f} seconds {description}")
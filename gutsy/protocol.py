@@ -1,14 +1,48 @@
 import enum
+import base64
 import asyncio
 import logging
-from typing import List, Tuple, Union
-
-from starlette.types import ASGIApp, ASGIInstance, Scope
-
-from aiobufpro.connections import ASGIHTTPConnection, ASGIWebSocketConnection
-from aiobufpro.utils import get_server_headers, get_websocket_accept_key
-from aiobufpro.parsers.http import HTTPParser
-from aiobufpro.parsers.websocket import WebSocketParser
+import time
+from typing import Coroutine, List, Set, Tuple, Union
+
+from starlette.types import ASGIApp, Scope
+
+from aiobufpro.accesslog import AccessLog
+from aiobufpro.body import RequestBodyDecoder, RequestBodyError, RequestBodySpooler
+from aiobufpro.broadcast import BroadcastHub
+from aiobufpro.cache import ResponseCache
+from aiobufpro.capture import TrafficCapture
+from aiobufpro.compression import ResponseCompressor
+from aiobufpro.connections import (
+    ASGIHTTPConnection,
+    ASGIHTTP2Connection,
+    ASGIWebSocketConnection,
+)
+from aiobufpro.fastpath import FastPathRouter
+from aiobufpro.heartbeat import GOING_AWAY_FRAME, HeartbeatScheduler
+from aiobufpro.metrics import MeteredTransport, ServerMetrics
+from aiobufpro.outbound import OutboundQueue, SlowConsumerPolicy
+from aiobufpro.overload import SHED_RESPONSE, LoopLagMonitor
+from aiobufpro.utils import (
+    create_eager_task,
+    get_server_headers,
+    get_websocket_accept_key,
+)
+from aiobufpro.parsers.http import HTTPParser, RequestTargetCache
+from aiobufpro.parsers.http2 import (
+    H2_PREFACE,
+    ErrorCode,
+    HTTP2Error,
+    HTTP2Parser,
+    HTTP2Settings,
+    parse_settings,
+)
+from aiobufpro.parsers.websocket import (
+    ABNORMAL_CLOSURE_CODE,
+    WebSocketCloseCode,
+    WebSocketParser,
+    get_frame_size,
+)
 
 logger = logging.getLogger()
 
@@ -19,23 +53,188 @@ class HTTPWSProtocolState(enum.Enum):
     """
 
     REQUEST = enum.auto()
+    BODY = enum.auto()
     RESPONSE = enum.auto()
     STREAMING = enum.auto()
     FRAMING = enum.auto()
+    HTTP2 = enum.auto()
     CLOSED = enum.auto()
 
 
+# The states of a connection with an HTTP/1.1 request in progress.
+RESPONDING_STATES = frozenset(
+    (
+        HTTPWSProtocolState.BODY,
+        HTTPWSProtocolState.RESPONSE,
+        HTTPWSProtocolState.STREAMING,
+    )
+)
+
+# The minimum size of the receive buffer while a request body is being received. The
+# buffer is returned to its default size once the body is complete.
+BODY_BUFFER_SIZE = 65536
+
+# The part of the HTTP/2 connection preface that follows the request line and the empty
+# header block parsed by the HTTP/1.1 parser.
+H2_PREFACE_REMAINDER = H2_PREFACE[len(b"PRI * HTTP/2.0\r\n\r\n") :]
+
+# The request headers of an h2c upgrade request that are not passed to the stream.
+H2C_UPGRADE_HEADERS = frozenset(
+    (b"connection", b"upgrade", b"http2-settings", b"keep-alive")
+)
+
+DEFAULT_HTTP2_SETTINGS = HTTP2Settings()
+
+# The ASGI extensions supported by every HTTP request. The application sends
+# `http.response.early_hint` events with a list of `links` before the response starts,
+# which are written as 103 Early Hints responses with a `link` header for each.
+HTTP_EXTENSIONS = {"http.response.early_hint": {}}
+
+# The ASGI `http_version` scope values of the request line HTTP versions.
+HTTP_VERSIONS = {"HTTP/1.1": "1.1", "HTTP/1.0": "1.0"}
+
+
+class TaskMode(enum.Enum):
+    """
+    How the application coroutine of each request is run.
+
+    * `TASK` - A new task is created and started on the next loop iteration.
+
+    * `EAGER` - A new task is created and started immediately, so simple handlers
+        complete within `buffer_updated`. Requires Python 3.12, otherwise the same as
+        `TASK`.
+
+    * `WORKER` - A single long-lived task per connection runs the application for each
+        successive request on the connection.
+    """
+
+    TASK = "task"
+    EAGER = "eager"
+    WORKER = "worker"
+
+
 class HTTPWSProtocol(asyncio.BufferedProtocol):
     """
     HTTP and WebSocket protocol class with manual control of the receive buffer.
+
+    The HTTP parser and HTTP connection are reset and reused for each request on a
+    keep-alive connection rather than allocated again.
     """
 
-    def __init__(self, app: ASGIApp) -> None:
+    __slots__ = (
+        "app",
+        "task_mode",
+        "app_worker",
+        "app_requests",
+        "broadcast_hub",
+        "response_cache",
+        "fast_path",
+        "compressor",
+        "body_spooler",
+        "request_body",
+        "http2_settings",
+        "metrics",
+        "overload",
+        "capture",
+        "capture_id",
+        "access_log",
+        "connections",
+        "lifespan_state",
+        "server_timing",
+        "parse_time",
+        "request_started",
+        "write_paused_at",
+        "groups",
+        "outbound",
+        "outbound_limit",
+        "outbound_policy",
+        "heartbeat",
+        "heartbeat_tick",
+        "awaiting_pong",
+        "asgi_connection",
+        "http_connection",
+        "state",
+        "parser",
+        "http_parser",
+        "handshake_headers",
+        "subprotocols",
+        "http_version",
+        "scheme",
+        "server",
+        "client",
+        "transport",
+        "buffer_data",
+        "low_water_limit",
+        "high_water_limit",
+        "write_paused",
+        "reading_paused",
+        "pipelined",
+        "replaying",
+        "frame_data",
+        "drain_waiter",
+        "scope",
+        "scope_template",
+        "keep_alive",
+        "responded",
+        "accepted",
+    )
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        broadcast_hub: BroadcastHub = None,
+        heartbeat: HeartbeatScheduler = None,
+        outbound_limit: int = 1048576,
+        outbound_policy: SlowConsumerPolicy = SlowConsumerPolicy.BLOCK,
+        task_mode: TaskMode = TaskMode.TASK,
+        target_cache: RequestTargetCache = None,
+        response_cache: ResponseCache = None,
+        fast_path: FastPathRouter = None,
+        compressor: ResponseCompressor = None,
+        body_spooler: RequestBodySpooler = None,
+        http2_settings: HTTP2Settings = None,
+        metrics: ServerMetrics = None,
+        overload: LoopLagMonitor = None,
+        capture: TrafficCapture = None,
+        access_log: AccessLog = None,
+        connections: Set["HTTPWSProtocol"] = None,
+        lifespan_state: dict = None,
+        server_timing: bool = False,
+    ) -> None:
         self.app: ASGIApp = app
+        self.task_mode: TaskMode = task_mode
+        self.app_worker: asyncio.Task = None
+        self.app_requests: asyncio.Queue = None
+        self.broadcast_hub: BroadcastHub = broadcast_hub
+        self.response_cache: ResponseCache = response_cache
+        self.fast_path: FastPathRouter = fast_path
+        self.compressor: ResponseCompressor = compressor
+        self.body_spooler: RequestBodySpooler = body_spooler
+        self.request_body: RequestBodyDecoder = None
+        self.http2_settings: HTTP2Settings = http2_settings or DEFAULT_HTTP2_SETTINGS
+        self.metrics: ServerMetrics = metrics
+        self.overload: LoopLagMonitor = overload
+        self.capture: TrafficCapture = capture
+        self.capture_id: int = None
+        self.access_log: AccessLog = access_log
+        self.connections: Set[HTTPWSProtocol] = connections
+        self.lifespan_state: dict = lifespan_state
+        self.server_timing: bool = server_timing
+        self.parse_time: int = None
+        self.request_started: int = None
+        self.write_paused_at: int = None
+        self.groups: Set[str] = set()
+        self.outbound: OutboundQueue = None
+        self.outbound_limit: int = outbound_limit
+        self.outbound_policy: SlowConsumerPolicy = outbound_policy
+        self.heartbeat: HeartbeatScheduler = heartbeat
+        self.heartbeat_tick: int = None
+        self.awaiting_pong: bool = False
         self.asgi_connection: Union[ASGIWebSocketConnection, ASGIHTTPConnection] = None
-        self.asgi_instance: ASGIInstance = None
+        self.http_connection: ASGIHTTPConnection = None
         self.state: HTTPWSProtocolState = HTTPWSProtocolState.REQUEST
-        self.parser: Union[WebSocketParser, HTTPParser] = HTTPParser()
+        self.http_parser: HTTPParser = HTTPParser(target_cache=target_cache)
+        self.parser: Union[WebSocketParser, HTTPParser, HTTP2Parser] = self.http_parser
         self.handshake_headers: List[Tuple[bytes, bytes]] = None
         self.subprotocols: List[bytes] = None
         self.http_version: str = "1.1"
@@ -46,40 +245,126 @@ class HTTPWSProtocol(asyncio.BufferedProtocol):
         self.low_water_limit: int = 16384
         self.high_water_limit: int = 65536
         self.write_paused: bool = False
+        self.reading_paused: bool = False
+        self.pipelined: bytes = b""
+        self.replaying: bool = False
+        self.frame_data: bytearray = None
         self.drain_waiter: asyncio.Event = None
-        self.app_queue: asyncio.Queue = None
         self.scope: Scope = None
-        self.content: List[Tuple] = None
+        self.scope_template: Scope = None
         self.keep_alive: bool = True
+        self.responded: bool = False
         self.accepted: bool = False
 
     def connection_made(self, transport: asyncio.BaseTransport) -> None:
-        self.transport = transport
+        if self.metrics is not None:
+            self.metrics.connections += 1
+            transport = MeteredTransport(transport, self.metrics)
+        if self.overload is not None:
+            self.overload.connections.add(self)
+        if self.capture is not None:
+            self.capture_id = self.capture.open_connection()
+        if self.connections is not None:
+            self.connections.add(self)
+        self.transport: asyncio.Transport = transport
         self.client = self.transport.get_extra_info("peername")
         self.server = self.transport.get_extra_info("sockname")
+        ssl_object = self.transport.get_extra_info("ssl_object")
+        if ssl_object is not None:
+            self.scheme = "https"
+
+        # The scope values that are constant for every request on the connection.
+        self.scope_template = {
+            "type": "http",
+            "server": self.server,
+            "client": self.client,
+            "scheme": self.scheme,
+            "extensions": HTTP_EXTENSIONS,
+        }
         self.drain_waiter = asyncio.Event()
         self.drain_waiter.set()
 
+        if ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2":
+            # HTTP/2 was negotiated with ALPN, the client sends the entire connection
+            # preface.
+            self.start_http2(H2_PREFACE)
+
+    def connection_lost(self, exc: Exception) -> None:
+        if self.metrics is not None:
+            self.metrics.connections_closed += 1
+        if self.overload is not None:
+            self.overload.connections.discard(self)
+        if self.capture_id is not None:
+            self.capture.close_connection(self.capture_id)
+        if self.connections is not None:
+            self.connections.discard(self)
+        if self.groups:
+            self.broadcast_hub.leave_all(self)
+        if self.heartbeat_tick is not None:
+            self.heartbeat.unregister(self)
+        if self.outbound is not None:
+            self.outbound.abort()
+        if self.state is HTTPWSProtocolState.HTTP2:
+            self.parser.connection_lost()
+        elif self.state in RESPONDING_STATES:
+            # An application waiting for the request body or for the transport to
+            # drain would otherwise wait forever, which for a WSGI application blocks
+            # a thread of the pool. Fast-path handlers and requests waiting on the
+            # response cache have no application running.
+            asgi_connection = self.asgi_connection
+            if asgi_connection is not None and asgi_connection.app_running:
+                asgi_connection.put_message({"type": "http.disconnect"})
+            self.drain_waiter.set()
+        elif self.state is HTTPWSProtocolState.FRAMING:
+            # The peer dropped the connection without a close frame, an application
+            # waiting for the next message would otherwise wait forever.
+            self.asgi_connection.disconnect(ABNORMAL_CLOSURE_CODE)
+        if self.app_worker is not None:
+            # Stop the worker once the current application has completed.
+            self.app_requests.put_nowait(None)
+
     def eof_received(self) -> None:
         pass
 
-    def get_buffer(self, sizehint: int) -> bytearray:
+    def get_buffer(self, sizehint: int) -> memoryview:
         """
         Called to allocate a new receive buffer.
+
+        A view of the buffer is returned because the TLS transport reads each TLS
+        record after the first into a slice of the buffer, and slicing a bytearray
+        would copy it.
         """
+        large_buffer = (
+            self.state is HTTPWSProtocolState.BODY
+            or self.state is HTTPWSProtocolState.HTTP2
+        )
+        if large_buffer and sizehint < BODY_BUFFER_SIZE:
+            sizehint = BODY_BUFFER_SIZE
         if len(self.buffer_data) < sizehint:
-            self.buffer_data.extend(0 for _ in range(sizehint - len(self.buffer_data)))
-        return self.buffer_data
+            self.buffer_data.extend(bytes(sizehint - len(self.buffer_data)))
+        return memoryview(self.buffer_data)
 
     def buffer_updated(self, nbytes: int, is_writable: bool = False) -> None:
         """
         Called when the buffer was updated with the received data.
         """
+        if is_writable:
+            self.transport.write(self.buffer_data[:nbytes])
+            return
+
+        if self.metrics is not None:
+            self.metrics.bytes_received += nbytes
+        if self.capture_id is not None:
+            self.capture.record(self.capture_id, self.buffer_data[:nbytes])
         if self.state is HTTPWSProtocolState.REQUEST:
             self.on_header(self.buffer_data[:nbytes])
-        elif is_writable:
-            self.transport.write(self.buffer_data[:nbytes])
-        else:
+        elif self.state is HTTPWSProtocolState.BODY:
+            self.on_body(bytes(self.buffer_data[:nbytes]))
+        elif self.state is HTTPWSProtocolState.HTTP2:
+            self.parser.feed(self.buffer_data[:nbytes])
+        elif self.state is HTTPWSProtocolState.RESPONSE:
+            self.on_pipelined(bytes(self.buffer_data[:nbytes]))
+        elif self.state is HTTPWSProtocolState.FRAMING:
             self.on_frame(self.buffer_data[:nbytes])
 
     def on_header(self, data: bytes) -> None:
@@ -87,11 +372,20 @@ class HTTPWSProtocol(asyncio.BufferedProtocol):
         Called when request data is received and the parser has not completed.
         """
 
+        metrics = self.metrics
+        if (metrics is not None or self.server_timing) and self.request_started is None:
+            self.request_started = time.perf_counter_ns()
+
         # The request headers  are currently being parsed, so the incoming request data
         # will be fed to the parser instance until it is complete.
         self.parser.parse_headers(data)
 
         if self.parser.is_complete:
+            if self.request_started is not None:
+                self.parse_time = time.perf_counter_ns() - self.request_started
+                self.request_started = None
+                if metrics is not None:
+                    metrics.header_parse.observe(self.parse_time)
 
             # Once the parser has completed reading the headers, update the state and
             # finalise the headers.
@@ -103,30 +397,98 @@ class HTTPWSProtocol(asyncio.BufferedProtocol):
         Called when the request headers have been completely parsed to build the ASGI
         connection scope and handling any upgrade requests.
         """
-        headers = [
-            (header.lower(), header_value)
-            for header, header_value in self.parser.headers
-        ]
+        parser = self.parser
+
+        if parser.http_method == "PRI" and parser.path == "*":
+            # The HTTP/2 connection preface was received, the HTTP/1.1 parser has read
+            # it as far as its empty header block.
+            self.start_http2(H2_PREFACE_REMAINDER)
+            if parser.body_data:
+                self.parser.feed(parser.body_data)
+            return
 
-        # Build the ASGI connection scope using the protocol and parser details.
-        self.scope = {
-            "type": "http",
-            "http_version": self.parser.http_version,
-            "server": self.server,
-            "client": self.client,
-            "scheme": self.scheme,
-            "method": self.parser.http_method,
-            "path": self.parser.path,
-            "query_string": self.parser.query_string,
-            "headers": headers,
-        }
+        if self.metrics is not None:
+            self.metrics.requests += 1
+
+        if self.overload is not None and self.overload.should_reject():
+            self.on_overload()
+            return
+
+        if parser.invalid_header is not None:
+            self.on_bad_request(parser.invalid_header)
+            return
+
+        upgrade = None
+        if parser.upgrade_header is not None:
+            upgrade = parser.upgrade_header[1].lower()
+            # An h2c upgrade of a request with a body is ignored, and the request is
+            # handled with HTTP/1.1.
+            if upgrade == b"h2c" and (
+                parser.content_length or parser.transfer_encoding
+            ):
+                upgrade = None
+
+        # Determine how the request body is framed, if the request has a body.
+        self.request_body = None
+        transfer_encoding = parser.transfer_encoding
+        if transfer_encoding is not None:
+            # A body that is not framed by a final chunked coding, or is framed by both
+            # headers, could be framed differently by a proxy in front of the server, so
+            # it is rejected rather than read as the next request.
+            last_coding = transfer_encoding.rsplit(b",", 1)[-1].strip().lower()
+            if last_coding != b"chunked" or parser.content_length is not None:
+                self.on_bad_request(b"Invalid transfer-encoding.")
+                return
+        if upgrade is None:
+            if transfer_encoding is not None:
+                self.request_body = RequestBodyDecoder(chunked=True)
+            elif parser.content_length is not None:
+                # `int` also accepts signs and whitespace, a negative length would
+                # leave the body incomplete forever.
+                if not parser.content_length.isdigit():
+                    self.on_bad_request(b"Invalid content-length.")
+                    return
+                content_length = int(parser.content_length)
+                if content_length:
+                    self.request_body = RequestBodyDecoder(content_length)
+
+        # Data following a request without a body is the start of the next pipelined
+        # request, which is parsed once the response has completed.
+        if self.request_body is None and upgrade is None and parser.body_data:
+            self.pipelined = parser.body_data
+
+        # Requests matching a fast-path route are answered without building a scope or
+        # running the ASGI application.
+        if (
+            self.fast_path is not None
+            and upgrade is None
+            and self.request_body is None
+            and self.fast_path.dispatch(self)
+        ):
+            return
 
-        if self.parser.upgrade_header is not None:
+        # Build the ASGI connection scope from the per-connection template, the parser
+        # has already lowercased the header names so its headers list is used as is.
+        scope = self.scope_template.copy()
+        scope["http_version"] = HTTP_VERSIONS.get(parser.http_version, "1.1")
+        scope["method"] = parser.http_method
+        scope["path"] = parser.path
+        scope["query_string"] = parser.query_string
+        scope["headers"] = parser.headers
+        if self.lifespan_state is not None:
+            scope["state"] = self.lifespan_state.copy()
+        self.scope = scope
+
+        if upgrade is not None:
+
+            if upgrade == b"h2c":
+                self.on_h2c_upgrade()
+                return
 
             # An unsupported upgrade header was received, return a 500 response.
-            if self.parser.upgrade_header[1] != b"websocket":
+            if upgrade != b"websocket":
                 logger.debug(
-                    f"Unsupported upgrade header: {self.parser.upgrade_header}"
+                    "Unsupported upgrade header: %s", self.parser.upgrade_header
                 )
                 content = b"".join(get_server_headers(500))
                 self.transport.write(
@@ -137,62 +499,352 @@ class HTTPWSProtocol(asyncio.BufferedProtocol):
 
             self.on_upgrade()
 
+        elif self.request_body is not None:
+            self.state = HTTPWSProtocolState.BODY
+            body_data = parser.body_data
+            if parser.expect is not None and parser.expect.lower() == b"100-continue":
+                self.transport.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            self.run_http_app()
+            if body_data:
+                self.on_body(body_data)
+
+        elif self.response_cache is not None and parser.http_method == "GET":
+            # Answer the request from the response cache when possible, otherwise the
+            # response of the application is stored under the returned key.
+            cache_key = self.response_cache.lookup(self)
+            if cache_key is not None:
+                self.run_http_app(cache_key)
+
         else:
-            # This is an HTTP request, create an HTTP connection.
+            self.run_http_app()
+
+    def run_http_app(self, cache_key: tuple = None) -> None:
+        """
+        Run the application for an HTTP request, reusing the HTTP connection of the
+        previous request unless its application is still running.
+        """
+        asgi_connection = self.http_connection
+        if asgi_connection is None or asgi_connection.app_running:
             asgi_connection = ASGIHTTPConnection(protocol=self)
-            asgi_connection.run_asgi(app=self.app, scope=self.scope)
-            self.asgi_connection = asgi_connection
+            self.http_connection = asgi_connection
+        else:
+            asgi_connection.reset()
+        asgi_connection.cache_key = cache_key
+        if self.request_body is not None and self.body_spooler is not None:
+            # The body is buffered before it is received by the application, which
+            # can also retrieve it as a file.
+            spool = self.body_spooler.create_spool()
+            asgi_connection.spool = spool
+            self.scope["extensions"] = {
+                **HTTP_EXTENSIONS,
+                "http.request.body_file": {"get_file": spool.get_file},
+            }
+        asgi_connection.run_asgi(app=self.app, scope=self.scope)
+        self.asgi_connection = asgi_connection
 
-    def on_upgrade(self) -> None:
+    def start_http2(self, preface: bytes) -> HTTP2Parser:
+        """
+        Switch the connection to HTTP/2 and send the server connection preface. The
+        parser then expects the rest of the client connection preface.
+        """
+        self.parser = HTTP2Parser(self, self.http2_settings, preface)
+        self.state = HTTPWSProtocolState.HTTP2
+        self.parser.start()
+        return self.parser
+
+    def on_h2c_upgrade(self) -> None:
+        """
+        Upgrade the connection to HTTP/2 from HTTP/1.1. The upgrade request becomes the
+        first stream, and its response is sent with HTTP/2.
+        """
+        parser = self.parser
+        http2_settings = [
+            value for name, value in parser.headers if name == b"http2-settings"
+        ]
+
+        # The upgrade is ignored without exactly one valid HTTP2-Settings header.
+        try:
+            if len(http2_settings) != 1:
+                raise ValueError("Expected one HTTP2-Settings header")
+            value = http2_settings[0].strip()
+            payload = base64.urlsafe_b64decode(value + b"=" * (-len(value) % 4))
+            settings = parse_settings(payload)
+        except (ValueError, HTTP2Error) as exc:
+            logger.debug("Ignoring h2c upgrade: %s", exc)
+            self.run_http_app()
+            return
+
+        self.transport.write(
+            b"HTTP/1.1 101 Switching Protocols\r\nConnection: Upgrade\r\n"
+            b"Upgrade: h2c\r\n\r\n"
+        )
+        body_data = parser.body_data
+        headers = [
+            (name, value)
+            for name, value in parser.headers
+            if name not in H2C_UPGRADE_HEADERS
+        ]
+        target = parser.path.encode("ascii")
+        if parser.query_string:
+            target = b"?".join([target, parser.query_string.encode("ascii")])
+
+        http2_parser = self.start_http2(H2_PREFACE)
+        http2_parser.apply_settings(settings)
+        http2_parser.last_stream_id = 1
+        http2_parser.open_stream(1, parser.http_method, target, headers, True)
+        if body_data:
+            http2_parser.feed(body_data)
+
+    def create_http2_connection(
+        self, stream_id: int, end_stream: bool
+    ) -> ASGIHTTP2Connection:
+        if self.metrics is not None:
+            self.metrics.streams += 1
+        return ASGIHTTP2Connection(self, stream_id, end_stream)
+
+    def on_body(self, data: bytes) -> None:
+        """
+        Called when request body data is received, the decoded body is passed to the
+        HTTP connection.
+        """
+        request_body = self.request_body
+        try:
+            body = request_body.feed(data)
+        except RequestBodyError as exc:
+            self.on_bad_request(str(exc).encode())
+            return
+
+        asgi_connection = self.asgi_connection
+        if body or request_body.complete:
+            asgi_connection.on_request_body(body, request_body.complete)
+
+        if request_body.complete:
+            self.request_body = None
+            self.pipelined = request_body.excess
+            self.buffer_data = bytearray(100)
+            if self.state is HTTPWSProtocolState.BODY:
+                self.state = HTTPWSProtocolState.RESPONSE
+            if self.reading_paused and not self.pipelined:
+                self.reading_paused = False
+                self.transport.resume_reading()
+        elif (
+            asgi_connection.queued_body > self.high_water_limit
+            and not self.reading_paused
+        ):
+            # The application is receiving the body slower than it arrives, reading is
+            # resumed once it has caught up.
+            self.reading_paused = True
+            self.transport.pause_reading()
+
+    def on_body_received(self, queued_body: int) -> None:
+        """
+        Called when the application receives a part of the request body, with the size
+        of the body still queued for it.
+        """
+        if (
+            self.reading_paused
+            and self.state is HTTPWSProtocolState.BODY
+            and queued_body <= self.low_water_limit
+        ):
+            self.reading_paused = False
+            self.transport.resume_reading()
+
+    def on_pipelined(self, data: bytes) -> None:
+        """
+        Called when request data is received while a response is in progress. Reading
+        is paused once more than the high water limit has been buffered.
+        """
+        self.pipelined += data
+        if len(self.pipelined) > self.high_water_limit and not self.reading_paused:
+            self.reading_paused = True
+            self.transport.pause_reading()
+
+    def replay_pipelined(self) -> None:
+        """
+        Parse the pipelined requests received while the previous response was in
+        progress, until a response does not complete immediately.
+        """
+        self.replaying = True
+        try:
+            while self.pipelined and self.state is HTTPWSProtocolState.REQUEST:
+                data = self.pipelined
+                self.pipelined = b""
+                self.on_header(data)
+        finally:
+            self.replaying = False
+        if self.reading_paused and not self.pipelined:
+            self.reading_paused = False
+            self.transport.resume_reading()
+
+    def on_bad_request(self, reason: bytes) -> None:
+        """Return a 400 response for a request that cannot be read and close."""
+        if self.metrics is not None:
+            self.metrics.parse_errors += 1
+        content = b"".join(get_server_headers(400))
+        self.transport.write(b"".join([content, b"\r\n", reason, b"\r\n"]))
+        self.transport.close()
+        self.state = HTTPWSProtocolState.CLOSED
+
+    def on_overload(self) -> None:
+        """Return a 503 response while the server is shedding load and close."""
+        self.transport.write(SHED_RESPONSE.get_content())
+        self.transport.close()
+        self.state = HTTPWSProtocolState.CLOSED
+
+    def close_if_idle(self) -> bool:
+        """
+        Close a keep-alive connection between requests, returning whether it was closed.
+        New connections are left open, as their first request may not have been read
+        yet.
+        """
+        if self.state is HTTPWSProtocolState.HTTP2:
+            parser = self.parser
+            if parser.streams or parser.closed or not parser.last_stream_id:
+                return False
+            parser.close(ErrorCode.NO_ERROR, "Shedding load")
+            return True
+        if (
+            self.state is not HTTPWSProtocolState.REQUEST
+            or not self.responded
+            or self.http_parser.raw_headers
+        ):
+            return False
+        self.transport.close()
+        self.state = HTTPWSProtocolState.CLOSED
+        return True
+
+    def shutdown(self) -> None:
+        """
+        Called when the server is shutting down. Idle connections are closed, a request
+        in progress is answered before the connection is closed, HTTP/2 connections
+        complete their open streams after a GOAWAY frame and WebSocket connections are
+        closed with a 1001 close frame.
+        """
+        self.keep_alive = False
+        state = self.state
+        if state is HTTPWSProtocolState.HTTP2:
+            self.parser.shutdown()
+        elif state is HTTPWSProtocolState.FRAMING:
+            self.transport.write(GOING_AWAY_FRAME)
+            self.transport.close()
+            self.asgi_connection.disconnect(WebSocketCloseCode.GOING_AWAY.value)
+        elif state is HTTPWSProtocolState.REQUEST and not self.http_parser.raw_headers:
+            self.transport.close()
+            self.state = HTTPWSProtocolState.CLOSED
 
-        # Retrieve the header key and generate the accept key.
-        accept_key = None
-        subprotocols = None
-        for header, header_value in self.parser.headers:
-            if header == b"Sec-WebSocket-Key":
-                accept_key = get_websocket_accept_key(header_value)
-            if header == b"Sec-WebSocket-Protocol":
-                subprotocols = header_value
+    def on_upgrade(self) -> None:
 
         # The websocket key is missing, return a 403 response.
-        if accept_key is None:
+        if self.parser.sec_websocket_key is None:
             content = b"".join(get_server_headers(403))
             self.transport.write(b"".join([content, b"\r\n"]))
             self.transport.close()
             return
 
+        # Generate the accept key from the header key recorded by the parser.
+        accept_key = get_websocket_accept_key(self.parser.sec_websocket_key)
         accept_header = b"".join([b"Sec-WebSocket-Accept: ", accept_key, b"\r\n"])
         self.handshake_headers = b"".join(
             [b"Upgrade: WebSocket\r\nConnection: Upgrade\r\n", accept_header]
         )
 
-        if subprotocols:
-            subprotocols = subprotocols.split(b",")
-
-        self.scheme = "wss" if self.scope["scheme"] == "http" else "ws"
+        subprotocols = []
+        if self.parser.sec_websocket_protocol:
+            subprotocols = [
+                subprotocol.strip().decode("ascii")
+                for subprotocol in self.parser.sec_websocket_protocol.split(b",")
+            ]
 
+        scheme = "wss" if self.scheme == "https" else "ws"
         self.scope.update(
-            {"type": "websocket", "subprotocols": subprotocols, "scheme": self.scheme}
+            {"type": "websocket", "subprotocols": subprotocols, "scheme": scheme}
+        )
+        self.outbound = OutboundQueue(
+            self, limit=self.outbound_limit, policy=self.outbound_policy
         )
+        self.scope["extensions"] = {
+            "websocket.send_queue": {
+                "limit": self.outbound_limit,
+                "policy": self.outbound_policy.value,
+                "stats": self.outbound.stats,
+            }
+        }
+        if self.broadcast_hub is not None:
+            self.scope["extensions"]["websocket.broadcast"] = {}
 
         asgi_connection = ASGIWebSocketConnection(protocol=self)
         asgi_connection.run_asgi(app=self.app, scope=self.scope)
         self.asgi_connection = asgi_connection
 
         self.parser = WebSocketParser(protocol=self)
+        self.frame_data = bytearray()
         self.state = HTTPWSProtocolState.FRAMING
 
+    def start_app(self, coro: Coroutine) -> None:
+        """
+        Called by the ASGI connection to run the application coroutine for a request.
+        """
+        if self.state is HTTPWSProtocolState.HTTP2:
+            # The streams of an HTTP/2 connection are run concurrently.
+            if self.task_mode is TaskMode.EAGER:
+                create_eager_task(coro)
+            else:
+                asyncio.create_task(coro)
+        elif self.task_mode is TaskMode.WORKER:
+            if self.app_worker is None:
+                self.app_requests = asyncio.Queue()
+                self.app_requests.put_nowait(coro)
+                self.app_worker = create_eager_task(self.run_app_worker())
+            else:
+                self.app_requests.put_nowait(coro)
+        elif self.task_mode is TaskMode.EAGER:
+            create_eager_task(coro)
+        else:
+            asyncio.create_task(coro)
+
+    async def run_app_worker(self) -> None:
+        """
+        Run the application coroutines of successive requests on the connection without
+        creating a task for each request.
+        """
+        while True:
+            coro = await self.app_requests.get()
+            if coro is None:
+                break
+            try:
+                await coro
+            except Exception:
+                logger.exception("Exception in ASGI application")
+
     def on_frame(self, data: bytes) -> None:
+        """
+        Called when WebSocket data is received. The parser reads a whole frame at a
+        time, so the data is buffered until each frame is complete.
+        """
         assert (
             self.state is HTTPWSProtocolState.FRAMING
         ), "Invalid protocol state for framing."
-        asyncio.create_task(self.parser.parse_frame(data))
+        frame_data = self.frame_data
+        frame_data += data
+        while True:
+            frame_size = get_frame_size(frame_data)
+            if frame_size is None or len(frame_data) < frame_size:
+                break
+            frame = frame_data[:frame_size]
+            del frame_data[:frame_size]
+            asyncio.create_task(self.parser.parse_frame(frame))
 
     async def feed_data(
         self, content: Union[bytes, str], is_writable: bool = True
     ) -> None:
         if isinstance(content, str):
             content = content.encode()
+        if is_writable:
+            # Responses are written to the transport directly rather than through the
+            # receive buffer, which cannot be resized while the transport holds a view
+            # of it, such as when an eager task responds within `buffer_updated`.
+            self.transport.write(content)
+            return
         buf_size = len(content)
         buf = self.get_buffer(buf_size)
         buf[:buf_size] = content
@@ -212,6 +864,9 @@ class HTTPWSProtocol(asyncio.BufferedProtocol):
         assert not self.write_paused, "Invalid"
         self.write_paused = True
         self.drain_waiter.clear()
+        if self.metrics is not None:
+            self.metrics.write_pauses += 1
+            self.write_paused_at = time.perf_counter_ns()
 
     def resume_writing(self) -> None:
         """
@@ -220,25 +875,51 @@ class HTTPWSProtocol(asyncio.BufferedProtocol):
         assert self.write_paused, "Invalid write state"
         self.write_paused = False
         self.drain_waiter.set()
+        if self.write_paused_at is not None:
+            self.metrics.write_drain.observe(
+                time.perf_counter_ns() - self.write_paused_at
+            )
+            self.write_paused_at = None
+
+        if self.outbound is not None:
+            # Write any frames that were queued while writing was paused.
+            self.outbound.flush()
 
     def on_response_complete(self) -> None:
         """
         Called when the ASGI connection and response has completed.
         """
-        if not self.keep_alive:
+        if not self.keep_alive or self.state is HTTPWSProtocolState.BODY:
+            # The connection cannot be reused if the application responded before the
+            # request body was completely received.
             self.transport.close()
         else:
             self.state = HTTPWSProtocolState.REQUEST
-            self.parser = HTTPParser()
+            self.responded = True
+            self.parser.reset()
+            # A response completed while replaying is continued by the replay loop.
+            if self.pipelined and not self.replaying:
+                self.replay_pipelined()
 
     def accept(self) -> None:
         """
         Called when accepting the websocket connection.
         """
         self.accepted = True
+        if self.metrics is not None:
+            self.metrics.websocket_connections += 1
         server_headers = b"".join(get_server_headers(101))
         content = b"".join([server_headers, self.handshake_headers, b"\r\n"])
         self.transport.write(content)
+        if self.heartbeat is not None:
+            self.heartbeat.register(self)
+
+    def on_pong(self) -> None:
+        """
+        Called when a pong frame is received.
+        """
+        if self.heartbeat_tick is not None:
+            self.heartbeat.on_pong(self)
 
     def reject(self) -> None:
         """
@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import time
+from typing import Dict, Iterable, List
+
+from starlette.types import ASGIApp
+
+from aiobufpro.bench import BenchApp, get_percentile
+from aiobufpro.capture import CaptureRecord, RecordKind, read_capture
+from aiobufpro.protocol import RESPONDING_STATES, HTTPWSProtocol, TaskMode
+from aiobufpro.server import import_app
+
+
+class ReplayTransport(asyncio.Transport):
+    """
+    The transport of a replayed connection, counting the bytes written by the protocol
+    and closing the connection as the event loop would.
+    """
+
+    def __init__(self, protocol: HTTPWSProtocol, connection_id: int) -> None:
+        super().__init__()
+        self.protocol: HTTPWSProtocol = protocol
+        self.peername = ("127.0.0.1", 10000 + connection_id % 50000)
+        self.bytes_written: int = 0
+        self.closing: bool = False
+        self.resumed: asyncio.Event = asyncio.Event()
+        self.resumed.set()
+
+    def get_extra_info(self, name, default=None):
+        if name == "peername":
+            return self.peername
+        if name == "sockname":
+            return ("127.0.0.1", 8000)
+        return default
+
+    def write(self, data) -> None:
+        self.bytes_written += len(data)
+
+    def writelines(self, list_of_data) -> None:
+        for data in list_of_data:
+            self.bytes_written += len(data)
+
+    def pause_reading(self) -> None:
+        self.resumed.clear()
+
+    def resume_reading(self) -> None:
+        self.resumed.set()
+
+    def is_reading(self) -> bool:
+        return self.resumed.is_set()
+
+    def close(self) -> None:
+        if not self.closing:
+            self.closing = True
+            self.resumed.set()
+            asyncio.get_running_loop().call_soon(self.protocol.connection_lost, None)
+
+    def is_closing(self) -> bool:
+        return self.closing
+
+
+class Replayer:
+    """
+    Replays the records of a capture file in the order they were recorded, at the speed
+    they were received or as fast as the records can be fed.
+
+    In-process, each read is fed to `buffer_updated` of a protocol instance with the
+    same boundaries it was received with, and the time spent handling it is recorded.
+    Over a socket, each read is sent to a running server as a separate write, which the
+    network may combine with other writes.
+    """
+
+    def __init__(self, records: List[CaptureRecord], options: argparse.Namespace):
+        self.records: List[CaptureRecord] = records
+        self.options: argparse.Namespace = options
+        self.app: ASGIApp = None
+        self.read_times: List[float] = []
+        self.bytes_received: int = 0
+        self.bytes_written: int = 0
+        self.skipped_reads: int = 0
+        self.stalled: int = 0
+
+    async def wait_until(self, start: float, timestamp: float) -> None:
+        loop = asyncio.get_running_loop()
+        delay = 0.0
+        if self.options.speed == "original":
+            delay = start + timestamp - loop.time()
+        # Yield at least once, so the application runs between reads as it would have.
+        await asyncio.sleep(max(delay, 0.0))
+
+    async def replay_in_process(self) -> None:
+        loop = asyncio.get_running_loop()
+        connections: Dict[int, ReplayTransport] = {}
+        task_mode = TaskMode(self.options.task_mode)
+        start = loop.time()
+        for record in self.records:
+            await self.wait_until(start, record.timestamp)
+            if record.kind is RecordKind.OPEN:
+                protocol = HTTPWSProtocol(self.app, task_mode=task_mode)
+                transport = ReplayTransport(protocol, record.connection_id)
+                connections[record.connection_id] = transport
+                protocol.connection_made(transport)
+                continue
+
+            transport = connections.get(record.connection_id)
+            if transport is None:
+                continue
+            if record.kind is RecordKind.CLOSE:
+                if not transport.closing:
+                    transport.protocol.eof_received()
+                    transport.close()
+                continue
+            if not transport.resumed.is_set():
+                # The protocol paused reading, the read is fed once it resumes.
+                try:
+                    await asyncio.wait_for(
+                        transport.resumed.wait(), self.options.timeout
+                    )
+                except asyncio.TimeoutError:
+                    self.stalled += 1
+                    transport.close()
+            if transport.closing:
+                # The server closed the connection before the client sent the data.
+                self.skipped_reads += 1
+                continue
+            self.feed(transport.protocol, record.data)
+
+        await self.wait_for_responses(connections.values())
+        # The clients of the connections left open when the capture ended are gone.
+        for transport in connections.values():
+            transport.close()
+        await self.stop_applications()
+        for transport in connections.values():
+            self.bytes_written += transport.bytes_written
+
+    def feed(self, protocol: HTTPWSProtocol, data: bytes) -> None:
+        nbytes = len(data)
+        started = time.perf_counter()
+        buffer = protocol.get_buffer(nbytes)
+        buffer[:nbytes] = data
+        # Release the view, so the protocol can resize the buffer.
+        buffer.release()
+        protocol.buffer_updated(nbytes)
+        self.read_times.append(time.perf_counter() - started)
+        self.bytes_received += nbytes
+
+    async def wait_for_responses(self, transports: Iterable[ReplayTransport]) -> None:
+        """Wait for the responses to the requests in progress on open connections."""
+        deadline = time.monotonic() + self.options.timeout
+        while time.monotonic() < deadline and any(
+            not transport.closing and transport.protocol.state in RESPONDING_STATES
+            for transport in transports
+        ):
+            await asyncio.sleep(0)
+
+    async def stop_applications(self) -> None:
+        """
+        Stop the applications still running once every connection has been closed, the
+        applications of WebSocket connections are not told the connection was lost.
+        """
+        await asyncio.sleep(0)
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    async def replay_socket(self) -> None:
+        loop = asyncio.get_running_loop()
+        host, port = self.options.host, self.options.port
+        writers: Dict[int, asyncio.StreamWriter] = {}
+        readers: List[asyncio.Task] = []
+        start = loop.time()
+        for record in self.records:
+            await self.wait_until(start, record.timestamp)
+            if record.kind is RecordKind.OPEN:
+                reader, writer = await asyncio.open_connection(host, port)
+                sock = writer.get_extra_info("socket")
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                writers[record.connection_id] = writer
+                readers.append(asyncio.create_task(self.drain_responses(reader)))
+                continue
+
+            writer = writers.get(record.connection_id)
+            if writer is None:
+                continue
+            if record.kind is RecordKind.CLOSE:
+                writer.close()
+                continue
+            if writer.is_closing():
+                self.skipped_reads += 1
+                continue
+            started = time.perf_counter()
+            writer.write(record.data)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                self.skipped_reads += 1
+                writer.close()
+                continue
+            self.read_times.append(time.perf_counter() - started)
+            self.bytes_received += len(record.data)
+
+        if readers:
+            # Wait for the responses of the connections the capture left open.
+            done, pending = await asyncio.wait(readers, timeout=self.options.timeout)
+            for task in pending:
+                task.cancel()
+        for writer in writers.values():
+            writer.close()
+
+    async def drain_responses(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                self.bytes_written += len(data)
+        except ConnectionError:
+            pass
+
+    async def run(self) -> dict:
+        self.read_times = []
+        self.bytes_received = 0
+        self.bytes_written = 0
+        self.skipped_reads = 0
+        self.stalled = 0
+        started = time.perf_counter()
+        if self.options.socket:
+            await self.replay_socket()
+        else:
+            await self.replay_in_process()
+        elapsed = time.perf_counter() - started
+
+        read_times = sorted(self.read_times)
+        result = {
+            "elapsed": round(elapsed, 6),
+            "reads": len(read_times),
+            "reads_per_second": round(len(read_times) / elapsed, 1),
+            "bytes_received": self.bytes_received,
+            "bytes_written": self.bytes_written,
+            "skipped_reads": self.skipped_reads,
+            "stalled": self.stalled,
+        }
+        if read_times:
+            result["read_ms"] = {
+                "p50": get_percentile(read_times, 0.5),
+                "p99": get_percentile(read_times, 0.99),
+                "max": round(read_times[-1] * 1000, 3),
+                "total": round(sum(read_times) * 1000, 3),
+            }
+        return result
+
+
+def filter_records(
+    records: Iterable[CaptureRecord], connection_ids: List[int] = None
+) -> List[CaptureRecord]:
+    """The records of the selected connections, with times relative to the first."""
+    if connection_ids:
+        selected = set(connection_ids)
+        records = [record for record in records if record.connection_id in selected]
+    else:
+        records = list(records)
+    if not records:
+        return records
+    offset = records[0].timestamp
+    return [record._replace(timestamp=record.timestamp - offset) for record in records]
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="aiobufpro replay",
+        description="Replay the connections of a traffic capture through the protocol "
+        "in-process or against a running server, reporting the time spent on the "
+        "reads as JSON.",
+    )
+    parser.add_argument("capture", help="Capture file written with --capture-file")
+    parser.add_argument(
+        "app",
+        nargs="?",
+        default=None,
+        help="ASGI application replayed in-process, a built-in by default",
+    )
+    parser.add_argument(
+        "--socket",
+        action="store_true",
+        help="Send the reads to a server running on the host and port",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Host")
+    parser.add_argument("--port", default=8000, type=int, help="Port")
+    parser.add_argument(
+        "--speed",
+        default="max",
+        choices=["original", "max"],
+        help="Replay the reads at the times they were received, or without waiting",
+    )
+    parser.add_argument(
+        "--connection",
+        action="append",
+        type=int,
+        help="Only replay the connection with this id, may be repeated",
+    )
+    parser.add_argument(
+        "--repeat", default=1, type=int, help="Times the capture is replayed"
+    )
+    parser.add_argument(
+        "--task-mode",
+        default="task",
+        choices=[mode.value for mode in TaskMode],
+        help="How the application is run for each request in-process",
+    )
+    parser.add_argument(
+        "--timeout",
+        default=10.0,
+        type=float,
+        help="Seconds to wait for the application or the server",
+    )
+    parser.add_argument("--output", default=None, help="Also write the report here")
+    options = parser.parse_args(args)
+
+    records = filter_records(read_capture(options.capture), options.connection)
+    replayer = Replayer(records, options)
+    if not options.socket:
+        replayer.app = import_app(options.app) if options.app else BenchApp
+    runs = [asyncio.run(replayer.run()) for _ in range(options.repeat)]
+
+    report = {
+        "config": {
+            "capture": options.capture,
+            "app": options.app or "builtin",
+            "mode": "socket" if options.socket else "in-process",
+            "speed": options.speed,
+            "task_mode": options.task_mode,
+            "python": sys.version.split()[0],
+        },
+        "connections": sum(1 for record in records if record.kind is RecordKind.OPEN),
+        "runs": runs,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if options.output is not None:
+        with open(options.output, "w") as output_file:
+            output_file.write(output)
@@ -3,30 +3,632 @@ import asyncio
 import sys
 import argparse
 import importlib
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import ssl
+import tempfile
+import threading
 from functools import partial
+from typing import Iterable, List, Tuple
 
 from starlette.types import ASGIApp
 
-from aiobufpro.protocol import HTTPWSProtocol
+from aiobufpro.accesslog import AccessLog, AccessLogFormat
+from aiobufpro.body import RequestBodySpooler
+from aiobufpro.broadcast import BroadcastHub, BroadcastPolicy
+from aiobufpro.bus import ThreadBus, ThreadBusRegistry, UnixBus
+from aiobufpro.cache import ResponseCache
+from aiobufpro.capture import TrafficCapture
+from aiobufpro.compression import ResponseCompressor
+from aiobufpro.fastpath import FastPathHandler, FastPathRouter
+from aiobufpro.heartbeat import HeartbeatScheduler
+from aiobufpro.lifespan import Lifespan, LifespanMode
+from aiobufpro.metrics import (
+    MetricsProtocol,
+    Samples,
+    ServerMetrics,
+    get_component_samples,
+    merge_samples,
+)
+from aiobufpro.outbound import SlowConsumerPolicy
+from aiobufpro.overload import LoopLagMonitor, ShedAction
+from aiobufpro.parsers.http import RequestTargetCache
+from aiobufpro.parsers.http2 import HTTP2Settings
+from aiobufpro.profiling import LoopProfiler, SlowCallbackMonitor
+from aiobufpro.protocol import HTTPWSProtocol, TaskMode
+from aiobufpro.shutdown import GracefulShutdown
+from aiobufpro.tls import create_ssl_context
+from aiobufpro.wsgi import AppInterface, WSGIApp
 
-
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger()
 
+# Seconds between the metric samples sent by each worker to worker 0.
+METRICS_PUBLISH_INTERVAL = 1.0
+
 
 class Server:
-    async def run_server(self, app: ASGIApp, host: str, port: int) -> None:
+    def __init__(
+        self,
+        broadcast_policy: BroadcastPolicy = BroadcastPolicy.SKIP,
+        workers: int = 1,
+        threads: int = 1,
+        ws_ping_interval: float = None,
+        ws_ping_timeout: float = 20.0,
+        ws_send_queue_limit: int = 1048576,
+        ws_slow_consumer_policy: SlowConsumerPolicy = SlowConsumerPolicy.BLOCK,
+        task_mode: TaskMode = TaskMode.TASK,
+        target_cache_size: int = 1024,
+        response_cache_size: int = 0,
+        compression: bool = False,
+        compression_min_size: int = 500,
+        compression_level: int = 6,
+        compression_thread_min_size: int = None,
+        body_spool_threshold: int = None,
+        body_memory_budget: int = 67108864,
+        h2_max_concurrent_streams: int = 100,
+        h2_initial_window_size: int = 65535,
+        h2_max_frame_size: int = 16384,
+        ssl_certfile: str = None,
+        ssl_keyfile: str = None,
+        ssl_keyfile_password: str = None,
+        ssl_ca_certs: str = None,
+        ssl_cert_reqs: int = ssl.CERT_NONE,
+        ssl_ciphers: str = None,
+        ssl_session_tickets: int = 2,
+        ssl_handshake_timeout: float = 60.0,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: int = None,
+        profile_duration: float = 10.0,
+        profile_dir: str = None,
+        slow_callback_duration: float = None,
+        shed_lag_threshold: float = None,
+        shed_recover_threshold: float = None,
+        shed_lag_interval: float = 0.05,
+        shed_actions: Iterable[ShedAction] = (ShedAction.REJECT,),
+        capture_file: str = None,
+        capture_sample_rate: float = 1.0,
+        capture_max_bytes: int = 104857600,
+        access_log: bool = False,
+        access_log_format: AccessLogFormat = AccessLogFormat.COMBINED,
+        access_log_sample_rate: float = 1.0,
+        access_log_file: str = None,
+        lifespan: LifespanMode = LifespanMode.AUTO,
+        shutdown_timeout: float = 30.0,
+        interface: AppInterface = AppInterface.ASGI,
+        wsgi_threads: int = 10,
+        wsgi_queue_depth: int = 10,
+        server_timing: bool = False,
+    ) -> None:
+        if workers > 1 and threads > 1:
+            raise ValueError("Worker processes and threads cannot be combined")
+        self.broadcast_hub = BroadcastHub(policy=broadcast_policy)
+        self.workers = workers
+        self.threads = threads
+        # The caches, spooler and compressor are shared by the event loop of every
+        # thread, the caches are only locked when there is more than one loop.
+        self.thread_bus: ThreadBusRegistry = None
+        self.thread_loops: List[Tuple[asyncio.AbstractEventLoop, asyncio.Task]] = []
+        if threads > 1:
+            self.thread_bus = ThreadBusRegistry()
+        self.ws_send_queue_limit = ws_send_queue_limit
+        self.ws_slow_consumer_policy = ws_slow_consumer_policy
+        self.task_mode = task_mode
+        self.target_cache = RequestTargetCache(
+            maxsize=target_cache_size, lock=self.create_lock()
+        )
+        self.response_cache: ResponseCache = None
+        if response_cache_size:
+            self.response_cache = ResponseCache(
+                max_bytes=response_cache_size, lock=self.create_lock()
+            )
+        self.fast_path: FastPathRouter = FastPathRouter()
+        self.body_spooler: RequestBodySpooler = None
+        if body_spool_threshold is not None:
+            self.body_spooler = RequestBodySpooler(
+                threshold=body_spool_threshold, memory_budget=body_memory_budget
+            )
+        self.compressor: ResponseCompressor = None
+        if compression:
+            self.compressor = ResponseCompressor(
+                min_size=compression_min_size,
+                level=compression_level,
+                thread_min_size=compression_thread_min_size,
+            )
+        self.http2_settings = HTTP2Settings(
+            max_concurrent_streams=h2_max_concurrent_streams,
+            initial_window_size=h2_initial_window_size,
+            max_frame_size=h2_max_frame_size,
+        )
+        # The context is created before any worker processes are forked, so the
+        # session ticket keys are shared by every worker.
+        self.ssl_context: ssl.SSLContext = None
+        self.ssl_handshake_timeout = ssl_handshake_timeout
+        if ssl_certfile is not None:
+            self.ssl_context = create_ssl_context(
+                ssl_certfile,
+                keyfile=ssl_keyfile,
+                password=ssl_keyfile_password,
+                ca_certs=ssl_ca_certs,
+                cert_reqs=ssl_cert_reqs,
+                ciphers=ssl_ciphers,
+                session_tickets=ssl_session_tickets,
+            )
+        # The metrics are served on a separate admin listener by the first event loop
+        # of the first worker, aggregated from every loop and worker.
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.loop_states: List[Tuple[ServerMetrics, dict]] = []
+        # SIGUSR1 starts a profile of every event loop that receives it, which are
+        # started by the main thread when the loops run in other threads.
+        self.profile_duration = profile_duration
+        self.profile_dir = profile_dir or tempfile.gettempdir()
+        self.thread_profilers: List[Tuple[asyncio.AbstractEventLoop, LoopProfiler]] = []
+        self.slow_callback_duration = slow_callback_duration
+        # Each event loop samples its own lag and sheds load independently.
+        self.lag_monitor: LoopLagMonitor = None
+        self.lag_monitors: List[LoopLagMonitor] = []
+        if shed_lag_threshold is not None:
+            self.lag_monitor = LoopLagMonitor(
+                shed_lag_threshold,
+                recover_threshold=shed_recover_threshold,
+                interval=shed_lag_interval,
+                actions=frozenset(shed_actions),
+            )
+        # The traffic of every event loop in a process is captured to a single file,
+        # each worker process opens its own file once it has been forked.
+        self.capture_file = capture_file
+        self.capture_sample_rate = capture_sample_rate
+        self.capture_max_bytes = capture_max_bytes
+        self.capture: TrafficCapture = None
+        if capture_file is not None and workers == 1:
+            self.capture = TrafficCapture(
+                capture_file,
+                sample_rate=capture_sample_rate,
+                max_bytes=capture_max_bytes,
+                lock=self.create_lock(),
+            )
+        # The access log is written by a listener thread, started in each worker process
+        # once it has been forked.
+        self.access_log: AccessLog = None
+        if access_log:
+            self.access_log = AccessLog(
+                log_format=access_log_format,
+                sample_rate=access_log_sample_rate,
+                path=access_log_file,
+            )
+        # Each event loop runs the lifespan of the application and drains its own
+        # connections when the server is stopped.
+        self.lifespan = lifespan
+        self.shutdown_timeout = shutdown_timeout
+        self.shutdowns: List[Tuple[asyncio.AbstractEventLoop, GracefulShutdown]] = []
+        # A WSGI application is run in a thread pool of each worker process, shared by
+        # the event loops of the process.
+        self.interface = interface
+        self.wsgi_threads = wsgi_threads
+        self.wsgi_queue_depth = wsgi_queue_depth
+        self.server_timing = server_timing
+        self.bus: UnixBus = None
+        self.heartbeat: HeartbeatScheduler = None
+        if ws_ping_interval:
+            self.heartbeat = HeartbeatScheduler(
+                interval=ws_ping_interval, timeout=ws_ping_timeout
+            )
+
+    def create_lock(self) -> threading.Lock:
+        """A lock for state shared by the event loops, if running more than one."""
+        if self.threads > 1:
+            return threading.Lock()
+        return None
+
+    def request_shutdown(self) -> None:
+        """Stop every event loop of this process gracefully, from any thread."""
+        for loop, shutdown in list(self.shutdowns):
+            try:
+                loop.call_soon_threadsafe(shutdown.request)
+            except RuntimeError:
+                # The loop has already been closed.
+                pass
+
+    def add_route(self, method: str, path: str, handler: FastPathHandler) -> None:
+        """
+        Register a fast-path handler for a method and path, requests to the route are
+        handled without the ASGI application. See `FastPathRouter.add_route`.
+        """
+        self.fast_path.add_route(method, path, handler)
+
+    def add_static_route(self, path: str, body: bytes, **kwargs) -> None:
+        """Register a route answered with a precomputed response, such as `/healthz`."""
+        self.fast_path.add_static_route(path, body, **kwargs)
+
+    def collect_metrics(self) -> Samples:
+        """
+        The metric samples of every event loop in this process and of the shared server
+        components, including the latest samples sent by the other workers.
+        """
+        samples = {}
+        for metrics, components in self.loop_states:
+            metrics.get_samples(samples)
+            get_component_samples(samples, **components)
+        get_component_samples(
+            samples,
+            target_cache=self.target_cache if self.target_cache.maxsize else None,
+            response_cache=self.response_cache,
+            compressor=self.compressor,
+            body_spooler=self.body_spooler,
+            ssl_context=self.ssl_context,
+        )
+        if self.bus is not None:
+            for peer_samples in list(self.bus.peer_metrics.values()):
+                merge_samples(samples, peer_samples)
+        return samples
+
+    async def publish_metrics(self) -> None:
+        """Send the metrics of this worker to worker 0 at regular intervals."""
+        while True:
+            await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+            self.bus.send_metrics(self.collect_metrics())
+
+    async def run_server(
+        self,
+        app: ASGIApp,
+        host: str,
+        port: int,
+        sock: socket.socket = None,
+        worker_id: int = 0,
+        bus_dir: str = None,
+        thread_id: int = 0,
+    ) -> None:
         """
         Run protocol server that will handle both HTTP and WebSocket requests.
+
+        When running as one of several worker processes, the listening socket is shared
+        by the workers and the broadcast hub is connected to the other workers through
+        the bus sockets in `bus_dir`. When running as one of several threads, the loop
+        has its own broadcast hub and heartbeat timer, and the hubs of the loops are
+        connected by the thread bus.
+
+        When traffic is captured, the loops of a process share the capture file and
+        each worker process writes its own file, suffixed with the worker id.
+
+        When metrics are enabled, each loop counts its own connections, and the admin
+        listener is only started by the first loop of the first worker. When load
+        shedding is enabled, each loop samples its own lag and stops accepting from its
+        own listening socket.
+
+        The lifespan startup of the application completes before the loop accepts
+        connections. SIGTERM or SIGINT stops accepting and drains the connections of
+        the loop, before the lifespan shutdown.
         """
         loop = asyncio.get_running_loop()
-        protocol = partial(HTTPWSProtocol, app=app)
-        server = await loop.create_server(protocol, host=host, port=port)
+        broadcast_hub = self.broadcast_hub
+
+        lifespan: Lifespan = None
+        if self.lifespan is not LifespanMode.OFF:
+            lifespan = Lifespan(app, self.lifespan, timeout=self.shutdown_timeout)
+            await lifespan.startup()
+        lifespan_state = None
+        if lifespan is not None and lifespan.supported and lifespan.state:
+            lifespan_state = lifespan.state
+
+        shutdown = GracefulShutdown(self.shutdown_timeout)
+        self.shutdowns.append((loop, shutdown))
+        if threading.current_thread() is threading.main_thread():
+            loop.add_signal_handler(signal.SIGTERM, shutdown.request)
+            if self.workers == 1:
+                # Worker processes are stopped by the main process with SIGTERM.
+                loop.add_signal_handler(signal.SIGINT, shutdown.request)
+        heartbeat = self.heartbeat
+
+        thread_bus: ThreadBus = None
+        if self.thread_bus is not None:
+            broadcast_hub = BroadcastHub(policy=self.broadcast_hub.policy)
+            thread_bus = ThreadBus(broadcast_hub, self.thread_bus)
+            if heartbeat is not None:
+                heartbeat = HeartbeatScheduler(
+                    interval=heartbeat.interval,
+                    timeout=heartbeat.timeout,
+                    tick=heartbeat.tick,
+                )
+
+        if bus_dir is not None:
+            self.bus = UnixBus(self.broadcast_hub, worker_id, self.workers, bus_dir)
+            await self.bus.start()
+
+        if self.profile_duration and hasattr(signal, "SIGUSR1"):
+            profiler = LoopProfiler(self.profile_duration, self.profile_dir)
+            if threading.current_thread() is threading.main_thread():
+                loop.add_signal_handler(signal.SIGUSR1, profiler.start)
+            else:
+                self.thread_profilers.append((loop, profiler))
+
+        monitor: SlowCallbackMonitor = None
+        if self.slow_callback_duration is not None:
+            monitor = SlowCallbackMonitor(self.slow_callback_duration)
+            monitor.install(loop)
+
+        lag_monitor = self.lag_monitor
+        if lag_monitor is not None:
+            if self.thread_bus is not None:
+                lag_monitor = LoopLagMonitor(
+                    lag_monitor.threshold,
+                    recover_threshold=lag_monitor.recover_threshold,
+                    interval=lag_monitor.interval,
+                    actions=lag_monitor.actions,
+                )
+            lag_monitor.name = str(worker_id if self.workers > 1 else thread_id)
+            self.lag_monitors.append(lag_monitor)
+
+        capture = self.capture
+        if self.capture_file is not None and self.workers > 1:
+            capture = TrafficCapture(
+                f"{self.capture_file}.{worker_id}",
+                sample_rate=self.capture_sample_rate,
+                max_bytes=self.capture_max_bytes,
+            )
+
+        metrics: ServerMetrics = None
+        admin_server: asyncio.AbstractServer = None
+        publish_task: asyncio.Task = None
+        if self.metrics_port is not None:
+            metrics = ServerMetrics()
+            components = {
+                "broadcast_hub": broadcast_hub,
+                "heartbeat": heartbeat,
+                "bus": thread_bus or self.bus,
+                "slow_callback_monitor": monitor,
+                "lag_monitor": lag_monitor,
+            }
+            self.loop_states.append((metrics, components))
+            if worker_id == 0 and thread_id == 0:
+                admin_server = await loop.create_server(
+                    partial(MetricsProtocol, self.collect_metrics),
+                    host=self.metrics_host,
+                    port=self.metrics_port,
+                )
+            elif self.bus is not None:
+                publish_task = asyncio.create_task(self.publish_metrics())
+
+        protocol = partial(
+            HTTPWSProtocol,
+            app=app,
+            broadcast_hub=broadcast_hub,
+            heartbeat=heartbeat,
+            outbound_limit=self.ws_send_queue_limit,
+            outbound_policy=self.ws_slow_consumer_policy,
+            task_mode=self.task_mode,
+            target_cache=self.target_cache,
+            response_cache=self.response_cache,
+            fast_path=self.fast_path or None,
+            compressor=self.compressor,
+            body_spooler=self.body_spooler,
+            http2_settings=self.http2_settings,
+            metrics=metrics,
+            overload=lag_monitor,
+            capture=capture,
+            access_log=self.access_log,
+            connections=shutdown.connections,
+            lifespan_state=lifespan_state,
+            server_timing=self.server_timing,
+        )
+        ssl_kwargs = {}
+        if self.ssl_context is not None:
+            ssl_kwargs = {
+                "ssl": self.ssl_context,
+                "ssl_handshake_timeout": self.ssl_handshake_timeout,
+            }
+        if sock is not None:
+            server = await loop.create_server(protocol, sock=sock, **ssl_kwargs)
+        else:
+            server = await loop.create_server(
+                protocol, host=host, port=port, **ssl_kwargs
+            )
+        if lag_monitor is not None:
+            lag_monitor.servers.append(server)
+            lag_monitor.start()
+
+        try:
+            await shutdown.wait()
+            await shutdown.drain([server])
+            if lifespan is not None:
+                await lifespan.shutdown()
+        finally:
+            server.close()
+            if thread_bus is not None:
+                thread_bus.close()
+            if admin_server is not None:
+                admin_server.close()
+            if publish_task is not None:
+                publish_task.cancel()
+            if monitor is not None:
+                monitor.uninstall(loop)
+            if lag_monitor is not None:
+                lag_monitor.stop()
+            if capture is not None and capture is not self.capture:
+                capture.close()
+
+    def run_worker(
+        self,
+        app: ASGIApp,
+        host: str,
+        port: int,
+        sock: socket.socket,
+        worker_id: int,
+        bus_dir: str,
+    ) -> None:
+        if self.profile_duration and hasattr(signal, "SIGUSR1"):
+            # The handler inherited from the main process is replaced once the event
+            # loop is running.
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        # An interrupt from the terminal is also received by the main process, which
+        # stops the workers with SIGTERM.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if self.access_log is not None:
+            self.access_log.start()
+        try:
+            asyncio.run(
+                self.run_server(
+                    app,
+                    host,
+                    port,
+                    sock=sock,
+                    worker_id=worker_id,
+                    bus_dir=bus_dir,
+                )
+            )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.access_log is not None:
+                self.access_log.stop()
 
-        async with server:
-            await server.serve_forever()
+    def create_socket(
+        self, host: str, port: int, reuse_port: bool = False
+    ) -> socket.socket:
+        """Bind a non-blocking listening socket."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, int(port)))
+        sock.listen(socket.SOMAXCONN)
+        sock.setblocking(False)
+        return sock
+
+    def run_workers(self, app: ASGIApp, host: str, port: int) -> None:
+        """
+        Bind the listening socket, then fork the worker processes that accept from it.
+        """
+        sock = self.create_socket(host, port)
+
+        bus_dir = tempfile.mkdtemp(prefix="aiobufpro-bus-")
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(
+                target=self.run_worker,
+                args=(app, host, port, sock, worker_id, bus_dir),
+                daemon=True,
+            )
+            for worker_id in range(self.workers)
+        ]
+
+        if self.profile_duration and hasattr(signal, "SIGUSR1"):
+            # The signal sent to the main process starts a profile of every worker.
+            def forward_signal(signum, frame) -> None:
+                for process in processes:
+                    if process.pid is not None:
+                        os.kill(process.pid, signum)
+
+            signal.signal(signal.SIGUSR1, forward_signal)
+
+        # Each worker drains its connections, a second signal closes them immediately.
+        # The listening socket stops accepting once it has been closed by the main
+        # process and every worker.
+        def stop_workers(signum, frame) -> None:
+            sock.close()
+            for process in processes:
+                if process.pid is not None and process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, stop_workers)
+        signal.signal(signal.SIGINT, stop_workers)
+
+        try:
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            sock.close()
+            shutil.rmtree(bus_dir, ignore_errors=True)
+
+    async def run_thread_server(
+        self, app: ASGIApp, host: str, port: int, sock: socket.socket, thread_id: int
+    ) -> None:
+        # Record the loop and task, so the thread can be stopped from the main thread.
+        self.thread_loops.append((asyncio.get_running_loop(), asyncio.current_task()))
+        await self.run_server(app, host, port, sock=sock, thread_id=thread_id)
+
+    def run_thread(
+        self, app: ASGIApp, host: str, port: int, sock: socket.socket, thread_id: int
+    ) -> None:
+        try:
+            asyncio.run(self.run_thread_server(app, host, port, sock, thread_id))
+        except asyncio.CancelledError:
+            pass
+
+    def run_threads(self, app: ASGIApp, host: str, port: int) -> None:
+        """
+        Run an event loop in each thread. Where the platform supports `SO_REUSEPORT`,
+        every loop accepts from its own listening socket and the kernel balances the
+        connections between them, otherwise the loops accept from a single socket.
+        """
+        reuse_port = hasattr(socket, "SO_REUSEPORT")
+        if reuse_port:
+            sockets = [
+                self.create_socket(host, port, reuse_port=True)
+                for _ in range(self.threads)
+            ]
+        else:
+            sockets = [self.create_socket(host, port)] * self.threads
+
+        threads = [
+            threading.Thread(
+                target=self.run_thread,
+                args=(app, host, port, sock, thread_id),
+                name=f"aiobufpro-loop-{thread_id}",
+                daemon=True,
+            )
+            for thread_id, sock in enumerate(sockets)
+        ]
+
+        if self.profile_duration and hasattr(signal, "SIGUSR1"):
+            # Each event loop thread starts its own profile, as a profile only captures
+            # the thread it was enabled in.
+            def start_profilers(signum, frame) -> None:
+                for loop, profiler in self.thread_profilers:
+                    loop.call_soon_threadsafe(profiler.start)
+
+            signal.signal(signal.SIGUSR1, start_profilers)
+
+        def stop_threads(signum, frame) -> None:
+            self.request_shutdown()
+
+        signal.signal(signal.SIGTERM, stop_threads)
+        signal.signal(signal.SIGINT, stop_threads)
+
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            for loop, task in self.thread_loops:
+                try:
+                    loop.call_soon_threadsafe(task.cancel)
+                except RuntimeError:
+                    # The loop has already been closed.
+                    pass
+            for thread in threads:
+                thread.join()
+            for sock in set(sockets):
+                sock.close()
 
     def run(self, app: ASGIApp, *, host: str, port: int, debug: bool) -> None:
+        if self.interface is AppInterface.WSGI:
+            app = WSGIApp(
+                app,
+                threads=self.wsgi_threads,
+                queue_depth=self.wsgi_queue_depth,
+                multiprocess=self.workers > 1,
+                lock=self.create_lock(),
+            )
+
         if debug:
 
             # Wrap the ASGI application in debug middleware from the Starlette to have
@@ -36,27 +638,380 @@ class Server:
 
             app = ServerErrorMiddleware(app)
 
-        logger.warning(f"Running protocol server on {host}:{port}")
+        scheme = "https" if self.ssl_context is not None else "http"
+        logger.warning(f"Running protocol server on {scheme}://{host}:{port}")
+        if self.metrics_port is not None:
+            logger.warning(
+                f"Serving metrics on http://{self.metrics_host}:{self.metrics_port}"
+                "/metrics"
+            )
+        if self.capture_file is not None:
+            logger.warning(f"Capturing traffic to {self.capture_file}")
+        if self.access_log is not None and self.workers == 1:
+            self.access_log.start()
 
         try:
-            asyncio.run(self.run_server(app, host, port))
+            if self.workers > 1:
+                self.run_workers(app, host, port)
+            elif self.threads > 1:
+                self.run_threads(app, host, port)
+            else:
+                asyncio.run(self.run_server(app, host, port))
         except Exception as exc:
             logger.warning(f"Exception in event loop: {exc}")
         finally:
+            if self.capture is not None:
+                self.capture.close()
+            if self.access_log is not None:
+                self.access_log.stop()
             logger.warning(f"Closing protocol server on {host}:{port}")
 
 
+def import_app(path: str) -> ASGIApp:
+    """Import an application from a `module:attribute` path."""
+    app_module, asgi_callable = path.split(":")
+    sys.path.insert(0, ".")
+    return getattr(importlib.import_module(app_module), asgi_callable)
+
+
 def main(args=None) -> None:
+    if args is None:
+        args = sys.argv[1:]
+    if args and args[0] == "bench":
+        from aiobufpro.bench import main as bench_main
+
+        bench_main(args[1:])
+        return
+    if args and args[0] == "replay":
+        from aiobufpro.replay import main as replay_main
+
+        replay_main(args[1:])
+        return
+
     parser = argparse.ArgumentParser()
-    parser.add_argument("app", help="ASGI application")
+    parser.add_argument("app", help="ASGI or WSGI application")
     parser.add_argument("--host", default="0.0.0.0", help="Host")
     parser.add_argument("--port", default="8000", help="Port")
     parser.add_argument("--debug", action="store_true", help="Debug")
-    args = parser.parse_args()
-    app_module, asgi_callable = args.app.split(":")
-    sys.path.insert(0, ".")
-    app = getattr(importlib.import_module(app_module), asgi_callable)
-    Server().run(app, host=args.host, port=args.port, debug=args.debug)
+    parser.add_argument(
+        "--broadcast-policy",
+        default="skip",
+        choices=[policy.value for policy in BroadcastPolicy],
+        help="Handling of WebSocket broadcast frames for slow members",
+    )
+    parser.add_argument(
+        "--workers", default=1, type=int, help="Number of worker processes"
+    )
+    parser.add_argument(
+        "--threads",
+        default=1,
+        type=int,
+        help="Number of threads each running an event loop in a single process",
+    )
+    parser.add_argument(
+        "--ws-ping-interval",
+        default=None,
+        type=float,
+        help="Seconds between server WebSocket pings, disabled by default",
+    )
+    parser.add_argument(
+        "--ws-ping-timeout",
+        default=20.0,
+        type=float,
+        help="Seconds a WebSocket connection has to answer a ping",
+    )
+    parser.add_argument(
+        "--ws-send-queue-limit",
+        default=1048576,
+        type=int,
+        help="Maximum bytes queued for sending on a WebSocket connection",
+    )
+    parser.add_argument(
+        "--ws-slow-consumer-policy",
+        default="block",
+        choices=[policy.value for policy in SlowConsumerPolicy],
+        help="Handling of WebSocket frames that exceed the send queue limit",
+    )
+    parser.add_argument(
+        "--task-mode",
+        default="task",
+        choices=[mode.value for mode in TaskMode],
+        help="How the application is run for each request",
+    )
+    parser.add_argument(
+        "--target-cache-size",
+        default=1024,
+        type=int,
+        help="Number of parsed request-targets to cache, 0 to disable",
+    )
+    parser.add_argument(
+        "--response-cache-size",
+        default=0,
+        type=int,
+        help="Bytes of GET responses to cache, disabled by default",
+    )
+    parser.add_argument(
+        "--compression",
+        action="store_true",
+        help="Compress responses negotiated from the Accept-Encoding header",
+    )
+    parser.add_argument(
+        "--compression-min-size",
+        default=500,
+        type=int,
+        help="Minimum response body size to compress",
+    )
+    parser.add_argument(
+        "--compression-level", default=6, type=int, help="Compression level"
+    )
+    parser.add_argument(
+        "--compression-thread-min-size",
+        default=None,
+        type=int,
+        help="Minimum body size to compress in the thread pool, disabled by default",
+    )
+    parser.add_argument(
+        "--body-spool-threshold",
+        default=None,
+        type=int,
+        help="Buffer request bodies, writing bodies larger than this to disk",
+    )
+    parser.add_argument(
+        "--body-memory-budget",
+        default=67108864,
+        type=int,
+        help="Maximum bytes of buffered request bodies held in memory per worker",
+    )
+    parser.add_argument(
+        "--h2-max-concurrent-streams",
+        default=100,
+        type=int,
+        help="Maximum concurrent streams of an HTTP/2 connection",
+    )
+    parser.add_argument(
+        "--h2-initial-window-size",
+        default=65535,
+        type=int,
+        help="Initial HTTP/2 flow control window for request bodies",
+    )
+    parser.add_argument(
+        "--h2-max-frame-size",
+        default=16384,
+        type=int,
+        help="Maximum HTTP/2 frame size received",
+    )
+    parser.add_argument("--ssl-certfile", default=None, help="TLS certificate file")
+    parser.add_argument("--ssl-keyfile", default=None, help="TLS private key file")
+    parser.add_argument(
+        "--ssl-keyfile-password", default=None, help="Password of the private key"
+    )
+    parser.add_argument(
+        "--ssl-ca-certs", default=None, help="CA certificates to verify clients with"
+    )
+    parser.add_argument(
+        "--ssl-cert-reqs",
+        default=int(ssl.CERT_NONE),
+        type=int,
+        help="Whether client certificates are required, see the `ssl` module",
+    )
+    parser.add_argument("--ssl-ciphers", default=None, help="TLS ciphers to use")
+    parser.add_argument(
+        "--ssl-session-tickets",
+        default=2,
+        type=int,
+        help="TLS 1.3 session tickets sent per handshake, 0 to disable tickets",
+    )
+    parser.add_argument(
+        "--ssl-handshake-timeout",
+        default=60.0,
+        type=float,
+        help="Seconds to wait for the TLS handshake to complete",
+    )
+    parser.add_argument(
+        "--profile-duration",
+        default=10.0,
+        type=float,
+        help="Seconds profiled after a SIGUSR1 signal, 0 to ignore the signal",
+    )
+    parser.add_argument(
+        "--profile-dir", default=None, help="Directory profiles are written to"
+    )
+    parser.add_argument(
+        "--slow-callback-duration",
+        default=None,
+        type=float,
+        help="Log event loop callbacks that run for longer than this many seconds",
+    )
+    parser.add_argument(
+        "--metrics-host", default="127.0.0.1", help="Host of the metrics listener"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        default=None,
+        type=int,
+        help="Port to serve Prometheus metrics on at /metrics, disabled by default",
+    )
+    parser.add_argument(
+        "--shed-lag-threshold",
+        default=None,
+        type=float,
+        help="Event loop lag in seconds that starts shedding load, disabled by default",
+    )
+    parser.add_argument(
+        "--shed-recover-threshold",
+        default=None,
+        type=float,
+        help="Event loop lag in seconds that stops shedding, half the threshold by "
+        "default",
+    )
+    parser.add_argument(
+        "--shed-lag-interval",
+        default=0.05,
+        type=float,
+        help="Seconds between event loop lag samples",
+    )
+    parser.add_argument(
+        "--shed-action",
+        action="append",
+        choices=[action.value for action in ShedAction],
+        help="How load is shed, may be repeated, reject by default",
+    )
+    parser.add_argument(
+        "--capture-file",
+        default=None,
+        help="Record the bytes received on each connection to this file, replayed "
+        "with 'aiobufpro replay', disabled by default",
+    )
+    parser.add_argument(
+        "--capture-sample-rate",
+        default=1.0,
+        type=float,
+        help="Fraction of the connections captured",
+    )
+    parser.add_argument(
+        "--capture-max-bytes",
+        default=104857600,
+        type=int,
+        help="Size at which the capture file stops recording",
+    )
+    parser.add_argument(
+        "--lifespan",
+        default="auto",
+        choices=[mode.value for mode in LifespanMode],
+        help="Whether the ASGI lifespan protocol is run",
+    )
+    parser.add_argument(
+        "--shutdown-timeout",
+        default=30.0,
+        type=float,
+        help="Seconds the requests in progress have to complete when stopping",
+    )
+    parser.add_argument(
+        "--interface",
+        default="asgi",
+        choices=[interface.value for interface in AppInterface],
+        help="Interface of the application, WSGI applications run in a thread pool",
+    )
+    parser.add_argument(
+        "--wsgi-threads",
+        default=10,
+        type=int,
+        help="Threads running the requests of a WSGI application in each worker",
+    )
+    parser.add_argument(
+        "--wsgi-queue-depth",
+        default=10,
+        type=int,
+        help="Requests that may wait for a WSGI thread before requests are answered "
+        "with a 503 response",
+    )
+    parser.add_argument(
+        "--server-timing",
+        action="store_true",
+        help="Add a Server-Timing header with the parse, queue and app durations of "
+        "each response",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="warning",
+        choices=["debug", "info", "warning", "error"],
+        help="Level of the server log",
+    )
+    parser.add_argument(
+        "--access-log", action="store_true", help="Log each HTTP request"
+    )
+    parser.add_argument(
+        "--access-log-format",
+        default="combined",
+        choices=[log_format.value for log_format in AccessLogFormat],
+        help="Format of the access log lines",
+    )
+    parser.add_argument(
+        "--access-log-sample-rate",
+        default=1.0,
+        type=float,
+        help="Fraction of the HTTP requests logged",
+    )
+    parser.add_argument(
+        "--access-log-file",
+        default=None,
+        help="File the access log is appended to, standard output by default",
+    )
+    args = parser.parse_args(args)
+    logging.basicConfig(level=args.log_level.upper())
+    app = import_app(args.app)
+    server = Server(
+        broadcast_policy=BroadcastPolicy(args.broadcast_policy),
+        workers=args.workers,
+        threads=args.threads,
+        ws_ping_interval=args.ws_ping_interval,
+        ws_ping_timeout=args.ws_ping_timeout,
+        ws_send_queue_limit=args.ws_send_queue_limit,
+        ws_slow_consumer_policy=SlowConsumerPolicy(args.ws_slow_consumer_policy),
+        task_mode=TaskMode(args.task_mode),
+        target_cache_size=args.target_cache_size,
+        response_cache_size=args.response_cache_size,
+        compression=args.compression,
+        compression_min_size=args.compression_min_size,
+        compression_level=args.compression_level,
+        compression_thread_min_size=args.compression_thread_min_size,
+        body_spool_threshold=args.body_spool_threshold,
+        body_memory_budget=args.body_memory_budget,
+        h2_max_concurrent_streams=args.h2_max_concurrent_streams,
+        h2_initial_window_size=args.h2_initial_window_size,
+        h2_max_frame_size=args.h2_max_frame_size,
+        ssl_certfile=args.ssl_certfile,
+        ssl_keyfile=args.ssl_keyfile,
+        ssl_keyfile_password=args.ssl_keyfile_password,
+        ssl_ca_certs=args.ssl_ca_certs,
+        ssl_cert_reqs=args.ssl_cert_reqs,
+        ssl_ciphers=args.ssl_ciphers,
+        ssl_session_tickets=args.ssl_session_tickets,
+        ssl_handshake_timeout=args.ssl_handshake_timeout,
+        metrics_host=args.metrics_host,
+        metrics_port=args.metrics_port,
+        profile_duration=args.profile_duration,
+        profile_dir=args.profile_dir,
+        slow_callback_duration=args.slow_callback_duration,
+        shed_lag_threshold=args.shed_lag_threshold,
+        shed_recover_threshold=args.shed_recover_threshold,
+        shed_lag_interval=args.shed_lag_interval,
+        shed_actions=[ShedAction(action) for action in args.shed_action or ["reject"]],
+        capture_file=args.capture_file,
+        capture_sample_rate=args.capture_sample_rate,
+        capture_max_bytes=args.capture_max_bytes,
+        access_log=args.access_log,
+        access_log_format=AccessLogFormat(args.access_log_format),
+        access_log_sample_rate=args.access_log_sample_rate,
+        access_log_file=args.access_log_file,
+        lifespan=LifespanMode(args.lifespan),
+        shutdown_timeout=args.shutdown_timeout,
+        interface=AppInterface(args.interface),
+        wsgi_threads=args.wsgi_threads,
+        wsgi_queue_depth=args.wsgi_queue_depth,
+        server_timing=args.server_timing,
+    )
+    server.run(app, host=args.host, port=args.port, debug=args.debug)
 
 
 if __name__ == "__main__":
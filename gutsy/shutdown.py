@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Iterable, Set
+
+logger = logging.getLogger()
+
+# Seconds between the checks for the last connections to close while draining.
+DRAIN_POLL_INTERVAL = 0.05
+
+
+class GracefulShutdown:
+    """
+    Drains the connections of an event loop when the server is stopped. The listeners
+    stop accepting, idle keep-alive connections are closed, the requests in progress
+    have until the deadline to complete and WebSocket connections are closed with a
+    1001 close frame. A second request to stop closes the remaining connections
+    immediately.
+
+    * `timeout` -
+        (*float*): The seconds the requests in progress have to complete.
+
+    * `connections` -
+        (*Set[HTTPWSProtocol]*): The open connections of the loop.
+    """
+
+    def __init__(self, timeout: float = 30.0) -> None:
+        self.timeout: float = timeout
+        self.connections: Set = set()
+        self.requested: asyncio.Event = asyncio.Event()
+        self.forced: bool = False
+
+    def request(self) -> None:
+        """Called from a signal handler on the event loop to stop the server."""
+        if self.requested.is_set():
+            logger.warning("Closing the remaining connections")
+            self.forced = True
+            return
+        self.requested.set()
+
+    async def wait(self) -> None:
+        await self.requested.wait()
+
+    async def drain(self, servers: Iterable[asyncio.AbstractServer]) -> int:
+        """
+        Stop accepting and wait for the open connections to close, returning the number
+        that were still open at the deadline and closed without completing.
+        """
+        for server in servers:
+            server.close()
+        for protocol in list(self.connections):
+            protocol.shutdown()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        if self.connections:
+            logger.warning(
+                f"Waiting for {len(self.connections)} connections to complete"
+            )
+        # Shutdown is rare, so the connections are polled rather than each signalling
+        # when it is lost.
+        while self.connections and not self.forced and loop.time() < deadline:
+            await asyncio.sleep(DRAIN_POLL_INTERVAL)
+
+        remaining = list(self.connections)
+        for protocol in remaining:
+            protocol.transport.abort()
+        if remaining:
+            logger.warning(f"Closed {len(remaining)} connections that did not complete")
+        return len(remaining)
@@ -0,0 +1,64 @@
+import ssl
+from typing import Dict, List
+
+# The application protocols advertised with ALPN in order of preference.
+ALPN_PROTOCOLS = ["h2", "http/1.1"]
+
+
+def create_ssl_context(
+    certfile: str,
+    keyfile: str = None,
+    password: str = None,
+    ca_certs: str = None,
+    cert_reqs: int = ssl.CERT_NONE,
+    ciphers: str = None,
+    session_tickets: int = 2,
+    alpn_protocols: List[str] = ALPN_PROTOCOLS,
+) -> ssl.SSLContext:
+    """
+    Build the server TLS context.
+
+    Resumed handshakes skip the key exchange and certificate verification of a full
+    handshake. TLS 1.3 clients resume with the session tickets sent after each
+    handshake, and TLS 1.2 clients with either a ticket or the server session cache
+    that OpenSSL enables for server contexts. The ticket keys belong to the context,
+    so a context created before the worker processes are forked lets a client resume
+    its session on any worker.
+
+    * `session_tickets` -
+        (*int*): The number of TLS 1.3 session tickets sent after a full handshake,
+        `0` disables session tickets.
+
+    * `alpn_protocols` -
+        (*List[str]*): The application protocols advertised with ALPN.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(certfile, keyfile, password)
+    if ca_certs is not None:
+        context.load_verify_locations(ca_certs)
+    context.verify_mode = ssl.VerifyMode(cert_reqs)
+    if ciphers is not None:
+        context.set_ciphers(ciphers)
+
+    if session_tickets:
+        context.options &= ~ssl.OP_NO_TICKET
+        context.num_tickets = session_tickets
+    else:
+        context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = 0
+
+    if ssl.HAS_ALPN:
+        context.set_alpn_protocols(alpn_protocols)
+    return context
+
+
+def get_session_stats(context: ssl.SSLContext) -> Dict[str, int]:
+    """The handshake and session cache counters of the context."""
+    stats = context.session_stats()
+    return {
+        "accepted": stats["accept_good"],
+        "session_hits": stats["hits"],
+        "session_misses": stats["misses"],
+        "sessions": stats["number"],
+    }
@@ -1,8 +1,10 @@
+import sys
 import time
 import http
 import base64
+import asyncio
 import hashlib
-from typing import List, Tuple
+from typing import Coroutine, List, Tuple
 from email.utils import formatdate
 
 
@@ -39,3 +41,15 @@ def get_websocket_accept_key(sec_websocket_key: bytes) -> bytes:
     accept_key_hash = hashlib.sha1(accept_key)
     accept_key_response = base64.b64encode(accept_key_hash.digest())
     return accept_key_response
+
+
+def create_eager_task(coro: Coroutine) -> asyncio.Task:
+    """
+    Create a task that starts running the coroutine immediately, rather than on the
+    next iteration of the event loop, until its first suspension. Requires Python 3.12,
+    earlier versions fall back to scheduling the task.
+    """
+    loop = asyncio.get_running_loop()
+    if sys.version_info >= (3, 12):
+        return asyncio.Task(coro, loop=loop, eager_start=True)
+    return loop.create_task(coro)
@@ -0,0 +1,429 @@
+import asyncio
+import concurrent.futures
+import enum
+import logging
+import sys
+import threading
+from typing import Callable, Iterable, List, Tuple
+
+from starlette.types import Message, Receive, Scope, Send
+
+logger = logging.getLogger()
+
+WSGIApplication = Callable[[dict, Callable], Iterable[bytes]]
+
+# The response to requests received while every thread of the pool is busy and the
+# queue is full, the client may retry it once the pool has caught up.
+SATURATED_RESPONSE = (
+    503,
+    [
+        (b"content-type", b"text/plain; charset=utf-8"),
+        (b"retry-after", b"1"),
+    ],
+    b"Service Unavailable",
+)
+
+ERROR_RESPONSE = (
+    500,
+    [(b"content-type", b"text/plain; charset=utf-8")],
+    b"Internal Server Error",
+)
+
+
+class ClientDisconnected(ConnectionError):
+    """Raised in the application thread once the client has disconnected."""
+
+
+class AppInterface(enum.Enum):
+    """
+    The interface of the application served.
+
+    * `ASGI` - An ASGI application, run on the event loop.
+
+    * `WSGI` - A WSGI application, run in a thread pool.
+    """
+
+    ASGI = "asgi"
+    WSGI = "wsgi"
+
+
+def build_environ(scope: Scope, body: "WSGIInput", multiprocess: bool) -> dict:
+    """Build the WSGI environ of an HTTP request scope."""
+    server = scope.get("server") or ("localhost", 80)
+    # Native strings hold the bytes of the request as latin-1.
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"],
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": multiprocess,
+        "wsgi.run_once": False,
+    }
+    client = scope.get("client")
+    if client:
+        environ["REMOTE_ADDR"] = client[0]
+        environ["REMOTE_PORT"] = str(client[1])
+
+    for header_name, header_value in scope["headers"]:
+        name = header_name.decode("latin-1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = header_value.decode("latin-1")
+        if key in environ:
+            value = f"{environ[key]},{value}"
+        environ[key] = value
+    return environ
+
+
+class WSGIInput:
+    """
+    The `wsgi.input` stream of a request. The body is received from the event loop as
+    the application reads it, one `http.request` message at a time, so it is never
+    buffered in full.
+
+    * `buffer` -
+        (*bytearray*): The body received and not yet read.
+
+    * `more_body` -
+        (*bool*): Whether there is more body to be received.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        receive: Receive,
+        body: bytes,
+        more_body: bool,
+    ) -> None:
+        self.loop: asyncio.AbstractEventLoop = loop
+        self.receive: Receive = receive
+        self.buffer: bytearray = bytearray(body)
+        self.more_body: bool = more_body
+
+    def receive_body(self) -> None:
+        """Wait in the application thread for the next body message."""
+        message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+        if message["type"] == "http.request":
+            self.buffer += message.get("body", b"")
+            self.more_body = message.get("more_body", False)
+        else:
+            # The client disconnected, the body ends here.
+            self.more_body = False
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            while self.more_body:
+                self.receive_body()
+            size = len(self.buffer)
+        else:
+            while self.more_body and len(self.buffer) < size:
+                self.receive_body()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        while True:
+            end = self.buffer.find(b"\n")
+            if end != -1:
+                end += 1
+                break
+            if not self.more_body or 0 <= size <= len(self.buffer):
+                end = len(self.buffer)
+                break
+            self.receive_body()
+        if size is not None and 0 <= size < end:
+            end = size
+        data = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+    def readlines(self, hint: int = -1) -> List[bytes]:
+        lines = []
+        total = 0
+        while True:
+            line = self.readline()
+            if not line:
+                return lines
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                return lines
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+
+class WSGIResponder:
+    """
+    Runs a WSGI application for a single request in a thread of the pool.
+
+    The response is sent to the event loop from the application thread, which waits
+    for each message to be written. The thread is blocked while the transport is
+    paused for writing, so a slow client holds back the response iterable rather than
+    having it buffered on the loop. Each body chunk is sent once the next has been
+    produced, so a response produced as a single chunk or as a list is sent with a
+    content length in a single write, together with its headers.
+
+    Once the request body has been received, the next message is only received when
+    the response is complete or the client has disconnected. It is awaited on the loop,
+    so the thread stops producing a response that can no longer be sent.
+    """
+
+    def __init__(self, adapter: "WSGIApp", scope: Scope) -> None:
+        self.adapter: "WSGIApp" = adapter
+        self.scope: Scope = scope
+        self.loop: asyncio.AbstractEventLoop = None
+        self.receive: Receive = None
+        self.send: Send = None
+        self.watcher: asyncio.Future = None
+        self.disconnected: bool = False
+        self.status: int = None
+        self.headers: List[Tuple[bytes, bytes]] = None
+        self.response_started: bool = False
+
+    async def __call__(self, receive: Receive, send: Send) -> None:
+        scope_type = self.scope["type"]
+        if scope_type == "lifespan":
+            await self.run_lifespan(receive, send)
+            return
+        if scope_type != "http":
+            # WSGI applications cannot accept a WebSocket connection.
+            await receive()
+            await send({"type": "websocket.close"})
+            return
+
+        adapter = self.adapter
+        if not adapter.acquire():
+            await self.send_response(send, *SATURATED_RESPONSE)
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self.receive = receive
+        self.send = send
+        try:
+            # The first body message is received here, so a request without a body is
+            # run without calling back to the event loop.
+            message = await self.receive_body()
+            body = WSGIInput(
+                self.loop,
+                self.receive_body,
+                message.get("body", b""),
+                message.get("more_body", False),
+            )
+            environ = build_environ(self.scope, body, adapter.multiprocess)
+            try:
+                await self.loop.run_in_executor(adapter.executor, self.run, environ)
+            except Exception:
+                logger.exception("Exception in WSGI application")
+                # A response that has already started is ended by the server closing
+                # the connection once the application returns.
+                if not self.response_started and not self.disconnected:
+                    await self.send_response(send, *ERROR_RESPONSE)
+        finally:
+            adapter.release()
+            if self.watcher is not None:
+                self.watcher.cancel()
+
+    async def receive_body(self) -> Message:
+        message = await self.receive()
+        if message["type"] == "http.disconnect":
+            self.disconnected = True
+        elif not message.get("more_body", False):
+            self.watcher = asyncio.ensure_future(self.watch_disconnect())
+        return message
+
+    async def watch_disconnect(self) -> None:
+        await self.receive()
+        self.disconnected = True
+
+    async def run_lifespan(self, receive: Receive, send: Send) -> None:
+        # WSGI applications have no lifespan, the events are acknowledged.
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def send_response(
+        self, send: Send, status: int, headers: List[Tuple[bytes, bytes]], body: bytes
+    ) -> None:
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def send_messages(self, messages: List[Message]) -> None:
+        for message in messages:
+            await self.send(message)
+
+    def send_threadsafe(self, body: bytes, more_body: bool) -> None:
+        """Send a body chunk from the application thread, and the headers before it."""
+        if self.disconnected:
+            raise ClientDisconnected()
+        messages = []
+        if not self.response_started:
+            if self.status is None:
+                raise RuntimeError("The WSGI application did not call start_response")
+            self.response_started = True
+            messages.append(
+                {
+                    "type": "http.response.start",
+                    "status": self.status,
+                    "headers": self.headers,
+                }
+            )
+        messages.append(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
+        asyncio.run_coroutine_threadsafe(
+            self.send_messages(messages), self.loop
+        ).result()
+
+    def start_response(self, status: str, headers: list, exc_info=None):
+        if exc_info is not None:
+            try:
+                if self.response_started:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.status is not None:
+            raise RuntimeError("start_response was called twice")
+        self.status = int(status.split(" ", 1)[0])
+        self.headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers
+        ]
+        return self.write
+
+    def write(self, data: bytes) -> None:
+        """The legacy `write` callable returned by `start_response`."""
+        if data:
+            self.send_threadsafe(data, more_body=True)
+
+    def run(self, environ: dict) -> None:
+        """Run the application in a thread of the pool."""
+        result = None
+        try:
+            result = self.adapter.app(environ, self.start_response)
+            chunks = result
+            if isinstance(result, (list, tuple)) and len(result) > 1:
+                # The body of a list is already complete, so it is sent in one write.
+                chunks = [b"".join(result)]
+            pending = None
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                if pending is not None:
+                    self.send_threadsafe(pending, more_body=True)
+                pending = chunk
+            self.send_threadsafe(pending or b"", more_body=False)
+        except ClientDisconnected:
+            pass
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+
+
+class WSGIApp:
+    """
+    Serves a WSGI application as an ASGI application, running each request in a
+    bounded thread pool.
+
+    The number of requests admitted is limited to the threads of the pool and the
+    requests that may queue for one. A request received while the limit is reached is
+    answered immediately with a 503 response, rather than waiting for a thread.
+
+    * `app` -
+        (*WSGIApplication*): The WSGI application.
+
+    * `threads` -
+        (*int*): The threads of the pool.
+
+    * `queue_depth` -
+        (*int*): The requests that may wait for a thread of the pool.
+
+    * `multiprocess` -
+        (*bool*): Whether the application is also run by other processes.
+
+    * `lock` -
+        (*threading.Lock*): The lock of the admitted requests, if shared by more than
+        one event loop.
+
+    * `pending` -
+        (*int*): The requests admitted and not yet complete.
+
+    * `rejected` -
+        (*int*): The requests answered with a 503 response.
+    """
+
+    def __init__(
+        self,
+        app: WSGIApplication,
+        threads: int = 10,
+        queue_depth: int = 10,
+        multiprocess: bool = False,
+        lock: threading.Lock = None,
+    ) -> None:
+        self.app: WSGIApplication = app
+        self.threads: int = threads
+        self.queue_depth: int = queue_depth
+        self.multiprocess: bool = multiprocess
+        self.lock: threading.Lock = lock
+        self.limit: int = threads + queue_depth
+        self.pending: int = 0
+        self.rejected: int = 0
+        # The threads of the pool are started as they are needed, so none are running
+        # when worker processes are forked.
+        self.executor: concurrent.futures.ThreadPoolExecutor = (
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=threads, thread_name_prefix="aiobufpro-wsgi"
+            )
+        )
+
+    def __call__(self, scope: Scope) -> WSGIResponder:
+        return WSGIResponder(self, scope)
+
+    def acquire(self) -> bool:
+        """Admit a request if the pool is not saturated."""
+        lock = self.lock
+        if lock is not None:
+            with lock:
+                return self.admit()
+        return self.admit()
+
+    def admit(self) -> bool:
+        if self.pending >= self.limit:
+            self.rejected += 1
+            return False
+        self.pending += 1
+        return True
+
+    def release(self) -> None:
+        lock = self.lock
+        if lock is not None:
+            with lock:
+                self.pending -= 1
+        else:
+            self.pending -= 1
@@ -1,7 +1,37 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+import zlib
+
 from starlette.responses import HTMLResponse
 from starlette.testclient import TestClient
 
-from aiobufpro.parsers.http import HTTPParser, HTTPParserState
+from aiobufpro.accesslog import AccessLog, AccessLogFormat
+from aiobufpro.body import RequestBodyDecoder, RequestBodyError, RequestBodySpooler
+from aiobufpro.cache import ResponseCache
+from aiobufpro.capture import RecordKind, TrafficCapture, read_capture
+from aiobufpro.compression import ResponseCompressor, select_encoding
+from aiobufpro.fastpath import FastPathRouter
+from aiobufpro.lifespan import Lifespan, LifespanError, LifespanMode
+from aiobufpro.metrics import MetricsProtocol, ServerMetrics, render_metrics
+from aiobufpro.overload import LoopLagMonitor, ShedAction, can_pause_serving
+from aiobufpro.profiling import HANDLE_RUN, LoopProfiler, SlowCallbackMonitor
+from aiobufpro.parsers.http import (
+    HEADER_NAMES,
+    HTTPParser,
+    HTTPParserState,
+    RequestTargetCache,
+)
+from aiobufpro.protocol import HTTPWSProtocol, HTTPWSProtocolState, TaskMode
+from aiobufpro.replay import Replayer, filter_records
+from aiobufpro.shutdown import GracefulShutdown
+from aiobufpro.wsgi import WSGIApp
 
 
 REQUEST_HEADERS = bytearray(
@@ -30,8 +60,8 @@ def test_parse_headers():
     assert parser.http_version == "HTTP/1.1"
     assert parser.http_method == "GET"
     assert parser.headers == [
-        (b"Host", b"localhost:8000"),
-        (b"Connection", b"keep-alive"),
+        (b"host", b"localhost:8000"),
+        (b"connection", b"keep-alive"),
     ]
     assert parser.is_complete
 
@@ -52,11 +82,31 @@ def test_parse_headers_chunked():
     assert parser.http_version == "HTTP/1.1"
     assert parser.http_method == "GET"
     assert parser.headers == [
-        (b"Host", b"localhost:8000"),
-        (b"Connection", b"keep-alive"),
+        (b"host", b"localhost:8000"),
+        (b"connection", b"keep-alive"),
     ]
 
 
+def test_parse_headers_well_known_fields():
+    """
+    Ensure header names are lowercased to the shared common name objects and the well
+    known headers are recorded in the parser fields.
+    """
+    parser = HTTPParser()
+    parser.parse_headers(UPGRADE_REQUEST_HEADERS)
+    assert parser.headers[1] == (b"upgrade", b"websocket")
+    assert parser.headers[1][0] is HEADER_NAMES[b"Upgrade"]
+    assert parser.connection == b"keep-alive, upgrade"
+    assert parser.sec_websocket_key == b"Y56tJpDd+hCW+vDb0qdekQ=="
+    assert parser.sec_websocket_version == b"13"
+    assert parser.host is None
+
+    parser.reset()
+    parser.parse_headers(b"GET / HTTP/1.1\r\nX-Custom-Header: 1\r\n\r\n")
+    assert parser.headers == [(b"x-custom-header", b"1")]
+    assert parser.sec_websocket_key is None
+
+
 def test_http_response():
     class App:
         def __init__(self, scope):
@@ -69,3 +119,1216 @@ def test_http_response():
     client = TestClient(App)
     response = client.get("/")
     assert response.status_code == 200
+
+
+class MockTransport:
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return None
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+
+class PlainTextApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": self.scope["path"].encode()})
+
+
+def feed(protocol, data):
+    buf = protocol.get_buffer(len(data))
+    buf[: len(data)] = data
+    protocol.buffer_updated(len(data))
+
+
+def test_keep_alive_requests_for_each_task_mode():
+    """Ensure successive keep-alive requests are answered in every task mode."""
+
+    async def run_requests(task_mode):
+        protocol = HTTPWSProtocol(PlainTextApp, task_mode=task_mode)
+        transport = MockTransport()
+        protocol.connection_made(transport)
+        for path in (b"/first", b"/second"):
+            feed(protocol, b"GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % path)
+            for _ in range(3):
+                await asyncio.sleep(0)
+        return transport.written
+
+    for task_mode in TaskMode:
+        responses = asyncio.run(run_requests(task_mode))
+        assert len(responses) == 2
+        assert responses[0].endswith(b"content-length: 6\r\n\r\n/first")
+        assert responses[1].endswith(b"content-length: 7\r\n\r\n/second")
+
+
+def test_eager_responses_larger_than_receive_buffer():
+    """
+    Ensure responses larger than the receive buffer are written when the application
+    responds within `buffer_updated`, while the transport holds a view of the buffer,
+    as eager tasks do on Python 3.12.
+    """
+    path = b"/" + b"x" * 300
+
+    async def run_requests(task_mode):
+        protocol = HTTPWSProtocol(PlainTextApp, task_mode=task_mode)
+        transport = MockTransport()
+        protocol.connection_made(transport)
+        feed(protocol, b"GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % path)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        # A response written while a view of the buffer is exported.
+        view = protocol.get_buffer(100)
+        await protocol.feed_data(b"y" * 1000)
+        view.release()
+        return transport.written
+
+    for task_mode in (TaskMode.EAGER, TaskMode.WORKER):
+        responses = asyncio.run(run_requests(task_mode))
+        assert responses[0].endswith(b"content-length: 301\r\n\r\n" + path)
+        assert responses[1] == b"y" * 1000
+
+
+def test_pipelined_requests():
+    """
+    Ensure pipelined requests are answered in order, whether they are received with
+    the previous request or while its response is in progress.
+    """
+
+    async def run_requests():
+        protocol = HTTPWSProtocol(PlainTextApp)
+        transport = MockTransport()
+        protocol.connection_made(transport)
+        feed(
+            protocol,
+            b"GET /first HTTP/1.1\r\nHost: localhost\r\n\r\n"
+            b"POST /second HTTP/1.1\r\nContent-Length: 4\r\n\r\nbody"
+            b"GET /third HTTP/1.1\r\n",
+        )
+        feed(protocol, b"Host: localhost\r\n\r\n")
+        for _ in range(10):
+            await asyncio.sleep(0)
+        return transport.written
+
+    responses = asyncio.run(run_requests())
+    assert len(responses) == 3
+    assert responses[0].endswith(b"\r\n\r\n/first")
+    assert responses[1].endswith(b"\r\n\r\n/second")
+    assert responses[2].endswith(b"\r\n\r\n/third")
+
+
+def test_keep_alive_reuses_parser_and_connection():
+    """Ensure the parser and HTTP connection are reset and reused between requests."""
+
+    async def run_requests():
+        protocol = HTTPWSProtocol(PlainTextApp)
+        protocol.connection_made(MockTransport())
+        seen = []
+        for path in (b"/first", b"/second"):
+            feed(protocol, b"GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % path)
+            seen.append((protocol.parser, protocol.asgi_connection))
+            await asyncio.sleep(0)
+        return seen, protocol.transport.written
+
+    seen, responses = asyncio.run(run_requests())
+    (first_parser, first_connection), (second_parser, second_connection) = seen
+    assert first_parser is second_parser
+    assert first_connection is second_connection
+    assert responses[1].endswith(b"/second")
+
+
+def test_request_target_cache():
+    """Ensure parsed request-targets are cached and evicted least recently used."""
+    cache = RequestTargetCache(maxsize=2)
+    assert cache.get(b"/a?x=1") == ("/a", "x=1")
+    assert cache.get(b"/b") == ("/b", "")
+    assert cache.get(b"/a?x=1") == ("/a", "x=1")
+    assert cache.get(b"http://example.com/c?y=2") == ("/c", "y=2")
+    assert list(cache.entries) == [b"/a?x=1", b"http://example.com/c?y=2"]
+    assert cache.stats() == {"size": 2, "hits": 1, "misses": 3}
+
+    parser = HTTPParser(target_cache=cache)
+    parser.parse_headers(b"GET /a?x=1 HTTP/1.1\r\n\r\n")
+    assert (parser.path, parser.query_string) == ("/a", "x=1")
+    assert cache.hits == 2
+
+
+class CachedApp:
+    calls = 0
+
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        CachedApp.calls += 1
+        await receive()
+        await asyncio.sleep(0)
+        headers = [(b"cache-control", b"public, s-maxage=60"), (b"vary", b"Accept")]
+        if self.scope["path"] == "/private":
+            headers = [(b"cache-control", b"private, max-age=60")]
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": self.scope["path"].encode()})
+
+
+def test_response_cache():
+    """
+    Ensure GET responses are served from the response cache, keyed on the Vary request
+    headers, and that concurrent requests for the same key wait for one response.
+    """
+
+    async def run_requests():
+        cache = ResponseCache(max_bytes=4096)
+        protocols = []
+        for _ in range(3):
+            protocol = HTTPWSProtocol(CachedApp, response_cache=cache)
+            protocol.connection_made(MockTransport())
+            protocols.append(protocol)
+
+        request = b"GET /page HTTP/1.1\r\nAccept: %s\r\n\r\n"
+        feed(protocols[0], request % b"text/html")
+        feed(protocols[1], request % b"text/html")
+        for _ in range(5):
+            await asyncio.sleep(0)
+        feed(protocols[2], request % b"text/html")
+        feed(protocols[1], request % b"application/json")
+        for _ in range(5):
+            await asyncio.sleep(0)
+        feed(protocols[2], b"GET /private HTTP/1.1\r\n\r\n")
+        feed(protocols[0], b"GET /private HTTP/1.1\r\n\r\n")
+        for _ in range(5):
+            await asyncio.sleep(0)
+        return cache, [protocol.transport.written for protocol in protocols]
+
+    CachedApp.calls = 0
+    cache, written = asyncio.run(run_requests())
+    assert written[0][0] == written[1][0] == written[2][0]
+    assert written[0][0].endswith(b"\r\n\r\n/page")
+    assert written[1][1].endswith(b"\r\n\r\n/page")
+    assert written[0][1].endswith(b"/private")
+    assert written[2][1].endswith(b"/private")
+    assert CachedApp.calls == 4
+    assert cache.stats() == {
+        "entries": 2,
+        "size": len(written[0][0]) + len(written[1][1]),
+        "hits": 1,
+        "misses": 5,
+        "coalesced": 2,
+        "stores": 2,
+        "evictions": 0,
+    }
+
+
+def test_response_cache_pipelined_hits_with_lock():
+    """
+    Ensure pipelined requests answered from a response cache shared by several event
+    loops do not deadlock on the lock of the cache.
+    """
+    written = []
+
+    async def run_requests():
+        cache = ResponseCache(max_bytes=4096, lock=threading.Lock())
+        protocol = HTTPWSProtocol(CachedApp, response_cache=cache)
+        protocol.connection_made(MockTransport())
+        request = b"GET /page HTTP/1.1\r\nAccept: text/html\r\n\r\n"
+        feed(protocol, request)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        feed(protocol, request * 2)
+        for _ in range(5):
+            await asyncio.sleep(0)
+        written.extend(protocol.transport.written)
+
+    # The loop runs in a thread, as in threaded mode, so a deadlock fails the test.
+    thread = threading.Thread(target=asyncio.run, args=(run_requests(),), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(written) == 3
+    assert written[1] == written[2] == written[0]
+
+
+def test_fast_path_routes():
+    """
+    Ensure fast-path routes are answered without the ASGI application, and that other
+    requests fall through to it.
+    """
+
+    def get_user(request):
+        return 200, [(b"content-type", b"text/plain")], request.query_string.encode()
+
+    async def get_slow(request):
+        await asyncio.sleep(0)
+        return 202, [], b"slow"
+
+    router = FastPathRouter()
+    router.add_static_route("/healthz", b"ok")
+    router.add_route("GET", "/user", get_user)
+    router.add_route("get", "/slow", get_slow)
+
+    async def run_requests():
+        protocol = HTTPWSProtocol(PlainTextApp, fast_path=router)
+        protocol.connection_made(MockTransport())
+        for target in (b"/healthz", b"/user?id=7", b"/slow", b"/app"):
+            feed(protocol, b"GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % target)
+            for _ in range(3):
+                await asyncio.sleep(0)
+        return protocol.transport.written
+
+    healthz, user, slow, app = asyncio.run(run_requests())
+    assert healthz.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert healthz.endswith(b"content-length: 2\r\n\r\nok")
+    assert b"content-type: text/plain\r\n" in user
+    assert user.endswith(b"\r\n\r\nid=7")
+    assert slow.startswith(b"HTTP/1.1 202 Accepted\r\n")
+    assert app.endswith(b"content-length: 4\r\n\r\n/app")
+
+
+def test_disconnect_without_running_application():
+    """
+    Ensure a connection lost while a fast-path handler or a response cache waiter has
+    the request in progress is cleaned up, including the worker task of the connection.
+    """
+
+    async def get_slow(request):
+        await asyncio.sleep(0.01)
+        return 200, [], b"slow"
+
+    router = FastPathRouter()
+    router.add_route("GET", "/slow", get_slow)
+
+    async def run_requests():
+        cache = ResponseCache(max_bytes=4096)
+        fast_path = HTTPWSProtocol(PlainTextApp, fast_path=router)
+        fast_path.connection_made(MockTransport())
+        first = HTTPWSProtocol(CachedApp, response_cache=cache)
+        first.connection_made(MockTransport())
+        waiter = HTTPWSProtocol(
+            CachedApp, response_cache=cache, task_mode=TaskMode.WORKER
+        )
+        waiter.connection_made(MockTransport())
+
+        # The worker task of the connection is started by a request for the application,
+        # while no application has been run on the fast-path connection.
+        feed(waiter, b"GET /private HTTP/1.1\r\n\r\n")
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+        feed(fast_path, b"GET /slow HTTP/1.1\r\n\r\n")
+        feed(first, b"GET /page HTTP/1.1\r\n\r\n")
+        feed(waiter, b"GET /page HTTP/1.1\r\n\r\n")
+        assert fast_path.state is HTTPWSProtocolState.RESPONSE
+        assert cache.coalesced == 1
+        for protocol in (fast_path, waiter):
+            protocol.transport.closed = True
+            protocol.connection_lost(None)
+        await asyncio.sleep(0.02)
+        return fast_path, waiter
+
+    fast_path, waiter = asyncio.run(run_requests())
+    assert fast_path.asgi_connection is None
+    assert waiter.app_worker.done()
+
+
+class JSONApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        body = b'{"items": [%s]}' % b", ".join([b'"item"'] * 200)
+        headers = [(b"content-type", b"application/json")]
+        if self.scope["path"] == "/small":
+            body = b"{}"
+        if self.scope["method"] == "HEAD":
+            headers.append((b"content-length", b"%d" % len(body)))
+            body = b""
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        if self.scope["path"] == "/stream":
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+            await send({"type": "http.response.body", "body": body})
+        else:
+            await send({"type": "http.response.body", "body": body})
+
+
+def test_response_compression():
+    """
+    Ensure single-shot and streamed responses are compressed with the negotiated
+    encoding, and that small bodies are sent uncompressed.
+    """
+    assert select_encoding(b"gzip;q=0.5, deflate", (b"gzip", b"deflate")) == b"deflate"
+    assert select_encoding(b"identity", (b"gzip", b"deflate")) is None
+    assert select_encoding(b"*", (b"gzip", b"deflate")) == b"gzip"
+
+    async def run_requests(compressor):
+        protocol = HTTPWSProtocol(JSONApp, compressor=compressor)
+        protocol.connection_made(MockTransport())
+        for path in (b"/", b"/stream", b"/small"):
+            feed(
+                protocol,
+                b"GET %s HTTP/1.1\r\nAccept-Encoding: gzip\r\n\r\n" % path,
+            )
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+        return protocol.transport.written
+
+    body = b'{"items": [%s]}' % b", ".join([b'"item"'] * 200)
+    for thread_min_size in (None, 100):
+        compressor = ResponseCompressor(thread_min_size=thread_min_size)
+        written = asyncio.run(run_requests(compressor))
+        single, small = written[0], written[-1]
+        stream = b"".join(written[1:-1])
+
+        head, compressed = single.split(b"\r\n\r\n", 1)
+        assert b"content-encoding: gzip\r\n" in head
+        assert b"vary: accept-encoding\r\n" in head
+        assert head.endswith(b"content-length: %d" % len(compressed))
+        assert zlib.decompress(compressed, 31) == body
+
+        head, chunked = stream.split(b"\r\n\r\n", 1)
+        assert b"transfer-encoding: chunked" in head
+        assert b"content-encoding: gzip\r\n" in head
+        assert chunked.endswith(b"0\r\n\r\n")
+        compressed = b""
+        while True:
+            size, _, chunked = chunked.partition(b"\r\n")
+            if size == b"0":
+                break
+            compressed += chunked[: int(size, 16)]
+            chunked = chunked[int(size, 16) + 2 :]
+        assert zlib.decompress(compressed, 31) == body * 2
+
+        assert b"content-encoding" not in small
+        assert small.endswith(b"content-length: 2\r\n\r\n{}")
+        stats = compressor.stats()
+        assert stats["responses"] == 2
+        assert stats["bytes_in"] == len(body) * 3
+        assert stats["ratio"] < 0.2
+
+
+def test_head_response_compression():
+    """
+    Ensure the response to a HEAD request is not compressed, and keeps the
+    content-length of the application.
+    """
+
+    async def run_request():
+        protocol = HTTPWSProtocol(JSONApp, compressor=ResponseCompressor())
+        protocol.connection_made(MockTransport())
+        feed(protocol, b"HEAD / HTTP/1.1\r\nAccept-Encoding: gzip\r\n\r\n")
+        for _ in range(10):
+            await asyncio.sleep(0.01)
+        return protocol.transport.written
+
+    body = b'{"items": [%s]}' % b", ".join([b'"item"'] * 200)
+    (response,) = asyncio.run(run_request())
+    assert b"content-encoding" not in response
+    assert response.endswith(b"content-length: %d\r\n\r\n" % len(body))
+
+
+class EchoBodyApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        body_file = self.scope.get("extensions", {}).get("http.request.body_file")
+        if body_file is not None and self.scope["path"] == "/file":
+            body = (await body_file["get_file"]()).read()
+            parts = [body]
+        else:
+            parts = []
+            more_body = True
+            while more_body:
+                message = await receive()
+                parts.append(message["body"])
+                more_body = message.get("more_body", False)
+        content = b"%d:%s" % (len(parts), b"".join(parts))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": content})
+
+
+def test_request_body_decoder():
+    """Ensure content-length and chunked request bodies are decoded."""
+    decoder = RequestBodyDecoder(content_length=5)
+    assert decoder.feed(b"abc") == b"abc"
+    assert decoder.feed(b"deGET") == b"de"
+    assert decoder.complete
+
+    decoder = RequestBodyDecoder(chunked=True)
+    assert decoder.feed(b"3\r\nab") == b"ab"
+    assert decoder.feed(b"c\r") == b"c"
+    assert decoder.feed(b"\nA;ext=1\r\n0123456789\r\n0\r\n") == b"0123456789"
+    assert not decoder.complete
+    assert decoder.feed(b"trailer: 1\r\n\r\n") == b""
+    assert decoder.complete
+
+    # The chunk size line and the trailer fields are buffered up to a limit.
+    for data in (b"1" * 5000, b"0\r\n" + b"trailer: 1\r\n" * 6000):
+        decoder = RequestBodyDecoder(chunked=True)
+        try:
+            decoder.feed(data)
+        except RequestBodyError:
+            pass
+        else:
+            raise AssertionError("The chunked body was not rejected")
+
+
+class PausingTransport(MockTransport):
+    def __init__(self):
+        super().__init__()
+        self.reading = True
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+
+class SlowBodyApp:
+    def __init__(self, scope, released):
+        self.scope = scope
+        self.released = released
+
+    async def __call__(self, receive, send):
+        await self.released.wait()
+        await EchoBodyApp(self.scope)(receive, send)
+
+
+def test_request_body_backpressure():
+    """
+    Ensure reading is paused while more request body is queued for the application
+    than the high water limit, and resumed once it has received the body.
+    """
+
+    async def run_request():
+        released = asyncio.Event()
+        protocol = HTTPWSProtocol(lambda scope: SlowBodyApp(scope, released))
+        transport = PausingTransport()
+        protocol.connection_made(transport)
+        feed(protocol, b"POST / HTTP/1.1\r\nContent-Length: 200000\r\n\r\n")
+        readings = []
+        for _ in range(4):
+            feed(protocol, b"x" * 40000)
+            readings.append(transport.reading)
+        released.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        readings.append(transport.reading)
+        feed(protocol, b"x" * 40000)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        return readings, transport
+
+    readings, transport = asyncio.run(run_request())
+    assert readings == [True, False, False, False, True]
+    assert transport.written[0].endswith(b"\r\n\r\n5:" + b"x" * 200000)
+
+
+def test_request_body():
+    """
+    Ensure request bodies are received as they arrive, or buffered by the spooler and
+    received in chunks or as a file, before the next request on the connection.
+    """
+    body = b"x" * 1000
+
+    async def run_requests(spooler, path):
+        protocol = HTTPWSProtocol(EchoBodyApp, body_spooler=spooler)
+        protocol.connection_made(MockTransport())
+        head = b"POST %s HTTP/1.1\r\nContent-Length: 1000\r\n\r\n" % path
+        feed(protocol, head + body[:400])
+        await asyncio.sleep(0)
+        feed(protocol, body[400:])
+        for _ in range(3):
+            await asyncio.sleep(0)
+        chunked = b"POST %s HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n" % path
+        feed(protocol, chunked + b"3e8\r\n" + body + b"\r\n0\r\n\r\n")
+        for _ in range(3):
+            await asyncio.sleep(0)
+        feed(protocol, b"GET / HTTP/1.1\r\n\r\n")
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return protocol.transport.written
+
+    written = asyncio.run(run_requests(None, b"/"))
+    assert written[0].endswith(b"\r\n\r\n2:" + body)
+    assert written[1].endswith(b"\r\n\r\n1:" + body)
+    assert written[2].endswith(b"\r\n\r\n1:")
+
+    spooler = RequestBodySpooler(threshold=600, memory_budget=1000, chunk_size=300)
+    written = asyncio.run(run_requests(spooler, b"/"))
+    assert written[0].endswith(b"\r\n\r\n4:" + body)
+    assert written[1].endswith(b"\r\n\r\n4:" + body)
+    assert spooler.stats() == {"memory_used": 0, "spooled": 2, "rolled_over": 2}
+
+    written = asyncio.run(run_requests(spooler, b"/file"))
+    assert written[0].endswith(b"\r\n\r\n1:" + body)
+    assert written[1].endswith(b"\r\n\r\n1:" + body)
+
+
+class MockSSLObject:
+    def __init__(self, alpn_protocol):
+        self.alpn_protocol = alpn_protocol
+
+    def selected_alpn_protocol(self):
+        return self.alpn_protocol
+
+
+class MockTLSTransport(MockTransport):
+    def __init__(self, alpn_protocol):
+        super().__init__()
+        self.ssl_object = MockSSLObject(alpn_protocol)
+
+    def get_extra_info(self, name):
+        if name == "ssl_object":
+            return self.ssl_object
+        return None
+
+
+def test_tls_scheme_and_alpn():
+    """
+    Ensure TLS connections use the https and wss schemes, and connections that
+    negotiated h2 with ALPN start with the HTTP/2 server preface.
+    """
+
+    async def run_upgrade():
+        protocol = HTTPWSProtocol(PlainTextApp)
+        protocol.connection_made(MockTLSTransport("http/1.1"))
+        feed(protocol, UPGRADE_REQUEST_HEADERS)
+        return protocol
+
+    protocol = asyncio.run(run_upgrade())
+    assert protocol.scope_template["scheme"] == "https"
+    assert protocol.scope["scheme"] == "wss"
+
+    async def run_http2():
+        protocol = HTTPWSProtocol(PlainTextApp)
+        protocol.connection_made(MockTLSTransport("h2"))
+        return protocol
+
+    protocol = asyncio.run(run_http2())
+    assert protocol.state is HTTPWSProtocolState.HTTP2
+    # The server SETTINGS frame.
+    assert protocol.transport.written[0][3] == 0x4
+
+
+def test_repeated_framing_headers():
+    """
+    Ensure conflicting content-length headers are rejected rather than resolved to the
+    last value, which would parse the rest of the body as the next request.
+    """
+
+    async def run_request(request):
+        protocol = HTTPWSProtocol(PlainTextApp)
+        protocol.connection_made(MockTransport())
+        feed(protocol, request)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return protocol.transport
+
+    transport = asyncio.run(
+        run_request(
+            b"POST / HTTP/1.1\r\nContent-Length: 26\r\nContent-Length: 0\r\n\r\n"
+            b"GET /smuggled HTTP/1.1\r\n\r\n"
+        )
+    )
+    assert len(transport.written) == 1
+    assert transport.written[0].startswith(b"HTTP/1.1 400 ")
+    assert transport.closed
+
+    # Repeated headers with the same value frame the body the same way.
+    transport = asyncio.run(
+        run_request(
+            b"POST /same HTTP/1.1\r\nContent-Length: 4\r\nContent-Length: 4\r\n\r\n"
+            b"body"
+        )
+    )
+    assert transport.written[0].endswith(b"\r\n\r\n/same")
+
+    parser = HTTPParser()
+    parser.parse_headers(
+        b"POST / HTTP/1.1\r\nTransfer-Encoding: gzip\r\n"
+        b"Transfer-Encoding: chunked\r\n\r\n"
+    )
+    assert parser.transfer_encoding == b"gzip, chunked"
+
+
+def test_invalid_transfer_encoding():
+    """
+    Ensure requests with a transfer-encoding that does not end with the chunked coding,
+    or with both transfer-encoding and content-length, are rejected.
+    """
+
+    async def run_request(request):
+        protocol = HTTPWSProtocol(PlainTextApp)
+        protocol.connection_made(MockTransport())
+        feed(protocol, request)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return protocol.transport
+
+    smuggled = b"GET /smuggled HTTP/1.1\r\n\r\n"
+    for headers in (
+        b"Transfer-Encoding: chunked, identity\r\n",
+        b"Transfer-Encoding: xchunked\r\n",
+        b"Transfer-Encoding: chunked\r\nContent-Length: 29\r\n",
+    ):
+        transport = asyncio.run(
+            run_request(b"POST / HTTP/1.1\r\n%s\r\n%s" % (headers, smuggled))
+        )
+        assert len(transport.written) == 1
+        assert transport.written[0].startswith(b"HTTP/1.1 400 ")
+        assert transport.closed
+
+    transport = asyncio.run(
+        run_request(
+            b"POST /chunked HTTP/1.1\r\nTransfer-Encoding: gzip, Chunked\r\n\r\n"
+            b"0\r\n\r\n"
+        )
+    )
+    assert transport.written[0].endswith(b"\r\n\r\n/chunked")
+
+
+def test_invalid_content_length():
+    """Ensure a content-length that is not only ASCII digits is rejected."""
+
+    async def run_request(content_length):
+        protocol = HTTPWSProtocol(PlainTextApp)
+        protocol.connection_made(MockTransport())
+        feed(
+            protocol,
+            b"POST / HTTP/1.1\r\nContent-Length:%s\r\n\r\nbody" % content_length,
+        )
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return protocol.transport
+
+    for content_length in (b" -5", b" +4", b"  4", b" 4 ", b" \xd9\xa4", b""):
+        transport = asyncio.run(run_request(content_length))
+        assert transport.written[0].startswith(b"HTTP/1.1 400 ")
+        assert transport.closed
+
+    transport = asyncio.run(run_request(b" 4"))
+    assert transport.written[0].endswith(b"content-length: 1\r\n\r\n/")
+
+
+def test_server_metrics():
+    """
+    Ensure the connection counters and latency histograms are updated, and served in
+    the Prometheus text format by the metrics listener.
+    """
+
+    async def run_requests(metrics):
+        protocol = HTTPWSProtocol(PlainTextApp, metrics=metrics)
+        protocol.connection_made(MockTransport())
+        for path in (b"/first", b"/second"):
+            feed(protocol, b"GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % path)
+            for _ in range(3):
+                await asyncio.sleep(0)
+        protocol.connection_lost(None)
+
+        protocol = HTTPWSProtocol(PlainTextApp, metrics=metrics)
+        protocol.connection_made(MockTransport())
+        feed(protocol, b"POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n")
+        return protocol.transport.written
+
+    metrics = ServerMetrics()
+    written = asyncio.run(run_requests(metrics))
+    assert written[0].startswith(b"HTTP/1.1 400 ")
+    assert metrics.connections == 2
+    assert metrics.connections_closed == 1
+    assert metrics.requests == 3
+    assert metrics.parse_errors == 1
+    assert metrics.bytes_sent > 0
+    assert sum(metrics.header_parse.counts) == 3
+    assert sum(metrics.app_time.counts) == 2
+
+    samples = {}
+    metrics.get_samples(samples)
+    text = render_metrics(samples).decode()
+    assert "# TYPE aiobufpro_app_seconds histogram\n" in text
+    assert 'aiobufpro_requests_total{protocol="http/1.1"} 3\n' in text
+    assert "aiobufpro_connections_active 1\n" in text
+    assert 'aiobufpro_app_seconds_bucket{le="+Inf"} 2\n' in text
+
+    transport = MockTransport()
+    admin = MetricsProtocol(lambda: samples)
+    admin.connection_made(transport)
+    admin.data_received(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    assert transport.written[0].startswith(b"HTTP/1.1 200 OK\r\n")
+    assert transport.written[0].endswith(text.encode())
+    assert transport.closed
+
+
+class BlockingApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        time.sleep(0.02)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+
+def test_slow_callbacks_and_profiling(caplog):
+    """
+    Ensure callbacks over the slow callback duration are logged with their request,
+    and that an event loop profile is written once its duration has elapsed.
+    """
+
+    async def run_requests(directory):
+        loop = asyncio.get_running_loop()
+        monitor = SlowCallbackMonitor(0.01)
+        monitor.install(loop)
+        profiler = LoopProfiler(0.05, directory)
+        profiler.start()
+        protocol = HTTPWSProtocol(BlockingApp)
+        protocol.connection_made(MockTransport())
+        feed(protocol, b"GET /blocking HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await asyncio.sleep(0.1)
+        assert asyncio.events.Handle._run is not HANDLE_RUN
+        monitor.uninstall(loop)
+        # The original method is restored once the last monitor is uninstalled.
+        assert asyncio.events.Handle._run is HANDLE_RUN
+        return monitor
+
+    with tempfile.TemporaryDirectory() as directory:
+        with caplog.at_level(logging.WARNING):
+            monitor = asyncio.run(run_requests(directory))
+        profiles = os.listdir(directory)
+        assert len(profiles) == 1
+        stats = pstats.Stats(os.path.join(directory, profiles[0]))
+        assert any(name == "sleep" for _, _, name in stats.stats)
+
+    assert monitor.slow_callbacks == 1
+    assert "in the application for GET /blocking from None" in caplog.text
+
+
+def test_load_shedding():
+    """
+    Ensure load is shed once the event loop lag is over the threshold, rejecting new
+    requests, closing idle keep-alive connections and pausing the listener, and that
+    the server recovers once the lag falls below the recovery threshold.
+    """
+
+    async def run_requests():
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(asyncio.Protocol, "127.0.0.1", 0)
+        assert can_pause_serving(server)
+        monitor = LoopLagMonitor(0.01, interval=0.005, actions=frozenset(ShedAction))
+        monitor.servers.append(server)
+        monitor.start()
+
+        idle = HTTPWSProtocol(PlainTextApp, overload=monitor)
+        idle.connection_made(MockTransport())
+        feed(idle, b"GET /idle HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await asyncio.sleep(0.01)
+        assert idle.state is HTTPWSProtocolState.REQUEST
+
+        # Block the event loop so the next sample is late.
+        time.sleep(0.03)
+        await asyncio.sleep(0.001)
+        shedding = monitor.shedding
+        serving = server.is_serving()
+
+        rejected = HTTPWSProtocol(PlainTextApp, overload=monitor)
+        rejected.connection_made(MockTransport())
+        feed(rejected, b"GET /rejected HTTP/1.1\r\nHost: localhost\r\n\r\n")
+
+        await asyncio.sleep(0.2)
+        accepted = HTTPWSProtocol(PlainTextApp, overload=monitor)
+        accepted.connection_made(MockTransport())
+        feed(accepted, b"GET /accepted HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await asyncio.sleep(0.01)
+        recovered = server.is_serving()
+        monitor.stop()
+        server.close()
+        return monitor, shedding, serving, recovered, idle, rejected, accepted
+
+    monitor, shedding, serving, recovered, idle, rejected, accepted = asyncio.run(
+        run_requests()
+    )
+    assert shedding and not serving
+    assert idle.transport.closed
+    assert rejected.transport.written[0].startswith(b"HTTP/1.1 503 ")
+    assert b"retry-after: 1\r\n" in rejected.transport.written[0]
+    assert rejected.transport.closed
+    assert accepted.transport.written[-1].endswith(b"/accepted")
+    assert not monitor.shedding and recovered
+    assert monitor.max_lag >= 0.02
+    assert monitor.stats()["shed_requests"] == 1
+    assert monitor.shed_periods == 1
+    assert monitor.closed_idle == 1
+
+
+def test_traffic_capture_and_replay():
+    """
+    Ensure the reads of a sample of the connections are captured with their
+    boundaries until the size cap, and replaying the capture in-process feeds the same
+    reads to the protocol and produces the same responses.
+    """
+    reads = [
+        b"GET /first HTTP/1.1\r\nHo",
+        b"st: localhost\r\n\r\nPOST /second HTTP/1.1\r\nContent-Length: 4\r\n\r\nbo",
+        b"dy",
+    ]
+
+    async def run_requests(capture):
+        protocol = HTTPWSProtocol(PlainTextApp, capture=capture)
+        protocol.connection_made(MockTransport())
+        for data in reads:
+            feed(protocol, data)
+            for _ in range(3):
+                await asyncio.sleep(0)
+        protocol.connection_lost(None)
+        return protocol.transport.written
+
+    with tempfile.TemporaryDirectory() as capture_dir:
+        path = os.path.join(capture_dir, "capture.bin")
+        capture = TrafficCapture(path)
+        written = asyncio.run(run_requests(capture))
+        capture.close()
+        assert [record.kind for record in read_capture(path)] == [
+            RecordKind.OPEN,
+            RecordKind.DATA,
+            RecordKind.DATA,
+            RecordKind.DATA,
+            RecordKind.CLOSE,
+        ]
+        assert [record.data for record in read_capture(path)][1:-1] == reads
+
+        unsampled = TrafficCapture(path + ".unsampled", sample_rate=0.0)
+        asyncio.run(run_requests(unsampled))
+        unsampled.close()
+        assert unsampled.connections == 0
+        assert list(read_capture(path + ".unsampled")) == []
+
+        capped = TrafficCapture(path + ".capped", max_bytes=100)
+        asyncio.run(run_requests(capped))
+        capped.close()
+        assert capped.full
+        assert [record.kind for record in read_capture(path + ".capped")] == [
+            RecordKind.OPEN,
+            RecordKind.DATA,
+        ]
+
+        options = argparse.Namespace(
+            speed="max", task_mode="task", timeout=1.0, socket=False
+        )
+        replayer = Replayer(filter_records(read_capture(path)), options)
+        replayer.app = PlainTextApp
+        result = asyncio.run(replayer.run())
+
+    assert result["reads"] == 3
+    assert result["bytes_received"] == sum(len(data) for data in reads)
+    assert result["bytes_written"] == sum(len(data) for data in written)
+    assert result["skipped_reads"] == 0
+
+
+def test_access_log():
+    """
+    Ensure completed requests are logged by the listener thread in the configured
+    format, and that no requests are logged with a sample rate of zero.
+    """
+
+    async def run_requests(access_log):
+        protocol = HTTPWSProtocol(PlainTextApp, access_log=access_log)
+        protocol.connection_made(MockTransport())
+        protocol.client = ("127.0.0.1", 50000)
+        protocol.scope_template["client"] = protocol.client
+        for path in (b"/first?page=2", b"/second"):
+            feed(
+                protocol,
+                b"GET %s HTTP/1.1\r\nUser-Agent: test\r\n\r\n" % path,
+            )
+            for _ in range(3):
+                await asyncio.sleep(0)
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        path = os.path.join(log_dir, "access.log")
+        access_log = AccessLog(path=path)
+        access_log.start()
+        asyncio.run(run_requests(access_log))
+        access_log.stop()
+        with open(path) as log_file:
+            lines = log_file.read().splitlines()
+
+        json_path = os.path.join(log_dir, "access.json")
+        json_log = AccessLog(log_format=AccessLogFormat.JSON, path=json_path)
+        json_log.start()
+        asyncio.run(run_requests(json_log))
+        json_log.stop()
+        with open(json_path) as log_file:
+            records = [json.loads(line) for line in log_file]
+
+        sampled = AccessLog(sample_rate=0.0, path=os.path.join(log_dir, "sampled"))
+        sampled.start()
+        asyncio.run(run_requests(sampled))
+        sampled.stop()
+
+    assert len(lines) == 2
+    assert lines[0].startswith("127.0.0.1 - - [")
+    assert lines[0].endswith('] "GET /first?page=2 HTTP/1.1" 200 6 "-" "test"')
+    assert lines[1].endswith('] "GET /second HTTP/1.1" 200 7 "-" "test"')
+    assert [record["target"] for record in records] == ["/first?page=2", "/second"]
+    assert records[0]["client"] == "127.0.0.1:50000"
+    assert records[0]["status"] == 200
+    assert records[0]["user_agent"] == "test"
+    assert records[0]["duration_ms"] >= 0
+    assert sampled.logged == 0
+
+
+class LifespanApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        if self.scope["type"] == "lifespan":
+            await receive()
+            self.scope["state"]["greeting"] = "hello"
+            await send({"type": "lifespan.startup.complete"})
+            await receive()
+            self.scope["state"]["stopped"] = True
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+        await receive()
+        await asyncio.sleep(0.05)
+        body = self.scope["state"]["greeting"].encode()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body})
+
+
+class ClosingTransport(MockTransport):
+    def __init__(self, protocol):
+        super().__init__()
+        self.protocol = protocol
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            asyncio.get_running_loop().call_soon(self.protocol.connection_lost, None)
+
+    def abort(self):
+        self.close()
+
+
+def test_lifespan_and_graceful_shutdown():
+    """
+    Ensure the lifespan state is passed to the requests, that applications without
+    lifespan support are detected, and that draining closes the idle connections once
+    the requests in progress have been answered.
+    """
+
+    async def run_lifespan():
+        lifespan = Lifespan(LifespanApp)
+        await lifespan.startup()
+        shutdown = GracefulShutdown(timeout=1.0)
+        protocols = []
+        for _ in range(2):
+            protocol = HTTPWSProtocol(
+                LifespanApp,
+                connections=shutdown.connections,
+                lifespan_state=lifespan.state,
+            )
+            protocol.connection_made(ClosingTransport(protocol))
+            protocols.append(protocol)
+        busy, idle = protocols
+        feed(busy, b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        await asyncio.sleep(0)
+        shutdown.request()
+        await shutdown.wait()
+        aborted = await shutdown.drain([])
+        await lifespan.shutdown()
+        return lifespan, busy, idle, aborted
+
+    lifespan, busy, idle, aborted = asyncio.run(run_lifespan())
+    assert lifespan.supported
+    assert lifespan.state == {"greeting": "hello", "stopped": True}
+    assert aborted == 0
+    assert idle.transport.written == []
+    assert idle.transport.closed
+    assert busy.transport.written[0].endswith(b"\r\n\r\nhello")
+    assert busy.transport.closed
+
+    async def run_unsupported(mode):
+        lifespan = Lifespan(PlainTextApp, mode=mode)
+        await lifespan.startup()
+        await lifespan.shutdown()
+        return lifespan
+
+    assert not asyncio.run(run_unsupported(LifespanMode.AUTO)).supported
+    try:
+        asyncio.run(run_unsupported(LifespanMode.ON))
+    except LifespanError:
+        pass
+    else:
+        raise AssertionError("The startup of an unsupported application succeeded")
+
+
+wsgi_release = threading.Event()
+
+
+def wsgi_app(environ, start_response):
+    if environ["PATH_INFO"] == "/wait":
+        environ["wsgi.input"].read()
+        wsgi_release.wait(5)
+    body = environ["wsgi.input"].read()
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [environ["QUERY_STRING"].encode(), b":", body]
+
+
+def test_wsgi_app():
+    """
+    Ensure WSGI applications are run in the thread pool with the request body streamed
+    to `wsgi.input`, and that requests are answered with a 503 response while the pool
+    is saturated.
+    """
+
+    async def wait_for_response(transport):
+        for _ in range(200):
+            if transport.written:
+                return
+            await asyncio.sleep(0.01)
+
+    async def run_requests():
+        app = WSGIApp(wsgi_app, threads=1, queue_depth=0)
+        protocol = HTTPWSProtocol(app)
+        transport = MockTransport()
+        protocol.connection_made(transport)
+        feed(
+            protocol,
+            b"POST /?page=2 HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"5\r\nhello\r\n",
+        )
+        await asyncio.sleep(0.05)
+        feed(protocol, b"6\r\n world\r\n0\r\n\r\n")
+        await wait_for_response(transport)
+
+        waiting = HTTPWSProtocol(app)
+        waiting.connection_made(MockTransport())
+        feed(waiting, b"GET /wait HTTP/1.1\r\n\r\n")
+        await asyncio.sleep(0.05)
+        rejected = HTTPWSProtocol(app)
+        rejected.connection_made(MockTransport())
+        feed(rejected, b"GET / HTTP/1.1\r\n\r\n")
+        await wait_for_response(rejected.transport)
+        wsgi_release.set()
+        await wait_for_response(waiting.transport)
+        app.executor.shutdown()
+        return app, transport, waiting.transport, rejected.transport
+
+    app, transport, waiting, rejected = asyncio.run(run_requests())
+    assert transport.written[0].startswith(b"HTTP/1.1 200 OK\r\n")
+    assert transport.written[0].endswith(
+        b"content-length: 18\r\n\r\npage=2:hello world"
+    )
+    assert rejected.written[0].startswith(b"HTTP/1.1 503 Service Unavailable\r\n")
+    assert waiting.written[0].endswith(b"\r\n\r\n:")
+    assert app.rejected == 1
+    assert app.pending == 0
+
+
+def failing_wsgi_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    yield b"first"
+    yield b"second"
+    raise RuntimeError("The response failed")
+
+
+def test_wsgi_app_failing_response():
+    """
+    Ensure the connection is closed when a WSGI response iterable raises after the
+    response has started, rather than leaving the response incomplete.
+    """
+
+    async def run_request():
+        app = WSGIApp(failing_wsgi_app, threads=1)
+        protocol = HTTPWSProtocol(app)
+        protocol.connection_made(MockTransport())
+        feed(protocol, b"GET / HTTP/1.1\r\n\r\n")
+        for _ in range(200):
+            if protocol.transport.closed:
+                break
+            await asyncio.sleep(0.01)
+        app.executor.shutdown()
+        return app, protocol.transport
+
+    app, transport = asyncio.run(run_request())
+    assert transport.closed
+    response = b"".join(transport.written)
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert b"transfer-encoding: chunked\r\n\r\n5\r\nfirst\r\n" in response
+    assert not response.endswith(b"0\r\n\r\n")
+    assert app.pending == 0
+
+
+class EarlyHintApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        if "http.response.early_hint" in self.scope["extensions"]:
+            await send(
+                {
+                    "type": "http.response.early_hint",
+                    "links": [b"</style.css>; rel=preload; as=style"],
+                }
+            )
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"page"})
+
+
+def test_early_hints_and_server_timing():
+    """
+    Ensure early hints are written as 103 responses before the final response, except
+    to HTTP/1.0 clients, and that the Server-Timing header is added when enabled.
+    """
+
+    async def run_requests(server_timing):
+        protocol = HTTPWSProtocol(EarlyHintApp, server_timing=server_timing)
+        transport = MockTransport()
+        protocol.connection_made(transport)
+        for http_version in (b"1.1", b"1.0"):
+            feed(protocol, b"GET / HTTP/%s\r\nHost: localhost\r\n\r\n" % http_version)
+            for _ in range(3):
+                await asyncio.sleep(0)
+        return transport.written
+
+    written = asyncio.run(run_requests(True))
+    assert written[0] == (
+        b"HTTP/1.1 103 Early Hints\r\n"
+        b"link: </style.css>; rel=preload; as=style\r\n\r\n"
+    )
+    assert written[1].startswith(b"HTTP/1.1 200 OK\r\n")
+    timing = [
+        line
+        for line in written[1].split(b"\r\n")
+        if line.startswith(b"server-timing: ")
+    ]
+    assert len(timing) == 1
+    assert [metric.split(b";")[0] for metric in timing[0][15:].split(b", ")] == [
+        b"parse",
+        b"queue",
+        b"app",
+    ]
+    # The HTTP/1.0 request is answered without the early hint.
+    assert len(written) == 3
+    assert written[2].startswith(b"HTTP/1.1 200 OK\r\n")
+
+    written = asyncio.run(run_requests(False))
+    assert written[0].startswith(b"HTTP/1.1 103 Early Hints\r\n")
+    assert b"server-timing" not in written[1]
@@ -0,0 +1,369 @@
+import asyncio
+import base64
+import struct
+
+from aiobufpro.parsers.hpack import HPACKDecoder, HPACKEncoder, huffman_encode
+from aiobufpro.parsers.http2 import (
+    FRAME_HEADER,
+    H2_PREFACE,
+    FrameFlag,
+    FrameType,
+    HTTP2Settings,
+    SettingCode,
+    build_frame,
+    parse_settings,
+)
+from aiobufpro.protocol import HTTPWSProtocol
+
+
+class MockTransport:
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return None
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+
+class EchoApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message["body"])
+            more_body = message.get("more_body", False)
+        content = b"%s %s %s" % (
+            self.scope["method"].encode(),
+            self.scope["path"].encode(),
+            b"".join(body),
+        )
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": content})
+
+
+def feed(protocol, data):
+    buf = protocol.get_buffer(len(data))
+    buf[: len(data)] = data
+    protocol.buffer_updated(len(data))
+
+
+def parse_frames(data):
+    frames = []
+    while data:
+        length_high, length_low, frame_type, flags, stream_id = (
+            FRAME_HEADER.unpack_from(data)
+        )
+        length = (length_high << 16) | length_low
+        frames.append((frame_type, flags, stream_id, data[9 : 9 + length]))
+        data = data[9 + length :]
+    return frames
+
+
+def request_headers(encoder, stream_id, method, path, end_stream):
+    header_block = encoder.encode(
+        [
+            (b":method", method),
+            (b":scheme", b"http"),
+            (b":path", path),
+            (b":authority", b"localhost"),
+        ]
+    )
+    flags = FrameFlag.END_HEADERS
+    if end_stream:
+        flags |= FrameFlag.END_STREAM
+    return build_frame(FrameType.HEADERS, flags, stream_id, header_block)
+
+
+def test_hpack_decode_request_examples():
+    """Ensure the RFC 7541 C.4 request examples decode and update the dynamic table."""
+    decoder = HPACKDecoder()
+    assert decoder.decode(bytes.fromhex("828684418cf1e3c2e5f23a6ba0ab90f4ff")) == [
+        (b":method", b"GET"),
+        (b":scheme", b"http"),
+        (b":path", b"/"),
+        (b":authority", b"www.example.com"),
+    ]
+    assert decoder.decode(bytes.fromhex("828684be5886a8eb10649cbf")) == [
+        (b":method", b"GET"),
+        (b":scheme", b"http"),
+        (b":path", b"/"),
+        (b":authority", b"www.example.com"),
+        (b"cache-control", b"no-cache"),
+    ]
+    assert huffman_encode(b"www.example.com") == bytes.fromhex(
+        "f1e3c2e5f23a6ba0ab90f4ff"
+    )
+
+
+def test_hpack_round_trip():
+    headers = [
+        (b":status", b"200"),
+        (b"content-type", b"text/plain"),
+        (b"x-custom", b"value " * 20),
+    ]
+    assert HPACKDecoder().decode(HPACKEncoder().encode(headers)) == headers
+
+
+def test_http2_streams():
+    """
+    Ensure the streams of a prior-knowledge HTTP/2 connection are run concurrently and
+    their responses are sent as HEADERS and DATA frames.
+    """
+
+    async def run_connection():
+        protocol = HTTPWSProtocol(EchoApp)
+        protocol.connection_made(MockTransport())
+        encoder = HPACKEncoder()
+        feed(protocol, H2_PREFACE + build_frame(FrameType.SETTINGS, 0, 0))
+        feed(
+            protocol,
+            request_headers(encoder, 1, b"POST", b"/upload?x=1", False)
+            + request_headers(encoder, 3, b"GET", b"/second", True)
+            + build_frame(FrameType.DATA, 0, 1, b"hello ")
+            + build_frame(FrameType.DATA, FrameFlag.END_STREAM, 1, b"world"),
+        )
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return protocol, parse_frames(b"".join(protocol.transport.written))
+
+    protocol, frames = asyncio.run(run_connection())
+    assert not protocol.transport.closed
+    assert not protocol.parser.streams
+
+    settings_frames = [frame for frame in frames if frame[0] == FrameType.SETTINGS]
+    assert settings_frames[0][1] == 0
+    server_settings = parse_settings(settings_frames[0][3])
+    assert server_settings[SettingCode.MAX_CONCURRENT_STREAMS] == 100
+    assert settings_frames[1][1] == FrameFlag.ACK
+
+    decoder = HPACKDecoder()
+    responses = {}
+    for frame_type, flags, stream_id, payload in frames:
+        if frame_type == FrameType.HEADERS:
+            headers = decoder.decode(payload)
+            assert headers[0] == (b":status", b"200")
+            responses[stream_id] = b""
+        elif frame_type == FrameType.DATA:
+            responses[stream_id] += payload
+            assert flags & FrameFlag.END_STREAM
+    assert responses == {1: b"POST /upload hello world", 3: b"GET /second "}
+
+
+def test_http2_flow_control_and_refused_streams():
+    """
+    Ensure response data waits for the client window and streams over the concurrency
+    limit are refused.
+    """
+
+    async def run_connection():
+        settings = HTTP2Settings(max_concurrent_streams=1)
+        protocol = HTTPWSProtocol(EchoApp, http2_settings=settings)
+        protocol.connection_made(MockTransport())
+        encoder = HPACKEncoder()
+        # A 4 byte initial stream window.
+        client_settings = struct.pack("!HL", SettingCode.INITIAL_WINDOW_SIZE, 4)
+        feed(
+            protocol,
+            H2_PREFACE + build_frame(FrameType.SETTINGS, 0, 0, client_settings),
+        )
+        feed(
+            protocol,
+            request_headers(encoder, 1, b"GET", b"/window", True)
+            + request_headers(encoder, 3, b"GET", b"/refused", True),
+        )
+        for _ in range(3):
+            await asyncio.sleep(0)
+        before = parse_frames(b"".join(protocol.transport.written))
+        protocol.transport.written.clear()
+        feed(
+            protocol, build_frame(FrameType.WINDOW_UPDATE, 0, 1, struct.pack("!L", 100))
+        )
+        for _ in range(3):
+            await asyncio.sleep(0)
+        after = parse_frames(b"".join(protocol.transport.written))
+        return before, after
+
+    before, after = asyncio.run(run_connection())
+    reset = [frame for frame in before if frame[0] == FrameType.RST_STREAM]
+    assert reset == [(FrameType.RST_STREAM, 0, 3, struct.pack("!L", 7))]
+    data = [frame for frame in before if frame[0] == FrameType.DATA]
+    assert data == [(FrameType.DATA, 0, 1, b"GET ")]
+    assert after == [(FrameType.DATA, FrameFlag.END_STREAM, 1, b"/window ")]
+
+
+class SlowReaderApp:
+    def __init__(self, scope, released):
+        self.scope = scope
+        self.released = released
+
+    async def __call__(self, receive, send):
+        await self.released.wait()
+        await EchoApp(self.scope)(receive, send)
+
+
+def test_http2_receive_flow_control():
+    """
+    Ensure request body data is only acknowledged once the application receives it,
+    and that data exceeding the stream or connection window is rejected.
+    """
+
+    def window_updates(transport):
+        frames = parse_frames(b"".join(transport.written))
+        transport.written.clear()
+        return [
+            (stream_id, struct.unpack("!L", payload)[0])
+            for frame_type, _, stream_id, payload in frames
+            if frame_type == FrameType.WINDOW_UPDATE
+        ]
+
+    async def run_connection():
+        released = asyncio.Event()
+        settings = HTTP2Settings(initial_window_size=100)
+        protocol = HTTPWSProtocol(
+            lambda scope: SlowReaderApp(scope, released), http2_settings=settings
+        )
+        protocol.connection_made(MockTransport())
+        encoder = HPACKEncoder()
+        feed(
+            protocol,
+            H2_PREFACE
+            + build_frame(FrameType.SETTINGS, 0, 0)
+            + build_frame(FrameType.SETTINGS, FrameFlag.ACK, 0),
+        )
+        protocol.transport.written.clear()
+        feed(
+            protocol,
+            request_headers(encoder, 1, b"POST", b"/", False)
+            + build_frame(FrameType.DATA, 0, 1, b"x" * 60),
+        )
+        await asyncio.sleep(0)
+        held = window_updates(protocol.transport)
+        released.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        received = window_updates(protocol.transport)
+
+        # The stream window is the 100 bytes of the settings once acknowledged.
+        feed(
+            protocol,
+            request_headers(encoder, 3, b"POST", b"/", False)
+            + build_frame(FrameType.DATA, 0, 3, b"x" * 101),
+        )
+        frames = parse_frames(b"".join(protocol.transport.written))
+        return held, received, frames
+
+    held, received, frames = asyncio.run(run_connection())
+    assert held == []
+    assert received == [(0, 60), (1, 60)]
+    assert (FrameType.RST_STREAM, 0, 3, struct.pack("!L", 3)) in frames
+
+    async def run_window_exceeded():
+        released = asyncio.Event()
+        protocol = HTTPWSProtocol(lambda scope: SlowReaderApp(scope, released))
+        protocol.connection_made(MockTransport())
+        encoder = HPACKEncoder()
+        feed(protocol, H2_PREFACE + build_frame(FrameType.SETTINGS, 0, 0))
+        # Each stream is within its window, the connection window of 65535 bytes is
+        # exceeded by the fourth frame.
+        for stream_id in (1, 3, 5, 7):
+            feed(
+                protocol,
+                request_headers(encoder, stream_id, b"POST", b"/", False)
+                + build_frame(FrameType.DATA, 0, stream_id, b"x" * 16384),
+            )
+        return protocol, parse_frames(b"".join(protocol.transport.written))
+
+    protocol, frames = asyncio.run(run_window_exceeded())
+    assert protocol.transport.closed
+    assert frames[-1] == (FrameType.GOAWAY, 0, 0, struct.pack("!LL", 7, 3))
+
+
+def test_h2c_upgrade():
+    """
+    Ensure an HTTP/1.1 request with `Upgrade: h2c` is answered on stream 1 after the
+    101 response.
+    """
+
+    async def run_connection():
+        protocol = HTTPWSProtocol(EchoApp)
+        protocol.connection_made(MockTransport())
+        settings = base64.urlsafe_b64encode(HTTP2Settings().get_payload()).rstrip(b"=")
+        feed(
+            protocol,
+            b"GET /upgraded HTTP/1.1\r\nHost: localhost\r\n"
+            b"Connection: Upgrade, HTTP2-Settings\r\nUpgrade: h2c\r\n"
+            b"HTTP2-Settings: %s\r\n\r\n" % settings,
+        )
+        feed(protocol, H2_PREFACE + build_frame(FrameType.SETTINGS, 0, 0))
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return protocol.transport.written
+
+    written = asyncio.run(run_connection())
+    switching = b"HTTP/1.1 101 Switching Protocols\r\n"
+    assert written[0].startswith(switching)
+    frames = parse_frames(b"".join(written[1:]))
+    data = [frame for frame in frames if frame[0] == FrameType.DATA]
+    assert data == [(FrameType.DATA, FrameFlag.END_STREAM, 1, b"GET /upgraded ")]
+
+
+class EarlyHintApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        await send(
+            {
+                "type": "http.response.early_hint",
+                "links": [b"</app.js>; rel=preload; as=script"],
+            }
+        )
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"page"})
+
+
+def test_http2_early_hints_and_server_timing():
+    """
+    Ensure early hints are sent as an informational HEADERS frame on the stream before
+    the response, and that the response includes the Server-Timing header.
+    """
+
+    async def run_connection():
+        protocol = HTTPWSProtocol(EarlyHintApp, server_timing=True)
+        protocol.connection_made(MockTransport())
+        encoder = HPACKEncoder()
+        feed(protocol, H2_PREFACE + build_frame(FrameType.SETTINGS, 0, 0))
+        feed(protocol, request_headers(encoder, 1, b"GET", b"/", True))
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return parse_frames(b"".join(protocol.transport.written))
+
+    frames = asyncio.run(run_connection())
+    decoder = HPACKDecoder()
+    headers_frames = [
+        (flags, dict(decoder.decode(payload)))
+        for frame_type, flags, stream_id, payload in frames
+        if frame_type == FrameType.HEADERS
+    ]
+    assert len(headers_frames) == 2
+    flags, hint = headers_frames[0]
+    assert hint[b":status"] == b"103"
+    assert hint[b"link"] == b"</app.js>; rel=preload; as=script"
+    assert not flags & FrameFlag.END_STREAM
+    response = headers_frames[1][1]
+    assert response[b":status"] == b"200"
+    assert response[b"server-timing"].startswith(b"parse;dur=")
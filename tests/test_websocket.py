@@ -1,4 +1,21 @@
+import asyncio
+import struct
+import tempfile
+import threading
+
+from aiobufpro.broadcast import BroadcastHub, BroadcastPolicy
+from aiobufpro.bus import ThreadBus, ThreadBusRegistry, UnixBus
+from aiobufpro.heartbeat import PING_FRAME, HeartbeatScheduler
+from aiobufpro.outbound import OutboundQueue, SlowConsumerPolicy
 from aiobufpro.parsers.http import HTTPParser
+from aiobufpro.parsers.websocket import (
+    WebSocketError,
+    WebSocketOpcode,
+    WebSocketParser,
+    build_frame,
+    get_frame_size,
+)
+from aiobufpro.protocol import HTTPWSProtocol
 from aiobufpro.utils import get_websocket_accept_key
 
 
@@ -22,7 +39,7 @@ def test_parse_upgrade_header():
     parser = HTTPParser()
     parser.parse_headers(UPGRADE_REQUEST_HEADERS)
     assert parser.should_upgrade
-    assert parser.upgrade_header == (b"Upgrade", b"websocket")
+    assert parser.upgrade_header == (b"upgrade", b"websocket")
 
 
 def test_parse_invalid_upgrade_header():
@@ -37,7 +54,378 @@ def test_get_websocket_accept_key():
     """Ensure the generated websocket accept key is the correct value."""
     parser = HTTPParser()
     parser.parse_headers(UPGRADE_REQUEST_HEADERS)
-    for header, header_value in parser.headers:
-        if header == b"Sec-WebSocket-Key":
-            accept_key = get_websocket_accept_key(header_value)
+    accept_key = get_websocket_accept_key(parser.sec_websocket_key)
     assert accept_key == b"J9R6HjgRj5VpgXEFRYnNh9igw2o="
+
+
+class MockTransport:
+    def __init__(self):
+        self.written = []
+
+    def get_extra_info(self, name):
+        return None
+
+    def write(self, data):
+        self.written.append(data)
+
+    def writelines(self, data):
+        self.written.extend(data)
+
+    def close(self):
+        pass
+
+
+class MockProtocol:
+    def __init__(self):
+        self.transport = MockTransport()
+        self.groups = set()
+        self.outbound = OutboundQueue(self)
+        self.write_paused = False
+        self.client = None
+        self.asgi_connection = MockASGIConnection()
+
+    def close(self):
+        pass
+
+
+def test_build_frame_extended_payload_length():
+    """Ensure payloads larger than 125 bytes use the extended payload length."""
+    assert build_frame(b"hi", opcode=WebSocketOpcode.TEXT) == b"\x81\x02hi"
+    frame = build_frame(b"x" * 300, opcode=WebSocketOpcode.BINARY)
+    assert frame[:4] == b"\x82\x7e\x01\x2c"
+    frame = build_frame(b"x" * 70000, opcode=WebSocketOpcode.BINARY)
+    assert frame[:10] == b"\x82\x7f\x00\x00\x00\x00\x00\x01\x11\x70"
+
+
+class MockASGIConnection:
+    def __init__(self):
+        self.messages = []
+
+    def put_message(self, message):
+        self.messages.append(message)
+
+    def disconnect(self, code):
+        self.messages.append({"type": "websocket.disconnect", "code": code})
+
+
+def test_parse_frame_extended_payload_length():
+    """Ensure masked frames larger than 125 bytes are read to the extended length."""
+    protocol = MockProtocol()
+    protocol.asgi_connection = MockASGIConnection()
+    parser = WebSocketParser(protocol)
+    mask = b"\x01\x02\x03\x04"
+    payload = bytes(range(256)) * 2
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    frame = bytearray(b"\x82\xfe\x02\x00" + mask + masked)
+    asyncio.run(parser.parse_frame(frame))
+    assert protocol.asgi_connection.messages == [
+        {"type": "websocket.receive", "bytes": payload}
+    ]
+
+
+class EchoApp:
+    def __init__(self, scope):
+        self.scope = scope
+
+    async def __call__(self, receive, send):
+        await receive()
+        await send({"type": "websocket.accept"})
+        while True:
+            message = await receive()
+            if message["type"] != "websocket.receive":
+                return
+            await send({"type": "websocket.send", "bytes": message["bytes"]})
+
+
+def feed(protocol, data):
+    buf = protocol.get_buffer(len(data))
+    buf[: len(data)] = data
+    protocol.buffer_updated(len(data))
+
+
+def mask_frame(payload):
+    mask = b"\x01\x02\x03\x04"
+    frame = build_frame(payload, opcode=WebSocketOpcode.BINARY)
+    head = bytearray(frame[: len(frame) - len(payload)])
+    head[1] |= 0x80
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return bytes(head) + mask + masked
+
+
+def test_frames_split_across_reads():
+    """
+    Ensure frames are parsed once complete, when a frame is split across reads and
+    when several frames are received at once.
+    """
+    payloads = [b"x" * 300, b"first", b"second"]
+    data = b"".join(mask_frame(payload) for payload in payloads)
+    assert get_frame_size(data) == 4 + 4 + 300
+    assert get_frame_size(data[:3]) is None
+
+    async def run_frames():
+        protocol = HTTPWSProtocol(EchoApp)
+        protocol.connection_made(MockTransport())
+        feed(protocol, UPGRADE_REQUEST_HEADERS)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        feed(protocol, data[:100])
+        feed(protocol, data[100:])
+        for _ in range(10):
+            await asyncio.sleep(0)
+        return protocol.transport.written
+
+    written = asyncio.run(run_frames())
+    assert written[0].startswith(b"HTTP/1.1 101 ")
+    assert b"".join(written[1:]) == b"".join(
+        build_frame(payload, opcode=WebSocketOpcode.BINARY) for payload in payloads
+    )
+
+
+def test_connection_lost_disconnects_app():
+    """
+    Ensure an application is sent `websocket.disconnect` when the peer drops the
+    connection, and only once when the server closed the connection first.
+    """
+
+    async def run_connection(close_first):
+        received = []
+
+        class DisconnectApp(EchoApp):
+            async def __call__(self, receive, send):
+                await receive()
+                await send({"type": "websocket.accept"})
+                received.append(await receive())
+
+        protocol = HTTPWSProtocol(DisconnectApp)
+        protocol.connection_made(MockTransport())
+        feed(protocol, UPGRADE_REQUEST_HEADERS)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        if close_first:
+            protocol.shutdown()
+        protocol.connection_lost(None)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return received, protocol.asgi_connection.app_queue
+
+    received, app_queue = asyncio.run(run_connection(False))
+    assert received == [{"type": "websocket.disconnect", "code": 1006}]
+
+    received, app_queue = asyncio.run(run_connection(True))
+    assert received == [{"type": "websocket.disconnect", "code": 1001}]
+    assert app_queue.empty()
+
+
+class FailingFrameParser(WebSocketParser):
+    async def get_frame_content(self, payload_data, *, opcode):
+        raise WebSocketError(1011, "Cannot frame the message")
+
+
+def test_send_error_closes_with_internal_error():
+    """
+    Ensure a message that cannot be framed closes the connection with a 1011 close
+    frame instead of writing a frame.
+    """
+
+    async def run_frames():
+        protocol = HTTPWSProtocol(EchoApp)
+        protocol.connection_made(MockTransport())
+        feed(protocol, UPGRADE_REQUEST_HEADERS)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        protocol.parser = FailingFrameParser(protocol=protocol)
+        feed(protocol, mask_frame(b"message"))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        return protocol.transport
+
+    transport = asyncio.run(run_frames())
+    assert transport.written[1:] == [
+        build_frame(struct.pack("!H", 1011), opcode=WebSocketOpcode.CLOSE)
+    ]
+
+
+def test_broadcast_publish_frames_once():
+    """Ensure a published message is written as the same bytes to every member."""
+    hub = BroadcastHub()
+    members = [MockProtocol() for _ in range(3)]
+    for member in members:
+        hub.join("chat", member)
+
+    assert hub.publish("chat", "hello") == 3
+    frames = [member.transport.written[0] for member in members]
+    assert frames[0] == b"\x81\x05hello"
+    assert all(frame is frames[0] for frame in frames)
+
+    hub.leave_all(members[0])
+    assert hub.publish("chat", "hello") == 2
+    assert not members[0].groups
+
+
+def test_broadcast_slow_member_policy():
+    """Ensure paused members are handled according to the hub policy."""
+    for policy in BroadcastPolicy:
+        hub = BroadcastHub(policy=policy)
+        member = MockProtocol()
+        member.write_paused = True
+        hub.join("chat", member)
+        assert hub.publish("chat", b"data") == 0
+        if policy is BroadcastPolicy.SKIP:
+            assert hub.skipped == 1
+        elif policy is BroadcastPolicy.QUEUE:
+            assert list(member.outbound.frames) == [b"\x82\x04data"]
+        else:
+            assert hub.dropped == 1
+            assert "chat" not in hub.groups
+            assert member.asgi_connection.messages == [
+                {"type": "websocket.disconnect", "code": 1006}
+            ]
+
+
+def test_bus_forwards_to_subscribed_workers():
+    """Ensure frames are only forwarded to workers with members of the group."""
+
+    async def run_workers(bus_dir):
+        hubs = [BroadcastHub() for _ in range(3)]
+        buses = [
+            UnixBus(hub, worker_id, 3, bus_dir) for worker_id, hub in enumerate(hubs)
+        ]
+        members = [MockProtocol() for _ in range(3)]
+        hubs[0].join("chat", members[0])
+        await asyncio.gather(*[bus.start() for bus in buses])
+        hubs[1].join("chat", members[1])
+        await asyncio.sleep(0.05)
+
+        assert hubs[0].publish("chat", "hello") == 1
+        await asyncio.sleep(0.05)
+
+        for bus in buses:
+            bus.close()
+        return buses, members
+
+    with tempfile.TemporaryDirectory() as bus_dir:
+        buses, members = asyncio.run(run_workers(bus_dir))
+
+    assert buses[0].forwarded == 1
+    assert buses[1].received == 1
+    assert buses[2].received == 0
+    assert members[1].transport.written == [b"\x81\x05hello"]
+    assert members[2].transport.written == []
+
+
+def test_thread_bus_delivers_on_subscribed_loops():
+    """
+    Ensure frames published on one event loop are delivered by the event loops of the
+    other threads with members of the group.
+    """
+    registry = ThreadBusRegistry()
+    ready = threading.Barrier(3)
+    published = threading.Event()
+    members = [MockProtocol() for _ in range(3)]
+    buses = [None] * 3
+
+    async def run_loop(index):
+        hub = BroadcastHub()
+        buses[index] = ThreadBus(hub, registry)
+        if index < 2:
+            hub.join("chat", members[index])
+        ready.wait()
+        if index == 0:
+            assert hub.publish("chat", "hello") == 1
+            published.set()
+        else:
+            published.wait()
+        await asyncio.sleep(0.05)
+
+    threads = [
+        threading.Thread(target=asyncio.run, args=(run_loop(index),))
+        for index in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert buses[0].forwarded == 1
+    assert buses[1].received == 1
+    assert buses[2].received == 0
+    assert members[0].transport.written == [b"\x81\x05hello"]
+    assert members[1].transport.written == [b"\x81\x05hello"]
+    assert members[2].transport.written == []
+
+
+def test_heartbeat_pings_and_reaps_in_batches():
+    """Ensure due connections are pinged together and unresponsive ones are closed."""
+
+    scheduler = HeartbeatScheduler(interval=0.2, timeout=0.05, tick=0.01)
+    members = [MockProtocol() for _ in range(3)]
+
+    async def run_heartbeat():
+        for member in members:
+            member.heartbeat_tick = None
+            member.asgi_connection = MockASGIConnection()
+            scheduler.register(member)
+        while scheduler.pings_sent < 3:
+            await asyncio.sleep(0.01)
+        scheduler.on_pong(members[0])
+        while scheduler.reaped < 2:
+            await asyncio.sleep(0.01)
+        scheduler.close()
+
+    asyncio.run(run_heartbeat())
+
+    assert all(member.transport.written[0] is PING_FRAME for member in members)
+    assert scheduler.pongs_received == 1
+    assert members[0].transport.written == [PING_FRAME]
+    assert members[1].transport.written[-1] == b"\x88\x02\x03\xe9"
+    assert members[1].asgi_connection.messages == [
+        {"type": "websocket.disconnect", "code": 1001}
+    ]
+
+
+def test_outbound_queue_coalesces_frames():
+    """Ensure frames queued in the same loop iteration are written together."""
+    member = MockProtocol()
+
+    async def send_frames():
+        for i in range(3):
+            await member.outbound.put(b"frame%d" % i)
+        assert member.transport.written == []
+        await asyncio.sleep(0)
+
+    asyncio.run(send_frames())
+    assert member.transport.written == [b"frame0", b"frame1", b"frame2"]
+    assert member.outbound.stats()["depth"] == 0
+
+
+def test_outbound_queue_slow_consumer_policy():
+    """Ensure frames over the limit are dropped or close the connection."""
+
+    member = MockProtocol()
+    member.write_paused = True
+    outbound = member.outbound = OutboundQueue(
+        member, limit=10, policy=SlowConsumerPolicy.DROP_OLDEST
+    )
+    for frame in (b"aaaa", b"bbbb", b"cccc"):
+        assert outbound.put_nowait(frame)
+    assert list(outbound.frames) == [b"bbbb", b"cccc"]
+    assert outbound.stats() == {
+        "depth": 2,
+        "queued_bytes": 8,
+        "dropped": 1,
+        "closed": 0,
+    }
+
+    member = MockProtocol()
+    member.write_paused = True
+    member.asgi_connection = MockASGIConnection()
+    outbound = member.outbound = OutboundQueue(
+        member, limit=10, policy=SlowConsumerPolicy.CLOSE
+    )
+    assert outbound.put_nowait(b"aaaaaaaa")
+    assert not outbound.put_nowait(b"bbbbbbbb")
+    assert outbound.closed == 1
+    assert member.transport.written == [b"\x88\x02\x03\xf0"]
+    assert member.asgi_connection.messages == [
+        {"type": "websocket.disconnect", "code": 1008}
+    ]